@@ -0,0 +1,57 @@
+"""Helpers shared by the benchmark scripts."""
+import os
+import sys
+import time
+import tracemalloc
+
+# Benchmarks run from a checkout, with the application modules one level up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(value):
+    value = value.strip().upper()
+    if value[-1] in UNITS:
+        return int(float(value[:-1]) * UNITS[value[-1]])
+    return int(value)
+
+
+def format_size(size):
+    for unit in ("G", "M", "K"):
+        if size >= UNITS[unit] and size % UNITS[unit] == 0:
+            return f"{size // UNITS[unit]}{unit}"
+    return str(size)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def sample_text(size):
+    """Log/markdown-like text of exactly size characters."""
+    line = "2024-05-01 12:00:00 INFO worker-3 processed batch 4711 in 12.5 ms # notes\n"
+    return (line * (size // len(line) + 1))[:size]
+
+
+def time_calls(fn, repeat):
+    """Calls fn repeat times and returns the latencies in seconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def peak_memory(fn):
+    """Peak Python heap growth (bytes) while fn runs."""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn()
+        return tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
@@ -0,0 +1,94 @@
+"""
+Compress-then-encrypt: file size, save and open speed per codec, for text that
+compresses well (logs, Markdown) and text that barely does (base64 blobs).
+
+    python benchmarks/compression_bench.py [--sizes 1M,16M] [--codecs none,zlib:1,zlib:6,lzma:1,lzma:6]
+
+"stored" says whether the codec was used or skipped after the sample taken
+before the header is written; "ratio" is plaintext bytes per file byte.
+"""
+import io
+import os
+import base64
+import random
+import argparse
+
+from bench_utils import parse_size, format_size, percentile, time_calls
+from crypto_handler import CryptoHandler, TAG_CODEC
+from compression import parse_codec
+
+PASSWORD = "benchmark password"
+MB = 1024 * 1024
+
+
+def log_text(size, rng):
+    lines = []
+    total = 0
+    while total < size:
+        line = (f"2024-05-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:"
+                f"{rng.randint(0, 59):02d} {rng.choice(['INFO', 'WARN', 'DEBUG'])} worker-{rng.randint(1, 16)} "
+                f"processed batch {rng.randint(1, 99999)} in {rng.random() * 100:.1f} ms\n")
+        lines.append(line)
+        total += len(line)
+    return "".join(lines)[:size]
+
+
+def markdown_text(size, rng):
+    words = ["the", "note", "meeting", "release", "**todo**", "`config`", "server", "review", "backup",
+             "password", "draft", "client", "budget", "[link](https://example.com)", "deadline", "and"]
+    blocks = []
+    total = 0
+    while total < size:
+        heading = f"## {rng.choice(words).strip('*`').title()} {rng.randint(1, 999)}\n\n"
+        items = "".join(f"- {' '.join(rng.choice(words) for _ in range(rng.randint(4, 12)))}\n"
+                        for _ in range(rng.randint(2, 6)))
+        block = heading + items + "\n"
+        blocks.append(block)
+        total += len(block)
+    return "".join(blocks)[:size]
+
+
+def base64_text(size, rng):
+    return base64.b64encode(rng.randbytes(size * 3 // 4 + 3)).decode('ascii')[:size]
+
+
+CORPORA = {"log": log_text, "markdown": markdown_text, "base64": base64_text}
+
+
+def bench_case(text, codec, repeat):
+    crypto = CryptoHandler()
+    crypto.codec = codec
+    salt = os.urandom(crypto.salt_size)
+    sealed = crypto.encrypt(text, PASSWORD, salt)
+    save = time_calls(lambda: crypto.encrypt(text, PASSWORD, salt), repeat)
+    open_ = time_calls(lambda: crypto.decrypt(sealed, PASSWORD), repeat)
+    header = crypto.peek_header(io.BytesIO(sealed))[1]
+    return len(sealed), TAG_CODEC in header, save, open_
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AeTxt compress-then-encrypt trade-off")
+    parser.add_argument("--sizes", default="1M,16M", help="document sizes")
+    parser.add_argument("--codecs", default="none,zlib:1,zlib:6,lzma:1,lzma:6",
+                        help="comma-separated codecs (none, zlib[:LEVEL], lzma[:PRESET])")
+    parser.add_argument("--corpora", default=",".join(CORPORA), help="comma-separated: " + ", ".join(CORPORA))
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case (default 3)")
+    args = parser.parse_args(argv)
+
+    codecs = [(spec, parse_codec(spec)) for spec in args.codecs.split(",")]
+    print(f"{'corpus':>8} {'size':>6} {'codec':>7} {'stored':>10} {'ratio':>6} {'file':>9}"
+          f" {'save MB/s':>10} {'open MB/s':>10}")
+    for corpus in args.corpora.split(","):
+        for size in (parse_size(s) for s in args.sizes.split(",") if s):
+            text = CORPORA[corpus](size, random.Random(size))
+            plain = len(text.encode('utf-8'))
+            for spec, codec in codecs:
+                file_size, compressed, save, open_ = bench_case(text, codec, args.repeat)
+                stored = "plain" if codec is None else ("compressed" if compressed else "skipped")
+                print(f"{corpus:>8} {format_size(size):>6} {spec:>7} {stored:>10} {plain / file_size:6.2f}"
+                      f" {file_size / MB:7.2f}MB {plain / MB / percentile(save, 50):10.0f}"
+                      f" {plain / MB / percentile(open_, 50):10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Crypto micro-benchmarks: key derivation, encrypt, decrypt and the base64
+round trip used by Hide/Decrypt, across document sizes and KDF costs.
+
+    python benchmarks/crypto_bench.py                         # print results
+    python benchmarks/crypto_bench.py --save baseline.json    # record a baseline
+    python benchmarks/crypto_bench.py --compare baseline.json # exit 1 on regression
+
+Sizes go up to 1 GB (`--sizes 1K,1M,1G`); large sizes need a few times that much RAM.
+"""
+import sys
+import json
+import base64
+import argparse
+import platform
+
+from bench_utils import parse_size, format_size, percentile, sample_text, time_calls, peak_memory
+from crypto_handler import CryptoHandler, KdfParams
+
+DEFAULT_SIZES = "1K,64K,1M,16M,128M"
+DEFAULT_ITERATIONS = "10000,100000,310000,600000"
+DEFAULT_SCRYPT_N = "16384,65536"
+MB = 1024 * 1024
+
+
+def _repeats(size, requested):
+    # Keep every case to roughly the same wall time: fewer runs for big documents
+    if size >= 64 * MB:
+        return max(3, requested // 10)
+    if size >= 4 * MB:
+        return max(5, requested // 3)
+    return requested
+
+
+def _result(name, samples, size=None, iterations=None, peak=None):
+    result = {
+        "name": name,
+        "size": size,
+        "iterations": iterations,
+        "runs": len(samples),
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "max_ms": max(samples) * 1000,
+    }
+    if size:
+        result["mb_per_s"] = size / MB / percentile(samples, 50)
+    if peak is not None:
+        result["peak_mb"] = peak / MB
+    return result
+
+
+def bench_kdf(iteration_counts, scrypt_ns, repeat):
+    crypto = CryptoHandler()
+    salt = b"\0" * crypto.salt_size
+    for iterations in iteration_counts:
+        kdf = KdfParams.pbkdf2(iterations)
+        samples = time_calls(lambda: crypto.derive_key("benchmark password", salt, kdf, cache=False), repeat)
+        yield _result("derive_key", samples, iterations=iterations)
+    for n in scrypt_ns:
+        kdf = KdfParams.scrypt(n=n)
+        samples = time_calls(lambda: crypto.derive_key("benchmark password", salt, kdf, cache=False), repeat)
+        yield _result("derive_scrypt", samples, iterations=n)
+
+
+def bench_sizes(sizes, repeat, measure_memory):
+    crypto = CryptoHandler()
+    password = "benchmark password"
+    salt = b"\1" * crypto.salt_size
+    # Warm the key cache so encrypt/decrypt measure AES-GCM only
+    crypto.derive_key(password, salt)
+
+    for size in sizes:
+        text = sample_text(size)
+        blob = crypto.encrypt(text, password, salt=salt)
+        runs = _repeats(size, repeat)
+
+        cases = [
+            ("encrypt", lambda: crypto.encrypt(text, password, salt=salt)),
+            ("decrypt", lambda: crypto.decrypt(blob, password)),
+            ("hide_roundtrip", lambda: crypto.decrypt(base64.b64decode(
+                base64.b64encode(crypto.encrypt(text, password, salt=salt)).decode('utf-8')), password)),
+            ("b64_roundtrip", lambda: base64.b64decode(base64.b64encode(blob).decode('utf-8'))),
+        ]
+        for name, fn in cases:
+            samples = time_calls(fn, runs)
+            peak = peak_memory(fn) if measure_memory else None
+            yield _result(name, samples, size=size, peak=peak)
+
+
+def _key(result):
+    return f"{result['name']}/{result['size'] or ''}/{result['iterations'] or ''}"
+
+
+def compare(results, baseline, threshold, min_delta_ms=0.1):
+    """Returns the results whose median latency grew past threshold (and by more than min_delta_ms)."""
+    previous = {_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get(_key(result))
+        if old and result["p50_ms"] > old["p50_ms"] * (1 + threshold) \
+                and result["p50_ms"] - old["p50_ms"] > min_delta_ms:
+            regressions.append((result, old))
+    return regressions
+
+
+def print_results(results):
+    print(f"{'case':<16} {'size':>6} {'iter':>7} {'p50 ms':>10} {'p95 ms':>10} {'MB/s':>9} {'peak MB':>8}")
+    for r in results:
+        size = format_size(r["size"]) if r["size"] else ""
+        iterations = r["iterations"] or ""
+        rate = f"{r['mb_per_s']:.1f}" if "mb_per_s" in r else ""
+        peak = f"{r['peak_mb']:.1f}" if "peak_mb" in r else ""
+        print(f"{r['name']:<16} {size:>6} {iterations:>7} {r['p50_ms']:10.3f} {r['p95_ms']:10.3f} {rate:>9} {peak:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AeTxt crypto micro-benchmarks")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"document sizes (default {DEFAULT_SIZES})")
+    parser.add_argument("--iterations", default=DEFAULT_ITERATIONS, help="PBKDF2 iteration counts to sweep")
+    parser.add_argument("--scrypt-n", default=DEFAULT_SCRYPT_N, help="scrypt N values to sweep (r=8, p=1)")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per case (fewer for large sizes)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak memory pass")
+    parser.add_argument("--save", metavar="PATH", help="write results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed median slowdown before failing (default 0.25 = 25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.1,
+                        help="ignore slowdowns smaller than this, to tolerate timer noise on tiny cases")
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s]
+    iterations = [int(i) for i in args.iterations.split(",") if i]
+    scrypt_ns = [int(n) for n in args.scrypt_n.split(",") if n]
+
+    results = list(bench_kdf(iterations, scrypt_ns, max(3, args.repeat // 4)))
+    results += list(bench_sizes(sizes, args.repeat, not args.no_memory))
+    print_results(results)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({"machine": platform.platform(), "python": platform.python_version(),
+                       "results": results}, f, indent=2)
+        print(f"Baseline saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        for result, old in regressions:
+            print(f"REGRESSION {_key(result)}: {old['p50_ms']:.3f} ms -> {result['p50_ms']:.3f} ms",
+                  file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Editor widget latency on large documents: StealthTextEdit (QTextEdit, rich-text
+layout) against LargeTextEdit (QPlainTextEdit, block layout), which the editor
+switches to from LARGE_DOCUMENT_CHARS.
+
+    load       set_actual_text and the first paint
+    scroll     jump to a random spot and repaint
+    keystroke  type a key at the cursor and repaint (the window's journal and
+               segment map bookkeeping is not included)
+
+    python benchmarks/editor_bench.py [--sizes 10M,50M,100M] [--editors large,rich] [--repeat 50]
+
+Runs offscreen. QTextEdit at 100M takes minutes to load; leave it out with --editors large.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from bench_utils import parse_size, format_size, percentile, sample_text
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtGui import QKeyEvent
+from PyQt6.QtCore import Qt, QEvent
+
+
+def _paint(app, editor):
+    editor.viewport().repaint()
+    app.processEvents()
+
+
+def bench_editor(app, editor_class, text, repeat):
+    editor = editor_class()
+    editor.resize(1000, 800)
+    editor.show()
+    app.processEvents()
+
+    start = time.perf_counter()
+    editor.set_actual_text(text)
+    _paint(app, editor)
+    load = time.perf_counter() - start
+
+    rng = random.Random(len(text))
+    scrollbar = editor.verticalScrollBar()
+    scroll = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        scrollbar.setValue(rng.randint(0, scrollbar.maximum()))
+        _paint(app, editor)
+        scroll.append(time.perf_counter() - start)
+
+    keystroke = []
+    key = QKeyEvent(QEvent.Type.KeyPress, Qt.Key.Key_A, Qt.KeyboardModifier.NoModifier, "a")
+    for i in range(repeat):
+        if i % 10 == 0:
+            # Somewhere else now and then, like clicking into the text
+            cursor = editor.textCursor()
+            cursor.setPosition(rng.randint(0, len(text)))
+            editor.setTextCursor(cursor)
+        start = time.perf_counter()
+        app.sendEvent(editor, key)
+        _paint(app, editor)
+        keystroke.append(time.perf_counter() - start)
+
+    editor.close()
+    editor.deleteLater()
+    app.processEvents()
+    return load, scroll, keystroke
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AeTxt editor widget latency on large documents")
+    parser.add_argument("--sizes", default="10M,50M,100M", help="comma-separated document sizes")
+    parser.add_argument("--editors", default="large,rich", help="comma-separated: large, rich")
+    parser.add_argument("--repeat", type=int, default=50, help="scrolls and keystrokes per case (default 50)")
+    args = parser.parse_args(argv)
+
+    app = QApplication(sys.argv[:1])
+    import main as editor_module
+    editors = {"large": editor_module.LargeTextEdit, "rich": editor_module.StealthTextEdit}
+
+    print(f"{'size':>6} {'editor':>6} {'load':>9} {'scroll p50':>11} {'scroll p99':>11}"
+          f" {'key p50':>9} {'key p99':>9}")
+    for size in (parse_size(s) for s in args.sizes.split(",") if s):
+        text = sample_text(size)
+        for name in args.editors.split(","):
+            load, scroll, keystroke = bench_editor(app, editors[name], text, args.repeat)
+            print(f"{format_size(size):>6} {name:>6} {load:8.2f}s {percentile(scroll, 50) * 1000:9.2f}ms"
+                  f" {percentile(scroll, 99) * 1000:9.2f}ms {percentile(keystroke, 50) * 1000:7.2f}ms"
+                  f" {percentile(keystroke, 99) * 1000:7.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Folder search index: build, per-save update and query latency for a folder of
+synthetic notes. Document bodies are never decrypted by a query.
+
+    python benchmarks/index_bench.py [--docs 2000] [--words 800] [--queries 200]
+"""
+import os
+import random
+import argparse
+import tempfile
+
+from bench_utils import percentile, time_calls
+from crypto_handler import CryptoHandler
+from search_index import SearchIndex
+
+PASSWORD = "benchmark password"
+
+
+def make_vocabulary(size):
+    rng = random.Random(1)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+
+def make_note(rng, vocabulary, words):
+    # Skewed towards common words, like real notes
+    return " ".join(vocabulary[min(int(rng.paretovariate(1.2)) - 1, len(vocabulary) - 1)]
+                    if rng.random() < 0.7 else rng.choice(vocabulary) for _ in range(words))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AeTxt search index benchmark")
+    parser.add_argument("--docs", type=int, default=2000, help="notes in the folder")
+    parser.add_argument("--words", type=int, default=800, help="words per note")
+    parser.add_argument("--vocabulary", type=int, default=50000, help="distinct words overall")
+    parser.add_argument("--queries", type=int, default=200, help="queries to time")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(2)
+    vocabulary = make_vocabulary(args.vocabulary)
+    notes = [make_note(rng, vocabulary, args.words) for _ in range(args.docs)]
+    crypto = CryptoHandler()
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = [os.path.join(folder, f"note{i}.aetxt") for i in range(args.docs)]
+        index = SearchIndex(folder)
+        build = time_calls(lambda: index.rebuild(crypto, PASSWORD, zip(paths, notes)), 1)[0]
+        size = os.path.getsize(index.path)
+        for path in paths:
+            open(path, 'wb').close()
+
+        updates = time_calls(lambda: index.update(crypto, PASSWORD, rng.choice(paths),
+                                                  make_note(rng, vocabulary, args.words)), 20)
+
+        cold = SearchIndex(folder)
+        first = time_calls(lambda: cold.search(crypto, PASSWORD, vocabulary[0]), 1)[0]
+        queries = [" ".join(rng.sample(vocabulary[:2000], rng.randint(1, 2))) for _ in range(args.queries)]
+        it = iter(queries)
+        warm = time_calls(lambda: cold.search(crypto, PASSWORD, next(it)), len(queries))
+
+    print(f"{args.docs} notes x {args.words} words, index {size / 1024 / 1024:.1f} MB")
+    print(f"build (words only, no decryption)  {build * 1000:10.1f} ms")
+    print(f"update after a save, p50           {percentile(updates, 50) * 1000:10.2f} ms")
+    print(f"first query (load + postings)      {first * 1000:10.1f} ms")
+    print(f"query p50 / p95                    {percentile(warm, 50) * 1000:10.3f} / {percentile(warm, 95) * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Peak RSS while opening a large encrypted file, relative to the file size.
+
+Each case runs in a fresh process and reports how far its peak resident set
+grew while decrypting to a str (the text handed to the editor):
+
+    read_all  whole file read into bytes, decrypted, joined and decoded
+    stream    file read segment by segment, decoded pieces joined
+    mmap      file memory-mapped, segments decrypted into one buffer (file_io.load_segments)
+
+    python benchmarks/memory_bench.py [--size 256M]
+
+Needs /proc or the resource module (Linux/macOS).
+"""
+import io
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+
+from bench_utils import parse_size, format_size, sample_text
+from crypto_handler import CryptoHandler
+
+PASSWORD = "benchmark password"
+CASES = ["read_all", "stream", "mmap"]
+
+
+def _peak_rss():
+    # ru_maxrss survives exec on Linux (a child starts at its parent's peak), VmHWM does not
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _noop(done, total):
+    pass
+
+
+def run_case(case, path):
+    """Runs one case in this process; returns the peak RSS growth in bytes."""
+    crypto = CryptoHandler()
+    with open(path, 'rb') as f:
+        crypto.derive_key(PASSWORD, crypto.peek_salt(f))
+    base = _peak_rss()
+    if case == "read_all":
+        with open(path, 'rb') as f:
+            data = f.read()
+        text = b"".join(crypto.decrypt_stream(io.BytesIO(data), PASSWORD)).decode('utf-8')
+    elif case == "stream":
+        with open(path, 'rb') as f:
+            text = "".join(crypto.decrypt_text_stream(f, PASSWORD))
+    else:
+        from file_io import load_segments
+        text, _, _ = load_segments(crypto, path, PASSWORD, _noop)
+    assert text
+    return _peak_rss() - base
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AeTxt peak memory while opening a file")
+    parser.add_argument("--size", default="256M", help="plaintext size (default 256M)")
+    parser.add_argument("--case", choices=CASES, help=argparse.SUPPRESS)
+    parser.add_argument("--file", help=argparse.SUPPRESS)
+    parser.add_argument("--make", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.make:
+        with open(args.file, 'wb') as f:
+            f.write(CryptoHandler().encrypt_buffer(sample_text(parse_size(args.size)).encode('utf-8'), PASSWORD))
+        return 0
+    if args.case:
+        print(run_case(args.case, args.file))
+        return 0
+
+    size = parse_size(args.size)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.aetxt")
+        # Written by a child too, so this process stays small for the ones that measure
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--make", "--size", args.size, "--file", path],
+                       check=True)
+        file_size = os.path.getsize(path)
+
+        print(f"file {format_size(size)} ({file_size / 1024 / 1024:.0f} MB on disk)")
+        print(f"{'case':<10} {'peak MB':>9} {'x file':>7}")
+        for case in CASES:
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--case", case, "--file", path],
+                                 capture_output=True, text=True, check=True).stdout
+            peak = int(out.strip().splitlines()[-1])
+            print(f"{case:<10} {peak / 1024 / 1024:9.1f} {peak / file_size:7.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
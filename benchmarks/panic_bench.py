@@ -0,0 +1,102 @@
+"""
+Panic button latency across document sizes, in two phases:
+
+    blank   until every tab is covered and the window repainted (budget: one
+            60 Hz frame, 16 ms), whatever the size of the text
+    sealed  until the text is encrypted and the cover taken off, with the key
+            pinned when the file was saved
+
+    python benchmarks/panic_bench.py [--sizes 1K,1M,10M,50M] [--repeat 5] [--check]
+
+Runs the editor window offscreen. With --check the exit status is 1 if a
+blank took longer than the budget.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from bench_utils import parse_size, format_size, percentile, sample_text
+from PyQt6.QtWidgets import QApplication
+
+import tracing
+
+PASSWORD = "benchmark password"
+BUDGET = 0.016
+
+
+def _settle(app, window):
+    for _ in range(6):
+        window.crypto_service.wait()
+        app.processEvents()
+
+
+def bench_size(app, window, directory, size, repeat):
+    doc = window.new_tab()
+    doc.editor.set_actual_text(sample_text(size))
+    path = os.path.join(directory, f"panic_{size}.aetxt")
+    window.current_password = PASSWORD
+    window._write_file(path, PASSWORD)
+    _settle(app, window)
+
+    blank, sealed = [], []
+    spans = {}
+    listener = lambda name, seconds: spans.__setitem__(name, seconds)
+    tracing.add_listener(listener)
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            window.panic_all()
+            while doc.is_covered() or not doc.is_hidden:
+                window.crypto_service.wait()
+                app.processEvents()
+            sealed.append(time.perf_counter() - start)
+            blank.append(spans["panic blank"])
+            # Back to plaintext for the next round, without asking for the password
+            doc.is_hidden = False
+            doc.sealed = None
+            doc.editor.setReadOnly(False)
+            doc.editor.set_actual_text(sample_text(size))
+            _settle(app, window)
+    finally:
+        tracing.remove_listener(listener)
+    window.close_tab(window.tabs.indexOf(doc))
+    _settle(app, window)
+    return blank, sealed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AeTxt panic button latency")
+    parser.add_argument("--sizes", default="1K,1M,10M,50M", help="comma-separated plaintext sizes")
+    parser.add_argument("--repeat", type=int, default=5, help="panics per size (default 5)")
+    parser.add_argument("--check", action="store_true", help="exit with 1 if a blank misses the 16 ms budget")
+    args = parser.parse_args(argv)
+
+    app = QApplication(sys.argv[:1])
+    import main as editor
+    window = editor.ModernNotepad()
+    window.show()
+    # Spans only go to the listener, not to a file
+    tracing.start()
+    _settle(app, window)
+
+    over = False
+    print(f"{'size':>8} {'blank p50':>10} {'blank max':>10} {'sealed p50':>11} {'sealed max':>11}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in (parse_size(s) for s in args.sizes.split(",")):
+            blank, sealed = bench_size(app, window, directory, size, args.repeat)
+            over = over or max(blank) > BUDGET
+            print(f"{format_size(size):>8} {percentile(blank, 50) * 1000:>8.2f}ms {max(blank) * 1000:>8.2f}ms "
+                  f"{percentile(sealed, 50) * 1000:>9.1f}ms {max(sealed) * 1000:>9.1f}ms")
+    tracing.stop()
+    window.close()
+    if over:
+        print(f"blank over the {BUDGET * 1000:.0f} ms budget")
+    return 1 if args.check and over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
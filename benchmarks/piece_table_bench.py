@@ -0,0 +1,76 @@
+"""
+Per-keystroke latency of the stealth mode text buffer.
+
+Types a run of characters at a random spot, then backspaces over part of it,
+for documents from 1 KB to 50 MB, and compares PieceTable with the old
+`text[:pos] + key + text[pos:]` string splicing.
+
+    python benchmarks/piece_table_bench.py [--sizes 1K,1M,50M] [--keys 2000]
+"""
+import time
+import random
+import argparse
+
+from bench_utils import parse_size, percentile
+from piece_table import PieceTable
+
+
+def type_session(insert, delete, length, keys):
+    """Returns per-key latencies in microseconds."""
+    samples = []
+    pos = random.randint(0, length)
+    for i in range(keys):
+        start = time.perf_counter()
+        if i % 5 == 4:
+            delete(pos - 1, pos)
+            pos -= 1
+        else:
+            insert(pos, "a")
+            pos += 1
+        samples.append((time.perf_counter() - start) * 1e6)
+        if i % 200 == 199:
+            # Jump elsewhere now and then, like clicking somewhere else
+            pos = random.randint(0, length)
+    return samples
+
+
+def bench_piece_table(text, keys):
+    table = PieceTable(text)
+    return type_session(table.insert, table.delete, len(text), keys)
+
+
+def bench_str(text, keys):
+    box = [text]
+
+    def insert(pos, key):
+        box[0] = box[0][:pos] + key + box[0][pos:]
+
+    def delete(start, end):
+        box[0] = box[0][:start] + box[0][end:]
+
+    return type_session(insert, delete, len(text), keys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1K,64K,1M,10M,50M")
+    parser.add_argument("--keys", type=int, default=2000)
+    parser.add_argument("--str-limit", default="10M", help="skip the str baseline above this size")
+    args = parser.parse_args()
+
+    str_limit = parse_size(args.str_limit)
+    print(f"{'size':>8} {'buffer':>12} {'p50 us':>9} {'p99 us':>9} {'max us':>9}")
+    for label in args.sizes.split(","):
+        size = parse_size(label)
+        text = ("lorem ipsum dolor sit amet\n" * (size // 27 + 1))[:size]
+        runs = [("PieceTable", bench_piece_table)]
+        if size <= str_limit:
+            runs.append(("str splice", bench_str))
+        for name, bench in runs:
+            samples = bench(text, args.keys)
+            print(f"{label:>8} {name:>12} {percentile(samples, 50):9.1f} "
+                  f"{percentile(samples, 99):9.1f} {max(samples):9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Save latency after a small edit: full re-encryption versus the segment-incremental
+path, which re-seals only the edited segment and copies the rest from the old file,
+and versus an autosave, which appends the edit to the encrypted journal.
+
+    python benchmarks/save_bench.py [--sizes 1M,16M,100M] [--edits 5]
+
+Saves write a temporary file, fsync it and rename it over the target; autosaves
+append to the journal and fsync it.
+"""
+import os
+import random
+import argparse
+import tempfile
+
+from bench_utils import parse_size, format_size, percentile, sample_text, time_calls
+from crypto_handler import CryptoHandler
+from file_io import save_full
+from journal import Journal, UNIT_CHARS
+
+
+def _noop(done, total):
+    pass
+
+
+def bench_size(crypto, directory, size, edits):
+    password = "benchmark password"
+    path = os.path.join(directory, f"bench_{size}.aetxt")
+    text = sample_text(size)
+    salt, segment_map = save_full(crypto, path, text, password, None, _noop)
+
+    full = time_calls(lambda: save_full(crypto, path, text, password, salt, _noop), max(1, edits // 2))
+    # The full saves above replaced the file, so start again from a fresh map
+    salt, segment_map = save_full(crypto, path, text, password, salt, _noop)
+
+    incremental = []
+    sealed = 0
+    for _ in range(edits):
+        pos = random.randint(0, len(text))
+        text = text[:pos] + "x" + text[pos:]
+        segment_map.on_contents_change(pos, 0, 1)
+        entries, new_map = segment_map.plan(text)
+        samples = time_calls(lambda: segment_map.write_incremental(crypto, text, password, entries, new_map, _noop), 1)
+        incremental += samples
+        sealed += sum(1 for entry in entries if entry[0] == "seal")
+        segment_map = new_map
+
+    journal = Journal(path)
+    journal.rebase(crypto, path, password, salt, 0)
+    seqs = iter(range(1, edits + 1))
+    autosave = time_calls(lambda: journal.append(crypto, password, [(next(seqs), UNIT_CHARS, 0, 0, "x")]), edits)
+    journal.discard()
+    os.remove(path)
+    return full, incremental, autosave, sealed / edits
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AeTxt full vs incremental save")
+    parser.add_argument("--sizes", default="1M,16M,100M", help="document sizes")
+    parser.add_argument("--edits", type=int, default=5, help="one-character edits (and saves) per size")
+    parser.add_argument("--dir", help="directory for the test files (default: system temp)")
+    args = parser.parse_args(argv)
+
+    crypto = CryptoHandler()
+    print(f"{'size':>6} {'full p50 ms':>12} {'incr p50 ms':>12} {'speedup':>8} {'sealed/save':>12} {'autosave ms':>12}")
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        for size in (parse_size(s) for s in args.sizes.split(",") if s):
+            full, incremental, autosave, sealed = bench_size(crypto, directory, size, args.edits)
+            full_ms = percentile(full, 50) * 1000
+            incr_ms = percentile(incremental, 50) * 1000
+            autosave_ms = percentile(autosave, 50) * 1000
+            print(f"{format_size(size):>6} {full_ms:12.1f} {incr_ms:12.1f} {full_ms / incr_ms:7.1f}x {sealed:12.1f}"
+                  f" {autosave_ms:12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Headless command line interface for AeTxt files. Never imports PyQt6.
+
+    aetxt encrypt notes.txt            -> notes.txt.aetxt
+    aetxt decrypt notes.txt.aetxt      -> notes.txt
+    aetxt cat notes.aetxt              -> plaintext on stdout
+    aetxt verify *.aetxt               -> checks password and integrity
+    echo secret | aetxt encrypt - > secret.aetxt
+
+Use --jobs N to spread PBKDF2-heavy batches over N processes. Files in a vault
+(see vault.py) are read with the vault password, which unlocks the vault of
+their folder.
+"""
+import os
+import sys
+import time
+import getpass
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from cryptography.exceptions import InvalidTag
+from crypto_handler import CryptoHandler, KdfParams, WrongPasswordError
+from compression import parse_codec
+from file_io import atomic_write
+from vault import Vault
+
+EXTENSION = ".aetxt"
+CHUNK_SIZE = 1024 * 1024
+
+
+def _read_chunks(f):
+    return iter(lambda: f.read(CHUNK_SIZE), b"")
+
+
+def _output_path(command, path, out_dir):
+    if command == "encrypt":
+        name = os.path.basename(path) + EXTENSION
+    elif path.endswith(EXTENSION):
+        name = os.path.basename(path)[:-len(EXTENSION)]
+    else:
+        name = os.path.basename(path) + ".txt"
+    return os.path.join(out_dir or os.path.dirname(path), name)
+
+
+def _write_new(path, pieces, force):
+    """Writes pieces to path through a temporary file, so failures leave nothing half-written."""
+    if os.path.exists(path) and not force:
+        raise FileExistsError(f"{path} exists (use --force to overwrite)")
+    atomic_write(path, pieces)
+
+
+def _unlock_vault(crypto, path, password):
+    """Unlocks the vault of path's folder if path is sealed under it and crypto doesn't know it yet."""
+    with open(path, 'rb') as f:
+        vault_id = crypto.vault_id_of(f)
+    if vault_id is None or vault_id in crypto.vaults:
+        return
+    vault = Vault(os.path.dirname(os.path.abspath(path)))
+    if vault.exists():
+        vault.unlock(crypto, password)
+        crypto.add_vault(vault)
+
+
+def process_file(command, path, password, out_dir=None, force=False, kdf=None, codec=None):
+    """
+    Runs one command on one file. Returns (path, ok, message, bytes_processed, seconds).
+    Runs in a worker process when --jobs > 1, so it only takes picklable arguments.
+    """
+    crypto = CryptoHandler()
+    crypto.codec = codec
+    start = time.perf_counter()
+    try:
+        size = os.path.getsize(path)
+        if command != "encrypt":
+            _unlock_vault(crypto, path, password)
+        with open(path, 'rb') as f:
+            if command == "encrypt":
+                target = _output_path(command, path, out_dir)
+                _write_new(target, crypto.encrypt_stream(_read_chunks(f), password, kdf=kdf), force)
+                message = target
+            elif command == "decrypt":
+                target = _output_path(command, path, out_dir)
+                _write_new(target, crypto.decrypt_stream(f, password), force)
+                message = target
+            elif command == "verify":
+                for _ in crypto.decrypt_stream(f, password):
+                    pass
+                message = "OK"
+            else:
+                raise ValueError(f"Unknown command: {command}")
+        return path, True, message, size, time.perf_counter() - start
+    except Exception as e:
+        return path, False, _describe_error(e), 0, time.perf_counter() - start
+
+
+def _describe_error(error):
+    if isinstance(error, WrongPasswordError):
+        return "Incorrect password"
+    if isinstance(error, InvalidTag):
+        # Files without a key check can't tell a wrong password from damage
+        return "Incorrect password or corrupted file"
+    if isinstance(error, (OSError, ValueError)):
+        return str(error)
+    return f"{type(error).__name__}: {error}"
+
+
+def _get_password(args):
+    if args.password_env:
+        password = os.environ.get(args.password_env)
+        if not password:
+            raise SystemExit(f"aetxt: environment variable {args.password_env} is not set")
+        return password
+    if args.password_file:
+        with open(args.password_file, encoding='utf-8') as f:
+            return f.readline().rstrip("\r\n")
+    password = getpass.getpass("Password: ")
+    if args.command == "encrypt" and getpass.getpass("Repeat password: ") != password:
+        raise SystemExit("aetxt: passwords do not match")
+    return password
+
+
+def _run_stdio(command, password, kdf=None, codec=None):
+    """Pipes stdin to stdout. cat is decrypt to stdout."""
+    crypto = CryptoHandler()
+    crypto.codec = codec
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    try:
+        if command == "encrypt":
+            pieces = crypto.encrypt_stream(_read_chunks(stdin), password, kdf=kdf)
+        else:
+            pieces = crypto.decrypt_stream(stdin, password)
+        for piece in pieces:
+            if command != "verify":
+                stdout.write(piece)
+        stdout.flush()
+    except Exception as e:
+        print(f"aetxt: {_describe_error(e)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def _run_cat(paths, password):
+    crypto = CryptoHandler()
+    stdout = sys.stdout.buffer
+    status = 0
+    for path in paths:
+        try:
+            _unlock_vault(crypto, path, password)
+            with open(path, 'rb') as f:
+                for piece in crypto.decrypt_stream(f, password):
+                    stdout.write(piece)
+        except Exception as e:
+            print(f"aetxt: {path}: {_describe_error(e)}", file=sys.stderr)
+            status = 1
+    stdout.flush()
+    return status
+
+
+def _run_batch(args, password, kdf=None):
+    jobs = args.jobs or os.cpu_count() or 1
+    calls = [(args.command, path, password, args.output_dir, args.force, kdf, args.compress) for path in args.files]
+    started = time.perf_counter()
+
+    if jobs > 1 and len(calls) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(calls))) as pool:
+            results = pool.map(process_file, *zip(*calls))
+            results = list(_report(results, args.quiet))
+    else:
+        results = list(_report((process_file(*call) for call in calls), args.quiet))
+
+    elapsed = time.perf_counter() - started
+    failed = sum(1 for result in results if not result[1])
+    total_bytes = sum(result[3] for result in results)
+    if not args.quiet:
+        print(f"{len(results) - failed} ok, {failed} failed, "
+              f"{total_bytes / 1024 / 1024:.1f} MB in {elapsed:.2f} s "
+              f"({len(results) / elapsed if elapsed else 0:.1f} files/s, "
+              f"{total_bytes / 1024 / 1024 / elapsed if elapsed else 0:.1f} MB/s)",
+              file=sys.stderr)
+    return 1 if failed else 0
+
+
+def _report(results, quiet):
+    for result in results:
+        path, ok, message, size, seconds = result
+        if not ok:
+            print(f"FAIL {path}: {message}", file=sys.stderr)
+        elif not quiet:
+            print(f"OK   {path} -> {message} ({size} bytes, {seconds * 1000:.0f} ms)", file=sys.stderr)
+        yield result
+
+
+def _spec(parse):
+    """An argparse type for parse, reporting its ValueError message instead of a generic one."""
+    def convert(value):
+        try:
+            return parse(value)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+    return convert
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="aetxt", description="Encrypt, decrypt and verify AeTxt files.")
+    parser.add_argument("command", choices=["encrypt", "decrypt", "cat", "verify"])
+    parser.add_argument("files", nargs="*", help="input files; none or '-' reads stdin and writes stdout")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="worker processes (0 = all cores)")
+    parser.add_argument("-o", "--output-dir", help="directory for encrypted/decrypted files")
+    parser.add_argument("-f", "--force", action="store_true", help="overwrite existing output files")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only report failures")
+    parser.add_argument("--kdf", metavar="SPEC", type=_spec(KdfParams.parse),
+                        help="key derivation for encrypt: pbkdf2:ITERATIONS or scrypt:N:R:P")
+    parser.add_argument("--compress", metavar="SPEC", type=_spec(parse_codec),
+                        help="compression for encrypt: none, zlib[:LEVEL] or lzma[:PRESET] "
+                             "(skipped for data that does not compress)")
+    parser.add_argument("--unlock-ms", metavar="MS", type=int,
+                        help="calibrate the key derivation to take about MS milliseconds on this machine")
+    parser.add_argument("--password-env", metavar="VAR", help="read the password from an environment variable")
+    parser.add_argument("--password-file", metavar="PATH", help="read the password from the first line of a file")
+    return parser
+
+
+def main(argv=None):
+    # Intermixed, so options may come before or after the files
+    args = build_parser().parse_intermixed_args(argv)
+    password = _get_password(args)
+    kdf = args.kdf
+    if args.unlock_ms:
+        kdf = CryptoHandler().calibrate_kdf(args.unlock_ms / 1000, kdf.algorithm if kdf else "pbkdf2")
+        print(f"aetxt: using {kdf}", file=sys.stderr)
+
+    if not args.files or args.files == ["-"]:
+        return _run_stdio("decrypt" if args.command == "cat" else args.command, password, kdf, args.compress)
+    if args.command == "cat":
+        return _run_cat(args.files, password)
+    return _run_batch(args, password, kdf)
+
+
+if __name__ == "__main__":
+    # In the frozen aetxt.exe, --jobs workers start the executable again; this runs them instead of the CLI
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,114 @@
+from typing import NamedTuple
+
+# Optional compression of each segment before it is sealed (compress, then encrypt).
+#
+# A file records the id of its codec in the header (crypto_handler.TAG_CODEC);
+# the level is only needed to compress, so it is not stored. Segments stay
+# independent, so incremental saves still re-seal only what changed.
+#
+# zlib and lzma from the standard library are built in; register_codec adds
+# others. Codec ids end up in files, so an id must never be reused.
+
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+
+# Bytes compressed up front to decide whether a file is worth compressing
+SAMPLE_SIZE = 64 * 1024
+# Files whose sample shrinks by less than this are stored uncompressed. Compressing
+# is far slower than sealing, so a small saving (base64 blobs: ~23%) isn't worth it.
+MIN_SAVING = 0.25
+
+
+class Codec(NamedTuple):
+    """A segment codec (see register_codec); level is only used to compress."""
+    codec_id: int
+    name: str
+    level: int
+    compress: object
+    decompress: object
+    levels: range = None
+
+    def __str__(self):
+        return f"{self.name}:{self.level}"
+
+    def worth_it(self, sample) -> bool:
+        """True if compressing sample saves at least MIN_SAVING of its size."""
+        if not sample:
+            return False
+        return len(self.compress(bytes(sample), self.level)) <= len(sample) * (1 - MIN_SAVING)
+
+
+_CODECS = {} # codec_id -> Codec with its default level
+
+
+def register_codec(codec_id, name, compress, decompress, level, levels=None):
+    """
+    Adds a codec. compress(data, level) returns the compressed bytes;
+    decompress(data, limit) returns the original bytes and raises ValueError on
+    damaged data or if it would inflate past limit bytes. levels, if given, is
+    the range of levels parse_codec accepts.
+    """
+    codec = Codec(codec_id, name, level, compress, decompress, levels)
+    _CODECS[codec_id] = codec
+    return codec
+
+
+def get_codec(codec_id):
+    """The registered codec for an id read from a file, or None."""
+    return _CODECS.get(codec_id)
+
+
+def parse_codec(spec):
+    """Parses "none", "NAME" or "NAME:LEVEL" (as used on the command line). Returns a Codec or None."""
+    name, _, level = spec.partition(":")
+    if name == "none" and not level:
+        return None
+    for codec in _CODECS.values():
+        if codec.name == name:
+            if not level:
+                return codec
+            # Checked here: a level compress() rejects would make every later save fail
+            if level.lstrip("-").isdigit() and (codec.levels is None or int(level) in codec.levels):
+                return codec._replace(level=int(level))
+            break
+    raise ValueError(f"Invalid compression: {spec}")
+
+
+def _zlib_compress(data, level):
+    import zlib
+    return zlib.compress(data, level)
+
+
+def _zlib_decompress(data, limit):
+    import zlib
+    decompressor = zlib.decompressobj()
+    try:
+        out = decompressor.decompress(data, limit)
+    except zlib.error:
+        raise ValueError("File corrupted: invalid compressed segment")
+    if not decompressor.eof or decompressor.unconsumed_tail or decompressor.unused_data:
+        raise ValueError("File corrupted: invalid compressed segment")
+    return out
+
+
+def _lzma_compress(data, level):
+    import lzma
+    # AES-GCM already authenticates every segment, so no checksum
+    return lzma.compress(data, format=lzma.FORMAT_XZ, check=lzma.CHECK_NONE, preset=level)
+
+
+def _lzma_decompress(data, limit):
+    import lzma
+    decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+    try:
+        out = decompressor.decompress(data, limit)
+    except lzma.LZMAError:
+        raise ValueError("File corrupted: invalid compressed segment")
+    if not decompressor.eof or decompressor.unused_data:
+        raise ValueError("File corrupted: invalid compressed segment")
+    return out
+
+
+# zlib's fastest level keeps most of the saving on notes at several times the speed of level 6
+register_codec(CODEC_ZLIB, "zlib", _zlib_compress, _zlib_decompress, 1, range(-1, 10))
+register_codec(CODEC_LZMA, "lzma", _lzma_compress, _lzma_decompress, 6, range(0, 10))
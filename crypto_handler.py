@@ -1,41 +1,823 @@
 import os
-import base64
+import io
+import hmac
+import time
+import codecs
+import hashlib
+import struct
+import itertools
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+from typing import NamedTuple
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
 from cryptography.hazmat.primitives import hashes
+from tracing import span
+from compression import SAMPLE_SIZE, get_codec
+
+# File format v2 ("chunked"):
+#   magic(4) | version(1) | fields_len(2) | fields | segment_0 | segment_1 | ...
+# fields is a list of tag(1) | len(2) | value entries. Every segment is sealed
+# separately with AES-GCM, bound to the whole header, its index and a
+# final-segment flag, so truncation, reordering and header tampering all fail
+# authentication.
+# Each segment is stored as
+#   ciphertext_len(4) | nonce(12) | ciphertext + tag
+# with a random nonce and header | counter(4) | last(1) as associated data.
+# Segments hold whole UTF-8 characters and may differ in size, so a save can
+# re-seal only the segments that changed and copy the others.
+# TAG_SALT, TAG_SEGMENT_SIZE, TAG_KDF, TAG_KEY_CHECK and TAG_FRAMING are always present.
+# Files without the magic are v1: salt(16) | nonce(12) | ciphertext + tag.
+# Vault files (see vault.py) are sealed under a random data key instead of one
+# derived from the password; TAG_VAULT_KEY holds it wrapped by the vault's master
+# key and TAG_KDF says KDF_VAULT. The salt still names the file's key.
+# With TAG_CODEC every segment is compressed before it is sealed (see compression.py).
+# TAG_KEY_CHECK is HMAC-SHA256(key, KEY_CHECK_LABEL) cut to 16 bytes: a wrong password
+# is rejected right after the KDF instead of after a failed pass over the segments,
+# and a segment failing authentication under a checked key means the file was damaged.
+# Guessing passwords gets no faster: opening the first segment already told a right one.
+MAGIC = b"AETX"
+FORMAT_V2 = 2
+
+TAG_SALT = 0x01
+TAG_SEGMENT_SIZE = 0x02
+TAG_KDF = 0x04  # kdf_id(1) | parameters
+TAG_FRAMING = 0x05  # present (empty): segments are framed as above
+TAG_VAULT_KEY = 0x06  # vault_id(16) | nonce(12) | wrapped data key(32) + tag(16)
+TAG_CODEC = 0x07  # codec_id(1); absent means segments hold plain UTF-8
+TAG_KEY_CHECK = 0x08  # key check value(16)
+
+KDF_PBKDF2 = 1  # iterations(4)
+KDF_SCRYPT = 2  # n(4) | r(4) | p(4)
+KDF_VAULT = 3  # no parameters: the key is in TAG_VAULT_KEY
+
+KEY_CHECK_LABEL = b"AeTxt key check"
+KEY_CHECK_SIZE = 16
+
+# PBKDF2 iterations of v1 files, which don't record their KDF
+LEGACY_ITERATIONS = 100000
+
+# Upper bounds for parameters read from a file, so a crafted header can't hang the app.
+# scrypt is bounded as a whole: its memory is 128 * n * r bytes and its work grows with n * r * p.
+MAX_PBKDF2_ITERATIONS = 10000000
+MAX_SCRYPT_MEMORY = 256 * 1024 * 1024
+MAX_SCRYPT_WORK = 2 ** 22  # n * r * p; 16 times scrypt's default (n=2**15, r=8, p=1)
+
+class KdfParams(NamedTuple):
+    """Key derivation function and its cost parameters."""
+    algorithm: str = "pbkdf2"
+    iterations: int = LEGACY_ITERATIONS
+    n: int = 0
+    r: int = 0
+    p: int = 0
+
+    @classmethod
+    def pbkdf2(cls, iterations: int):
+        return cls("pbkdf2", iterations=iterations)
+
+    @classmethod
+    def scrypt(cls, n: int = 2 ** 15, r: int = 8, p: int = 1):
+        return cls("scrypt", iterations=0, n=n, r=r, p=p)
+
+    @classmethod
+    def vault(cls):
+        return cls("vault", iterations=0)
+
+    @classmethod
+    def parse(cls, spec: str):
+        """Parses "pbkdf2:ITERATIONS" or "scrypt:N:R:P" (as used on the command line)."""
+        name, _, rest = spec.partition(":")
+        values = [int(v) for v in rest.split(":") if v]
+        params = None
+        if name == "pbkdf2" and len(values) <= 1:
+            params = cls.pbkdf2(*values) if values else cls.pbkdf2(LEGACY_ITERATIONS)
+        elif name == "scrypt" and len(values) <= 3:
+            params = cls.scrypt(*values)
+        try:
+            # Within the bounds files are read with, so what is written can be opened again
+            return cls.decode(params.encode())
+        except (AttributeError, ValueError, struct.error):
+            raise ValueError(f"Invalid KDF specification: {spec}") from None
+
+    def __str__(self):
+        if self.algorithm == "scrypt":
+            return f"scrypt:{self.n}:{self.r}:{self.p}"
+        if self.algorithm == "vault":
+            return "vault"
+        return f"pbkdf2:{self.iterations}"
+
+    def encode(self) -> bytes:
+        if self.algorithm == "scrypt":
+            return struct.pack(">BIII", KDF_SCRYPT, self.n, self.r, self.p)
+        if self.algorithm == "vault":
+            return bytes([KDF_VAULT])
+        return struct.pack(">BI", KDF_PBKDF2, self.iterations)
+
+    @classmethod
+    def decode(cls, value: bytes):
+        if value[:1] == bytes([KDF_PBKDF2]) and len(value) == 5:
+            iterations = struct.unpack(">I", value[1:])[0]
+            if 0 < iterations <= MAX_PBKDF2_ITERATIONS:
+                return cls.pbkdf2(iterations)
+        elif value[:1] == bytes([KDF_SCRYPT]) and len(value) == 13:
+            n, r, p = struct.unpack(">III", value[1:])
+            if (n > 1 and n & (n - 1) == 0 and r > 0 and p > 0
+                    and 128 * n * r <= MAX_SCRYPT_MEMORY and n * r * p <= MAX_SCRYPT_WORK):
+                return cls.scrypt(n, r, p)
+        elif value == bytes([KDF_VAULT]):
+            return cls.vault()
+        raise ValueError("Unsupported key derivation parameters")
+
+
+class WrongPasswordError(ValueError):
+    """The password does not open the file (told apart from a damaged file by the key check)."""
+
+
+@contextmanager
+def _authenticating(checked: bool):
+    # Under a key that passed the key check, a failed tag can only mean damaged data
+    try:
+        yield
+    except InvalidTag:
+        if checked:
+            raise ValueError("File corrupted: a segment failed authentication") from None
+        raise
+
+
+_UTF8_CONTINUATION = bytes(range(0x80, 0xC0))
+
+def utf8_char_count(data: bytes) -> int:
+    """Number of characters in UTF-8 data, without decoding it."""
+    return len(data.translate(None, _UTF8_CONTINUATION))
+
+def iter_utf8(text: str, chunk_chars: int = 64 * 1024):
+    """Yields the UTF-8 encoding of text in pieces, so it is never encoded all at once."""
+    for i in range(0, len(text), chunk_chars):
+        yield text[i:i + chunk_chars].encode('utf-8')
 
 class CryptoHandler:
     def __init__(self):
         self.salt_size = 16
         self.nonce_size = 12
-        self.iterations = 100000
+        self.iterations = LEGACY_ITERATIONS
+        self.kdf = None # KdfParams for new files; None means PBKDF2 with self.iterations
+        self.codec = None # compression.Codec for new files; None stores segments uncompressed
+        self.tag_size = 16
+        self.segment_size = 64 * 1024
+        self.max_segment_size = 64 * 1024 * 1024
+
+        # Derived keys are cached per (password, salt) so repeated saves and
+        # hide/decrypt cycles don't pay the PBKDF2 cost every time.
+        self.key_cache_size = 8
+        self.key_cache_ttl = 15 * 60  # seconds
+        self._key_cache = OrderedDict()
+        self._key_cache_lock = threading.Lock()  # Keys are derived from worker threads too
+        # Keys of open documents, kept past the TTL so hiding (the panic button) never waits for the KDF
+        self._pinned_keys = set()
+        # Unlocked vaults by id, and the data keys of their files by salt: (vault, key, wrapped key)
+        self.vaults = {}
+        self._file_keys = {}
+
+    def default_kdf(self) -> KdfParams:
+        return self.kdf or KdfParams.pbkdf2(self.iterations)
+
+    def _run_kdf(self, password: str, salt: bytes, kdf: KdfParams = None) -> bytes:
+        """Derives a 256-bit key from the password using PBKDF2 or scrypt."""
+        params = kdf or self.default_kdf()
+        if params.algorithm == "scrypt":
+            kdf = Scrypt(salt=salt, length=32, n=params.n, r=params.r, p=params.p)
+        else:
+            kdf = PBKDF2HMAC(
+                algorithm=hashes.SHA256(),
+                length=32,
+                salt=salt,
+                iterations=params.iterations,
+            )
+        with span("kdf", algorithm=params.algorithm):
+            return kdf.derive(password.encode('utf-8'))
+
+    def derive_key(self, password: str, salt: bytes, kdf: KdfParams = None, cache: bool = True):
+        """
+        Returns (key, kdf) for (password, salt), deriving the key only on a cache miss.
+        With kdf=None the parameters of an already cached key for this salt are kept
+        (the session key), otherwise the defaults are used. cache=False always runs
+        the KDF and keeps nothing, for keys needed only once.
+        """
+        if kdf is None or kdf.algorithm == "vault":
+            entry = self._file_keys.get(bytes(salt))
+            if entry is not None or kdf is not None:
+                return self._vault_key(password, entry), KdfParams.vault()
+        if not cache:
+            kdf = kdf or self.default_kdf()
+            return self._run_kdf(password, salt, kdf), kdf
+
+        cache_key = (password, bytes(salt))
+        with self._key_cache_lock:
+            entry = self._key_cache.get(cache_key)
+            if entry is not None:
+                key, cached_kdf, expires = entry
+                if (time.monotonic() < expires or cache_key in self._pinned_keys) and kdf in (None, cached_kdf):
+                    self._key_cache.move_to_end(cache_key)
+                    return key, cached_kdf
+                del self._key_cache[cache_key]
 
-    def _derive_key(self, password: str, salt: bytes) -> bytes:
-        """Derives a 256-bit key from the password using PBKDF2."""
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=self.iterations,
-        )
-        return kdf.derive(password.encode('utf-8'))
+        kdf = kdf or self.default_kdf()
+        key = self._run_kdf(password, salt, kdf)
+        with self._key_cache_lock:
+            self._key_cache[cache_key] = (key, kdf, time.monotonic() + self.key_cache_ttl)
+            for old in list(self._key_cache):
+                if len(self._key_cache) <= self.key_cache_size + len(self._pinned_keys):
+                    break
+                if old not in self._pinned_keys:
+                    del self._key_cache[old]
+        return key, kdf
 
-    def encrypt(self, plain_text: str, password: str) -> bytes:
+    def _vault_key(self, password: str, entry) -> bytes:
+        if entry is None:
+            raise ValueError("The vault of this file is locked")
+        vault, key, _ = entry
+        if not vault.accepts(password):
+            raise WrongPasswordError("Incorrect password")
+        return key
+
+    def _key_check(self, key: bytes) -> bytes:
+        return hmac.new(key, KEY_CHECK_LABEL, hashlib.sha256).digest()[:KEY_CHECK_SIZE]
+
+    def _forget_key(self, password: str, salt: bytes):
+        cache_key = (password, bytes(salt))
+        with self._key_cache_lock:
+            if cache_key not in self._pinned_keys:
+                self._key_cache.pop(cache_key, None)
+
+    def _key_of_fields(self, password: str, fields: dict) -> bytes:
+        """The key a v2 file with these header fields is sealed under."""
+        salt = fields[TAG_SALT]
+        if TAG_VAULT_KEY in fields and salt not in self._file_keys:
+            wrapped = fields[TAG_VAULT_KEY]
+            vault = self.vaults.get(wrapped[:16])
+            if vault is None:
+                raise ValueError("The vault of this file is locked")
+            self._add_file_key(vault, salt, vault.unwrap(wrapped, salt), wrapped)
+        key, _ = self.derive_key(password, salt, self.kdf_of_fields(fields))
+        if not hmac.compare_digest(self._key_check(key), fields[TAG_KEY_CHECK]):
+            # Not kept in the cache: the next try with the same wrong password runs the KDF again
+            self._forget_key(password, salt)
+            raise WrongPasswordError("Incorrect password")
+        return key
+
+    def _add_file_key(self, vault, salt: bytes, key: bytes, wrapped: bytes):
+        with self._key_cache_lock:
+            self._file_keys[bytes(salt)] = (vault, key, wrapped)
+
+    def _sealing_key(self, password: str, salt: bytes, kdf: KdfParams, vault):
         """
-        Encrypts text using AES-GCM.
-        Returns bytes: salt + nonce + ciphertext + tag
+        Returns (key, header fields naming it) for a file sealed under salt. With a
+        vault, a salt that has no data key in it yet gets a new random one.
+        """
+        entry = self._file_keys.get(bytes(salt))
+        if vault is not None and entry is None:
+            key = os.urandom(32)
+            self._add_file_key(vault, salt, key, vault.wrap(key, salt))
+            entry = self._file_keys[bytes(salt)]
+        if entry is not None:
+            key, kdf = self.derive_key(password, salt)
+            return key, {TAG_KDF: kdf.encode(), TAG_VAULT_KEY: entry[2], TAG_KEY_CHECK: self._key_check(key)}
+        key, kdf = self.derive_key(password, salt, kdf)
+        return key, {TAG_KDF: kdf.encode(), TAG_KEY_CHECK: self._key_check(key)}
+
+    def add_vault(self, vault):
+        """Makes the files of an unlocked vault open with its password, without the KDF."""
+        with self._key_cache_lock:
+            self.vaults[vault.vault_id] = vault
+
+    def lock_vault(self, vault):
+        """Forgets the vault and the data keys of its files."""
+        with self._key_cache_lock:
+            self.vaults.pop(vault.vault_id, None)
+            for salt in [salt for salt, entry in self._file_keys.items() if entry[0] is vault]:
+                del self._file_keys[salt]
+
+    def vault_for(self, path: str, password: str):
+        """The unlocked vault that path goes into when saved with password, or None."""
+        folder = os.path.dirname(os.path.abspath(path))
+        for vault in list(self.vaults.values()):
+            if vault.folder == folder and vault.accepts(password):
+                return vault
+        return None
+
+    def vault_of_salt(self, salt: bytes):
+        """The unlocked vault holding the data key of the file sealed under salt, or None."""
+        entry = self._file_keys.get(bytes(salt)) if salt is not None else None
+        return entry[0] if entry is not None else None
+
+    def joins_vault(self, path: str, password: str, salt: bytes) -> bool:
+        """True if saving path with password moves it under a new vault data key."""
+        vault = self.vault_for(path, password)
+        return vault is not None and self.vault_of_salt(salt) is not vault
+
+    def vault_id_of(self, stream):
+        """Returns the id of the vault the encrypted stream belongs to, or None."""
+        peeked = self.peek_header(stream)
+        if peeked is None or TAG_VAULT_KEY not in peeked[1]:
+            return None
+        return peeked[1][TAG_VAULT_KEY][:16]
+
+    def pin_key(self, password: str, salt: bytes):
+        """Keeps the cached key for (password, salt) until unpin_key, forget_key or wipe_keys, whatever the TTL."""
+        cache_key = (password, bytes(salt))
+        with self._key_cache_lock:
+            if cache_key in self._key_cache:
+                self._pinned_keys.add(cache_key)
+
+    def unpin_key(self, password: str, salt: bytes):
+        with self._key_cache_lock:
+            self._pinned_keys.discard((password, bytes(salt)))
+
+    def forget_key(self, password: str, salt: bytes):
+        """Unpins and drops the cached key for (password, salt), when its document is closed or rekeyed."""
+        cache_key = (password, bytes(salt))
+        with self._key_cache_lock:
+            self._pinned_keys.discard(cache_key)
+            self._key_cache.pop(cache_key, None)
+
+    def calibrate_kdf(self, target_seconds: float = 0.5, algorithm: str = "pbkdf2") -> KdfParams:
+        """
+        Picks KDF parameters that take about target_seconds to derive a key on this machine.
+        Measures a small probe and scales it linearly.
         """
         salt = os.urandom(self.salt_size)
-        key = self._derive_key(password, salt)
-        aesgcm = AESGCM(key)
+        if algorithm == "scrypt":
+            probe = KdfParams.scrypt(n=2 ** 14)
+        else:
+            probe = KdfParams.pbkdf2(20000)
+        start = time.perf_counter()
+        self._run_kdf("calibration", salt, probe)
+        elapsed = max(time.perf_counter() - start, 1e-6)
+        scale = target_seconds / elapsed
+
+        if algorithm == "scrypt":
+            # n must be a power of two; cost (and memory, 128 * r * n bytes) grows linearly with n
+            n = probe.n
+            while n * 2 <= probe.n * scale and 128 * probe.r * n * 2 <= MAX_SCRYPT_MEMORY:
+                n *= 2
+            while n > 2 ** 14 and n > probe.n * scale:
+                n //= 2
+            return KdfParams.scrypt(n=n)
+        iterations = int(probe.iterations * scale) // 1000 * 1000
+        return KdfParams.pbkdf2(min(max(iterations, 50000), MAX_PBKDF2_ITERATIONS))
+
+    def wipe_keys(self):
+        """
+        Drops every cached key. Call when the session password changes or the document is closed.
+        Data keys of vault files stay until their vault is locked (see lock_vault).
+        """
+        with self._key_cache_lock:
+            self._key_cache.clear()
+            self._pinned_keys.clear()
+
+    def _build_header(self, fields: dict) -> bytes:
+        body = b"".join(struct.pack(">BH", tag, len(value)) + value for tag, value in fields.items())
+        return MAGIC + bytes([FORMAT_V2]) + struct.pack(">H", len(body)) + body
+
+    def _parse_fields(self, body: bytes) -> dict:
+        fields = {}
+        pos = 0
+        while pos < len(body):
+            if pos + 3 > len(body):
+                raise ValueError("File corrupted: truncated header")
+            tag, length = struct.unpack_from(">BH", body, pos)
+            pos += 3
+            value = bytes(body[pos:pos + length])
+            if len(value) != length:
+                raise ValueError("File corrupted: truncated header")
+            if tag not in (TAG_SALT, TAG_SEGMENT_SIZE, TAG_KDF, TAG_FRAMING, TAG_VAULT_KEY, TAG_CODEC, TAG_KEY_CHECK):
+                raise ValueError(f"Unsupported header field: {tag}")
+            fields[tag] = value
+            pos += length
+
+        if len(fields.get(TAG_SALT, b"")) != self.salt_size or len(fields.get(TAG_SEGMENT_SIZE, b"")) != 4 \
+                or TAG_KDF not in fields or TAG_KEY_CHECK not in fields or TAG_FRAMING not in fields:
+            raise ValueError("File corrupted: missing header fields")
+        segment_size = struct.unpack(">I", fields[TAG_SEGMENT_SIZE])[0]
+        if not 0 < segment_size <= self.max_segment_size:
+            raise ValueError("File corrupted: invalid segment size")
+        if TAG_VAULT_KEY in fields and len(fields[TAG_VAULT_KEY]) != 16 + self.nonce_size + 32 + self.tag_size:
+            raise ValueError("File corrupted: invalid vault key")
+        if len(fields[TAG_KEY_CHECK]) != KEY_CHECK_SIZE:
+            raise ValueError("File corrupted: invalid key check")
+        if TAG_CODEC in fields and self.codec_of_fields(fields) is None:
+            raise ValueError("Unsupported compression")
+        return fields
+
+    def _read_header(self, stream, prefix: bytes = b""):
+        """Reads a v2 header (optionally after an already consumed prefix). Returns (raw_header, fields)."""
+        fixed = prefix + stream.read(len(MAGIC) + 3 - len(prefix))
+        if len(fixed) < len(MAGIC) + 3 or not self.is_v2(fixed):
+            raise ValueError("Not an AeTxt v2 file")
+        body_len = struct.unpack(">H", fixed[len(MAGIC) + 1:])[0]
+        body = stream.read(body_len)
+        if len(body) != body_len:
+            raise ValueError("File corrupted: truncated header")
+        return fixed + body, self._parse_fields(body)
+
+    def codec_of_fields(self, fields: dict):
+        """The compression.Codec of a file's segments, or None if they are not compressed."""
+        if TAG_CODEC not in fields:
+            return None
+        codec = get_codec(fields[TAG_CODEC][0]) if len(fields[TAG_CODEC]) == 1 else None
+        if codec is not None and self.codec is not None and self.codec.codec_id == codec.codec_id:
+            # Re-sealed segments use the configured level
+            return self.codec
+        return codec
+
+    def _max_sealed(self, segment_size: int, codec) -> int:
+        # Segments re-sealed by an incremental save may grow up to twice the nominal size,
+        # and compressing incompressible data adds a little on top
+        slack = segment_size // 64 + 1024 if codec is not None else 0
+        return 2 * segment_size + self.tag_size + slack
+
+    def _decompress(self, codec, data, segment_size: int) -> bytes:
+        with span("decompress", bytes=len(data)):
+            return codec.decompress(data, 2 * segment_size)
+
+    def kdf_of_fields(self, fields: dict) -> KdfParams:
+        return KdfParams.decode(fields[TAG_KDF])
+
+    def is_v2(self, file_data: bytes) -> bool:
+        return file_data[:len(MAGIC)] == MAGIC and file_data[len(MAGIC):len(MAGIC) + 1] == bytes([FORMAT_V2])
+
+    def peek_salt(self, stream):
+        """Returns the salt of the encrypted stream without consuming it, or None if it can't be read."""
+        start = stream.tell()
+        try:
+            prefix = stream.read(len(MAGIC) + 1)
+            if self.is_v2(prefix):
+                _, fields = self._read_header(stream, prefix)
+                return fields[TAG_SALT]
+            salt = prefix + stream.read(self.salt_size - len(prefix))
+            if len(salt + stream.read(self.nonce_size)) < self.salt_size + self.nonce_size:
+                return None
+            return salt
+        except ValueError:
+            return None
+        finally:
+            stream.seek(start)
+
+    def peek_header(self, stream):
+        """Returns (raw_header, fields) of a v2 stream without consuming it, or None."""
+        start = stream.tell()
+        try:
+            return self._read_header(stream)
+        except ValueError:
+            return None
+        finally:
+            stream.seek(start)
+
+    def salt_of(self, file_data: bytes):
+        """Returns the salt stored in an encrypted blob, or None if it can't be read."""
+        return self.peek_salt(io.BytesIO(file_data))
+
+    def _segment_aad(self, header: bytes, counter: int, last: bool) -> bytes:
+        return header + struct.pack(">IB", counter, 1 if last else 0)
+
+    def _seal_framed(self, aesgcm, header: bytes, counter: int, last: bool, data) -> bytes:
         nonce = os.urandom(self.nonce_size)
-        
-        data = plain_text.encode('utf-8')
-        ciphertext = aesgcm.encrypt(nonce, data, None) # Tag is included in ciphertext by cryptography library
-        
-        return salt + nonce + ciphertext
+        with span("aes-gcm seal", bytes=len(data)):
+            ciphertext = aesgcm.encrypt(nonce, data, self._segment_aad(header, counter, last))
+        return struct.pack(">I", len(ciphertext)) + nonce + ciphertext
+
+    def segment_sealer(self, header: bytes, password: str):
+        """
+        Returns seal(counter, last, data) -> framed segment for an existing v2 header,
+        used to re-seal single segments of a file.
+        """
+        _, fields = self._read_header(io.BytesIO(header))
+        aesgcm = AESGCM(self._key_of_fields(password, fields))
+        codec = self.codec_of_fields(fields)
+        if codec is None:
+            return lambda counter, last, data: self._seal_framed(aesgcm, header, counter, last, data)
+
+        def seal(counter, last, data):
+            with span("compress", bytes=len(data)):
+                data = codec.compress(data, codec.level)
+            return self._seal_framed(aesgcm, header, counter, last, data)
+        return seal
+
+    def _char_boundary(self, data, cut: int, start: int) -> int:
+        """Moves cut back (at most 3 bytes) so it doesn't split a UTF-8 character."""
+        lowest = max(start + 1, cut - 3)
+        while cut > lowest and data[cut] & 0xC0 == 0x80:
+            cut -= 1
+        return cut
+
+    def encrypt_stream(self, chunks, password: str, salt: bytes = None, segment_size: int = None,
+                       kdf: KdfParams = None, segments: list = None, vault=None, compress: bool = True):
+        """
+        Encrypts an iterable of byte chunks into the framed v2 format.
+        Yields the header followed by one sealed segment at a time, so memory stays
+        bounded by the segment size no matter how large the input is.
+        The KDF parameters are recorded in the header.
+        If segments is a list, (char_count, sealed_size) is appended for every segment.
+        With an unlocked vault the file is sealed under a vault data key instead;
+        a salt that already has one keeps it.
+        With self.codec set (and compress), segments are compressed unless a sample
+        of the input shows it does not compress (the header records which it is).
+        """
+        if salt is None:
+            salt = os.urandom(self.salt_size)
+        segment_size = segment_size or self.segment_size
+        key, key_fields = self._sealing_key(password, salt, kdf, vault)
+        chunks = iter(chunks)
+        head = []
+        codec = self.codec if compress else None
+        if codec is not None:
+            # Decided before the header is written, from the start of the input
+            sample = bytearray()
+            for chunk in chunks:
+                head.append(chunk)
+                sample += chunk[:SAMPLE_SIZE - len(sample)]
+                if len(sample) >= SAMPLE_SIZE:
+                    break
+            with span("compression sample"):
+                if not codec.worth_it(sample):
+                    codec = None
+        codec_fields = {TAG_CODEC: bytes([codec.codec_id])} if codec is not None else {}
+        header = self._build_header({
+            TAG_SALT: salt,
+            TAG_SEGMENT_SIZE: struct.pack(">I", segment_size),
+            **key_fields,
+            **codec_fields,
+            TAG_FRAMING: b"",
+        })
+        aesgcm = AESGCM(key)
+        yield header
+
+        def seal(data, last):
+            sealed = data
+            if codec is not None:
+                with span("compress", bytes=len(data)):
+                    sealed = codec.compress(data, codec.level)
+            record = self._seal_framed(aesgcm, header, counter, last, sealed)
+            if segments is not None:
+                segments.append((utf8_char_count(data), len(record)))
+            return record
+
+        counter = 0
+        pending = bytearray()
+        for chunk in itertools.chain(head, chunks):
+            pending += chunk
+            start = 0
+            # Only seal what is certainly not the final segment
+            while len(pending) - start > segment_size:
+                cut = self._char_boundary(pending, start + segment_size, start)
+                yield seal(bytes(pending[start:cut]), False)
+                counter += 1
+                start = cut
+            del pending[:start]
+
+        # The final segment is always written, even if empty, so truncation is detectable
+        yield seal(bytes(pending), True)
+
+    def iter_segments(self, stream, password: str):
+        """
+        Decrypts a binary stream segment by segment.
+        Yields (plaintext, offset, sealed_size) with the segment's position in the stream.
+        v1 files have no segments and are decrypted in one piece.
+        """
+        prefix = stream.read(len(MAGIC) + 1)
+        if not self.is_v2(prefix):
+            data = prefix + stream.read()
+            yield self._decrypt_v1(data, password), 0, len(data)
+            return
+
+        header, fields = self._read_header(stream, prefix)
+        segment_size = struct.unpack(">I", fields[TAG_SEGMENT_SIZE])[0]
+        aesgcm = AESGCM(self._key_of_fields(password, fields))
+        yield from self._iter_framed(stream, aesgcm, header, segment_size, self.codec_of_fields(fields))
+
+    def _iter_framed(self, stream, aesgcm, header, segment_size, codec):
+        max_sealed = self._max_sealed(segment_size, codec)
+
+        def read_record():
+            length = stream.read(4)
+            if not length:
+                return None
+            if len(length) < 4:
+                raise ValueError("File corrupted or truncated")
+            size = struct.unpack(">I", length)[0]
+            if not self.tag_size <= size <= max_sealed:
+                raise ValueError("File corrupted: invalid segment length")
+            body = stream.read(self.nonce_size + size)
+            if len(body) != self.nonce_size + size:
+                raise ValueError("File corrupted or truncated")
+            return body
+
+        offset = len(header)
+        counter = 0
+        record = read_record()
+        if record is None:
+            raise ValueError("File corrupted or truncated")
+        while True:
+            following = read_record()
+            last = following is None
+            nonce, ciphertext = record[:self.nonce_size], record[self.nonce_size:]
+            with _authenticating(True):
+                plaintext = aesgcm.decrypt(nonce, ciphertext, self._segment_aad(header, counter, last))
+            if codec is not None:
+                plaintext = self._decompress(codec, plaintext, segment_size)
+            yield plaintext, offset, 4 + len(record)
+            if last:
+                return
+            offset += 4 + len(record)
+            record = following
+            counter += 1
+
+    def iter_sealed(self, data, password: str):
+        """
+        Walks an encrypted buffer (bytes, bytearray, mmap, ...) without copying it.
+        Yields (aesgcm, nonce, sealed, aad, offset, size) per segment, where sealed is a
+        memoryview of the ciphertext and tag inside data. Structure errors raise ValueError.
+        Compressed segments must be opened with segment_opener, not decrypt_into.
+        """
+        view = memoryview(data)
+        if not self.is_v2(bytes(view[:len(MAGIC) + 1])):
+            if len(view) < self.salt_size + self.nonce_size + self.tag_size:
+                raise ValueError("File corrupted or too short")
+            key, _ = self.derive_key(password, bytes(view[:self.salt_size]), KdfParams.pbkdf2(LEGACY_ITERATIONS))
+            body = self.salt_size + self.nonce_size
+            yield AESGCM(key), bytes(view[self.salt_size:body]), view[body:], None, 0, len(view)
+            return
+
+        # The header is at most 64 KB; it is the only part that gets copied
+        header, fields = self._read_header(io.BytesIO(view[:len(MAGIC) + 3 + 0xFFFF]))
+        segment_size = struct.unpack(">I", fields[TAG_SEGMENT_SIZE])[0]
+        aesgcm = AESGCM(self._key_of_fields(password, fields))
+        offset = len(header)
+        counter = 0
+        if offset == len(view):
+            raise ValueError("File corrupted or truncated")
+
+        max_sealed = self._max_sealed(segment_size, self.codec_of_fields(fields))
+        while offset < len(view):
+            if offset + 4 + self.nonce_size > len(view):
+                raise ValueError("File corrupted or truncated")
+            size = struct.unpack(">I", view[offset:offset + 4])[0]
+            if not self.tag_size <= size <= max_sealed:
+                raise ValueError("File corrupted: invalid segment length")
+            end = offset + 4 + self.nonce_size + size
+            if end > len(view):
+                raise ValueError("File corrupted or truncated")
+            nonce = bytes(view[offset + 4:offset + 4 + self.nonce_size])
+            last = end == len(view)
+            yield (aesgcm, nonce, view[offset + 4 + self.nonce_size:end],
+                   self._segment_aad(header, counter, last), offset, end - offset)
+            offset = end
+            counter += 1
+
+    def key_checked(self, data) -> bool:
+        """True if the encrypted buffer has a key check (v2), so failing segments mean damage, not a wrong password."""
+        return self.is_v2(bytes(memoryview(data)[:len(MAGIC) + 1]))
+
+    def decrypt_into(self, aesgcm, nonce: bytes, sealed, aad, out, checked: bool = False) -> int:
+        """
+        Opens one sealed segment straight into the writable buffer out.
+        Returns the plaintext length. Falls back to a copy on cryptography
+        versions without AESGCM.decrypt_into. Pass checked=key_checked(data).
+        """
+        length = len(sealed) - self.tag_size
+        with span("aes-gcm open", bytes=length), _authenticating(checked):
+            if hasattr(aesgcm, "decrypt_into"):
+                aesgcm.decrypt_into(nonce, sealed, aad, out[:length])
+            else:
+                out[:length] = aesgcm.decrypt(nonce, sealed, aad)
+        return length
+
+    def segment_opener(self, data):
+        """
+        Returns open(aesgcm, nonce, sealed, aad) -> plaintext for the segments of
+        an encrypted buffer whose segments are compressed, or None if they hold
+        plain UTF-8 (and decrypt_into can open them in place).
+        """
+        view = memoryview(data)
+        if not self.is_v2(bytes(view[:len(MAGIC) + 1])):
+            return None
+        _, fields = self._read_header(io.BytesIO(view[:len(MAGIC) + 3 + 0xFFFF]))
+        codec = self.codec_of_fields(fields)
+        if codec is None:
+            return None
+        segment_size = struct.unpack(">I", fields[TAG_SEGMENT_SIZE])[0]
+
+        def open_segment(aesgcm, nonce, sealed, aad):
+            with span("aes-gcm open", bytes=len(sealed) - self.tag_size), _authenticating(True):
+                data = aesgcm.decrypt(nonce, sealed, aad)
+            return self._decompress(codec, data, segment_size)
+        return open_segment
+
+    def decrypt_buffer(self, data, password: str) -> bytearray:
+        """
+        Buffer-in/buffer-out decrypt: plaintext of data (any bytes-like object,
+        e.g. an mmap) as one bytearray, without intermediate copies.
+        """
+        segments = list(self.iter_sealed(data, password))
+        open_segment = self.segment_opener(data)
+        if open_segment is not None:
+            # Plaintext sizes are only known once decompressed
+            out = bytearray()
+            for aesgcm, nonce, sealed, aad, _, _ in segments:
+                out += open_segment(aesgcm, nonce, sealed, aad)
+            return out
+        checked = self.key_checked(data)
+        out = bytearray(sum(len(segment[2]) - self.tag_size for segment in segments))
+        target = memoryview(out)
+        pos = 0
+        for aesgcm, nonce, sealed, aad, _, _ in segments:
+            pos += self.decrypt_into(aesgcm, nonce, sealed, aad, target[pos:], checked)
+        return out
+
+    def encrypt_buffer(self, data, password: str, salt: bytes = None, segment_size: int = None,
+                       kdf: KdfParams = None) -> bytearray:
+        """
+        Buffer-in/buffer-out encrypt of UTF-8 data into the framed v2 format.
+        Segments are sealed straight into one preallocated bytearray.
+        """
+        view = memoryview(data)
+        if salt is None:
+            salt = os.urandom(self.salt_size)
+        segment_size = segment_size or self.segment_size
+        if self.codec is not None:
+            # Sealed sizes are only known once compressed
+            return bytearray(b"".join(self.encrypt_stream([view], password, salt, segment_size, kdf)))
+        key, key_fields = self._sealing_key(password, salt, kdf, None)
+        header = self._build_header({
+            TAG_SALT: salt,
+            TAG_SEGMENT_SIZE: struct.pack(">I", segment_size),
+            **key_fields,
+            TAG_FRAMING: b"",
+        })
+        aesgcm = AESGCM(key)
+
+        cuts = [0]
+        while len(view) - cuts[-1] > segment_size:
+            cuts.append(self._char_boundary(view, cuts[-1] + segment_size, cuts[-1]))
+        cuts.append(len(view))
+        record_overhead = 4 + self.nonce_size + self.tag_size
+        out = bytearray(len(header) + len(view) + (len(cuts) - 1) * record_overhead)
+        out[:len(header)] = header
+        target = memoryview(out)
+        pos = len(header)
+        for counter in range(len(cuts) - 1):
+            start, end = cuts[counter], cuts[counter + 1]
+            last = counter == len(cuts) - 2
+            nonce = os.urandom(self.nonce_size)
+            aad = self._segment_aad(header, counter, last)
+            sealed_len = end - start + self.tag_size
+            struct.pack_into(">I", out, pos, sealed_len)
+            target[pos + 4:pos + 4 + self.nonce_size] = nonce
+            body = target[pos + 4 + self.nonce_size:pos + 4 + self.nonce_size + sealed_len]
+            with span("aes-gcm seal", bytes=end - start):
+                if hasattr(aesgcm, "encrypt_into"):
+                    aesgcm.encrypt_into(nonce, view[start:end], aad, body)
+                else:
+                    body[:] = aesgcm.encrypt(nonce, view[start:end], aad)
+            pos += 4 + self.nonce_size + sealed_len
+        return out
+
+    def decrypt_stream(self, stream, password: str):
+        """
+        Decrypts a binary stream, yielding plaintext bytes one segment at a time.
+        v1 files have no segments and are decrypted in one piece.
+        """
+        for plaintext, _, _ in self.iter_segments(stream, password):
+            yield plaintext
+
+    def decrypt_text_stream(self, stream, password: str):
+        """Like decrypt_stream, but yields str pieces (multi-byte characters may span segments)."""
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        for data in self.decrypt_stream(stream, password):
+            text = decoder.decode(data)
+            if text:
+                yield text
+        decoder.decode(b"", final=True)
+
+    def encrypt(self, plain_text: str, password: str, salt: bytes = None, compress: bool = True) -> bytes:
+        """
+        Encrypts text using AES-GCM into the v2 segmented format.
+
+        Pass the salt of the previously saved/opened blob to keep the session salt;
+        only the nonces are regenerated and the cached key is reused.
+        """
+        with span("encrypt", chars=len(plain_text)):
+            return b"".join(self.encrypt_stream(iter_utf8(plain_text), password, salt, compress=compress))
 
     def decrypt(self, file_data: bytes, password: str) -> str:
+        """Decrypts a v1 or v2 blob produced by encrypt."""
+        with span("decrypt", bytes=len(file_data)):
+            return self.decrypt_buffer(file_data, password).decode('utf-8')
+
+    def _decrypt_v1(self, file_data: bytes, password: str) -> bytes:
         """
         Decrypts data using AES-GCM.
         Expects bytes: salt + nonce + ciphertext + tag
@@ -47,8 +829,8 @@ class CryptoHandler:
         nonce = file_data[self.salt_size : self.salt_size + self.nonce_size]
         ciphertext = file_data[self.salt_size + self.nonce_size:]
 
-        key = self._derive_key(password, salt)
+        key, _ = self.derive_key(password, salt, KdfParams.pbkdf2(LEGACY_ITERATIONS))
         aesgcm = AESGCM(key)
         
-        decrypted_data = aesgcm.decrypt(nonce, ciphertext, None)
-        return decrypted_data.decode('utf-8')
+        with span("aes-gcm open", bytes=len(ciphertext)):
+            return aesgcm.decrypt(nonce, ciphertext, None)
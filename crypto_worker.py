@@ -0,0 +1,281 @@
+import os
+import time
+import importlib
+from collections import deque
+from PyQt6.QtCore import QCoreApplication, QEvent, QObject, QRunnable, QThreadPool, pyqtSignal
+from tracing import span
+
+
+class CryptoCancelled(Exception):
+    """Raised inside a running task when the user cancels it."""
+
+
+# Work functions. These run on a pool thread: they must not touch any widget,
+# only the arguments they are given. `progress(done, total)` reports progress
+# and raises CryptoCancelled if the task was cancelled; `progress(done, total, partial)`
+# also hands a partial result to the submitter's on_partial callback.
+#
+# file_io (and with it the cryptography backend) is imported on first use, not
+# at startup; preload does that on a pool thread once the window is up.
+
+def preload(progress):
+    """Imports the crypto modules ahead of the first open/save."""
+    for name in ("file_io", "journal", "crypto_handler"):
+        importlib.import_module(name)
+
+def decrypt_file(crypto, file_name, password, progress):
+    """
+    Decrypts a file segment by segment and replays its autosave journal.
+    Returns (text, salt, segment_map, journal, recovered_edits).
+    """
+    from file_io import load_segments
+    from journal import Journal, apply_ops, editor_text
+    text, salt, segment_map = load_segments(crypto, file_name, password, progress)
+    normalized = editor_text(text)
+    if len(normalized) != len(text):
+        # CRLF became "\n": the segments no longer line up with the text
+        segment_map = None
+    text = normalized
+    journal, ops = Journal.recover(crypto, file_name, password, salt)
+    if ops:
+        text = apply_ops(text, ops, segment_map)
+    return text, salt, segment_map, journal, len(ops)
+
+
+def encrypt_to_file(crypto, file_name, text, password, salt, journal, seq, progress):
+    """
+    Encrypts text and atomically replaces file_name with it, then starts a new
+    autosave journal (if given) after edit seq. Returns (salt, segment_map).
+    """
+    from file_io import save_full
+    salt, segment_map = save_full(crypto, file_name, text, password, salt, progress)
+    if journal:
+        journal.rebase(crypto, file_name, password, salt, seq)
+    return salt, segment_map
+
+
+def save_segments(crypto, segment_map, text, password, entries, new_map, journal, seq, progress):
+    """Incremental save planned by SegmentMap.plan. Returns the number of re-sealed segments."""
+    sealed = segment_map.write_incremental(crypto, text, password, entries, new_map, progress)
+    if journal:
+        journal.rebase(crypto, segment_map.path, password, segment_map.salt, seq)
+    return sealed
+
+
+def append_journal(crypto, journal, password, ops, progress):
+    """Appends captured edits to the autosave journal. Returns its size in bytes."""
+    return journal.append(crypto, password, ops, progress)
+
+
+def seal_text(crypto, text, password, salt, progress):
+    """
+    Encrypts text for a hidden or parked document. Returns (sealed, salt); sealed
+    is a complete encrypted file, so a hidden document is saved as it is.
+    """
+    progress(0, len(text))
+    # Not compressed: the panic button waits for this
+    sealed = crypto.encrypt(text, password, salt=salt, compress=False)
+    progress(len(text), len(text))
+    return sealed, crypto.salt_of(sealed)
+
+
+def unseal_text(crypto, sealed, password, progress):
+    """Reverses seal_text. Returns (text, salt)."""
+    progress(0, len(sealed))
+    text = crypto.decrypt(sealed, password)
+    progress(len(sealed), len(sealed))
+    return text, crypto.salt_of(sealed)
+
+
+def write_sealed(crypto, file_name, sealed, progress):
+    """Atomically replaces file_name with an already sealed text. Returns its salt."""
+    from file_io import atomic_write
+    progress(0, len(sealed))
+    atomic_write(file_name, [sealed])
+    progress(len(sealed), len(sealed))
+    return crypto.salt_of(sealed)
+
+
+def calibrate(crypto, target_seconds, algorithm, progress):
+    """Returns KdfParams that take about target_seconds to derive on this machine."""
+    return crypto.calibrate_kdf(target_seconds, algorithm)
+
+
+def index_document(crypto, index, password, file_name, text, progress):
+    """Updates the folder search index with the words of a saved file."""
+    index.update(crypto, password, file_name, text)
+
+
+def build_search_index(crypto, index, password, progress):
+    """
+    Indexes every .aetxt file of the index's folder that opens with password.
+    Returns (indexed, skipped).
+    """
+    from file_io import load_segments
+    names = sorted(name for name in os.listdir(index.folder) if name.endswith(".aetxt"))
+    skipped = []
+
+    def documents():
+        for done, name in enumerate(names):
+            progress(done, len(names))
+            path = os.path.join(index.folder, name)
+            try:
+                text, _, _ = load_segments(crypto, path, password, lambda done, total: None)
+            except Exception:
+                # Another password, or not readable: leave it out
+                skipped.append(name)
+                continue
+            yield path, text
+
+    index.rebuild(crypto, password, documents())
+    return len(names) - len(skipped), len(skipped)
+
+
+def search_folder(crypto, index, password, query, progress):
+    """Returns (matching paths, seconds taken)."""
+    start = time.perf_counter()
+    paths = index.search(crypto, password, query)
+    return paths, time.perf_counter() - start
+
+
+def unlock_vault(crypto, vault, password, create, progress):
+    """Unlocks (or with create, starts) the vault of a folder and registers it with crypto."""
+    if create:
+        vault.create(crypto, password)
+    else:
+        vault.unlock(crypto, password)
+    crypto.add_vault(vault)
+
+
+def change_vault_password(crypto, vault, password, progress):
+    """Rewraps the vault's master key for a new password; its files stay as they are."""
+    vault.change_password(crypto, password)
+
+
+class CryptoTaskSignals(QObject):
+    progress = pyqtSignal(int, int)
+    partial = pyqtSignal(object)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+    cancelled = pyqtSignal()
+
+
+class CryptoTask(QRunnable):
+    def __init__(self, fn, args, label):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.fn = fn
+        self.args = args
+        self.label = label
+        self.signals = CryptoTaskSignals()
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def report(self, done, total, partial=None):
+        if self._cancelled:
+            raise CryptoCancelled()
+        self.signals.progress.emit(done, total)
+        if partial is not None:
+            self.signals.partial.emit(partial)
+
+    def run(self):
+        try:
+            self.report(0, 0)
+            with span(self.fn.__name__):
+                result = self.fn(*self.args, progress=self.report)
+        except CryptoCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(e)
+        else:
+            self.signals.finished.emit(result)
+
+
+class CryptoService(QObject):
+    """
+    Runs key derivation, AES-GCM and other long work (search, indexing) on a thread pool.
+    Tasks submitted for the same document run one after another, in order.
+    """
+    task_started = pyqtSignal(str)
+    task_progress = pyqtSignal(str, int, int)
+    idle = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self._queues = {}
+        self._running = {}
+
+    def submit(self, doc, fn, *args, label="Working", on_finished=None, on_failed=None, on_cancelled=None,
+               on_partial=None):
+        task = CryptoTask(fn, args, label)
+        task.signals.progress.connect(lambda done, total: self.task_progress.emit(label, done, total))
+        if on_partial:
+            task.signals.partial.connect(on_partial)
+        if on_finished:
+            task.signals.finished.connect(on_finished)
+        if on_failed:
+            task.signals.failed.connect(on_failed)
+        if on_cancelled:
+            task.signals.cancelled.connect(on_cancelled)
+        for signal in (task.signals.finished, task.signals.failed, task.signals.cancelled):
+            signal.connect(lambda *_: self._task_done(doc, task))
+
+        self._queues.setdefault(doc, deque()).append(task)
+        self._start_next(doc)
+        return task
+
+    def _start_next(self, doc):
+        if doc in self._running:
+            return
+        queue = self._queues.get(doc)
+        if not queue:
+            self._queues.pop(doc, None)
+            if not self._running:
+                self.idle.emit()
+            return
+        task = queue.popleft()
+        self._running[doc] = task
+        self.task_started.emit(task.label)
+        self.pool.start(task)
+
+    def _task_done(self, doc, task):
+        if self._running.get(doc) is task:
+            del self._running[doc]
+        self._start_next(doc)
+
+    def is_busy(self, doc=None):
+        if doc is None:
+            return bool(self._running)
+        return doc in self._running or bool(self._queues.get(doc))
+
+    def cancel(self, doc=None):
+        """Cancels the running and queued tasks of doc (or of every document)."""
+        docs = list(self._running) + list(self._queues) if doc is None else [doc]
+        for d in docs:
+            queue = self._queues.pop(d, deque())
+            for task in queue:
+                task.signals.cancelled.emit()
+            running = self._running.get(d)
+            if running:
+                running.cancel()
+
+    def wait(self, msecs=-1):
+        """
+        Blocks until every running and queued task is done (or msecs passed).
+        Returns False on timeout. Callbacks of finished tasks run in here.
+        """
+        deadline = time.monotonic() + msecs / 1000 if msecs >= 0 else None
+        while True:
+            left = -1 if deadline is None else max(0, int((deadline - time.monotonic()) * 1000))
+            if not self.pool.waitForDone(left):
+                return False
+            # A task's end reaches _task_done as a queued call, and only that starts the
+            # next task of its document; deliver them here, the event loop may not be running
+            QCoreApplication.sendPostedEvents(None, QEvent.Type.MetaCall)
+            if not self._running and not self._queues:
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
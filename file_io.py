@@ -0,0 +1,344 @@
+import os
+import re
+import io
+import mmap
+import stat
+import bisect
+import struct
+import tempfile
+from itertools import accumulate
+from tracing import span
+from crypto_handler import iter_utf8, utf8_char_count, TAG_SALT, TAG_SEGMENT_SIZE
+
+# Qt reports positions in UTF-16 code units, Python strings count code points.
+# They only differ for characters outside the BMP; such documents are saved in full.
+_ASTRAL = re.compile("[\U00010000-\U0010FFFF]")
+
+# How much of a mapped file is decrypted before its pages are released again
+_RELEASE_STEP = 16 * 1024 * 1024
+
+
+def atomic_write(path, pieces):
+    """
+    Writes an iterable of byte pieces to path without ever leaving a partial file:
+    the data goes to a temporary file in the same directory, is fsynced, and then
+    renamed over path. If anything fails (or is cancelled) the old file is untouched.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix="." + os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            # pieces are usually produced lazily (sealed as they are written), so
+            # each write is timed on its own to tell the disk from the cipher
+            for piece in pieces:
+                with span("disk write", bytes=len(piece)):
+                    f.write(piece)
+            with span("fsync"):
+                f.flush()
+                os.fsync(f.fileno())
+        with span("rename"):
+            if os.path.exists(path):
+                os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode))
+            os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    with span("fsync", directory=True):
+        _fsync_directory(directory)
+
+
+def _fsync_directory(directory):
+    # Makes the rename itself durable. Not possible (nor needed) on Windows.
+    if os.name != "posix":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _disk_stamp(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+class StaleSegmentMap(Exception):
+    """The file changed on disk since its segment map was recorded."""
+
+
+class SavedSegment:
+    __slots__ = ("char_len", "offset", "size", "dirty")
+
+    def __init__(self, char_len, offset=None, size=None):
+        self.char_len = char_len
+        self.offset = offset
+        self.size = size
+        self.dirty = False
+
+
+class SegmentMap:
+    """
+    Layout of a saved framed file: how many characters each segment holds and
+    where its sealed bytes are on disk. Editor changes are fed in through
+    on_contents_change, so at save time only the dirty segments need to be
+    re-encrypted; the others are copied from the old file as they are.
+    """
+
+    def __init__(self, path, header, fields, segments):
+        self.path = path
+        self.header = header
+        self.salt = fields[TAG_SALT]
+        self.segment_size = struct.unpack(">I", fields[TAG_SEGMENT_SIZE])[0]
+        self.segments = segments
+        self.valid = True
+        self.disk_stamp = None
+
+    @classmethod
+    def from_records(cls, crypto, path, header, records):
+        """Builds a map from (char_count, offset, sealed_size) records of a framed file."""
+        _, fields = crypto.peek_header(io.BytesIO(header))
+        segments = [SavedSegment(char_len, offset, size) for char_len, offset, size in records]
+        segment_map = cls(path, header, fields, segments)
+        segment_map.disk_stamp = _disk_stamp(path)
+        return segment_map
+
+    def __len__(self):
+        return sum(seg.char_len for seg in self.segments)
+
+    def on_contents_change(self, pos, removed, added):
+        """Applies an editor change (QTextDocument.contentsChange) to the segment lengths."""
+        if not self.valid or not self.segments:
+            return
+        ends = list(accumulate(seg.char_len for seg in self.segments))
+        if pos < 0 or pos + removed > ends[-1]:
+            self.valid = False
+            return
+
+        last_index = len(self.segments) - 1
+        # Pure insertions at a boundary extend the segment before it
+        if removed:
+            first = min(bisect.bisect_right(ends, pos), last_index)
+        else:
+            first = min(bisect.bisect_left(ends, pos), last_index)
+        last = max(first, min(bisect.bisect_left(ends, pos + removed), last_index))
+
+        first_seg = self.segments[first]
+        if first == last:
+            first_seg.char_len += added - removed
+        else:
+            last_seg = self.segments[last]
+            first_seg.char_len = pos - (ends[first] - first_seg.char_len) + added
+            last_seg.char_len = ends[last] - (pos + removed)
+            for seg in self.segments[first + 1:last]:
+                seg.char_len = 0
+        for seg in self.segments[first:last + 1]:
+            seg.dirty = True
+
+    def plan(self, text):
+        """
+        Works out an incremental save of text over this map's file.
+        Returns (entries, new_map), where entries lists per new segment either
+        ("copy", old_segment) or ("seal", char_start, char_len), or None when a full
+        save is needed. new_map takes over change tracking right away.
+        """
+        if not self.valid or len(self) != len(text) or _ASTRAL.search(text):
+            return None
+
+        # (old_index or None, char_start, char_len) for every segment of the new file
+        units = []
+        start = 0
+        for old_index, seg in enumerate(self.segments):
+            if seg.char_len == 0:
+                continue
+            if not seg.dirty:
+                units.append((old_index, start, seg.char_len))
+            elif len(text[start:start + seg.char_len].encode('utf-8')) <= 2 * self.segment_size:
+                units.append((None, start, seg.char_len))
+            else:
+                # Grew too large: split into parts of about segment_size bytes
+                parts = -(-len(text[start:start + seg.char_len].encode('utf-8')) // self.segment_size)
+                step = -(-seg.char_len // parts)
+                for part_start in range(start, start + seg.char_len, step):
+                    units.append((None, part_start, min(step, start + seg.char_len - part_start)))
+            start += seg.char_len
+        if not units:
+            units.append((None, 0, 0))
+
+        old_last = len(self.segments) - 1
+        entries = []
+        new_segments = []
+        for index, (old_index, char_start, char_len) in enumerate(units):
+            last = index == len(units) - 1
+            # A segment can only be reused if its index and final flag are unchanged
+            if old_index == index and last == (old_index == old_last):
+                entries.append(("copy", self.segments[old_index]))
+            else:
+                entries.append(("seal", char_start, char_len))
+            new_segments.append(SavedSegment(char_len))
+
+        new_map = SegmentMap(self.path, self.header, {TAG_SALT: self.salt,
+                                                      TAG_SEGMENT_SIZE: struct.pack(">I", self.segment_size)},
+                             new_segments)
+        return entries, new_map
+
+    def write_incremental(self, crypto, text, password, entries, new_map, progress):
+        """
+        Writes the planned save atomically: copied segments are read from the old
+        file, sealed ones are encrypted from text. Fills in new_map's offsets.
+        Returns the number of re-sealed segments.
+        """
+        if not os.path.exists(self.path) or _disk_stamp(self.path) != self.disk_stamp:
+            raise StaleSegmentMap(self.path)
+        seal = crypto.segment_sealer(self.header, password)
+        sealed_count = sum(1 for entry in entries if entry[0] == "seal")
+
+        def pieces():
+            with open(self.path, 'rb') as old:
+                yield self.header
+                offset = len(self.header)
+                for index, (entry, new_seg) in enumerate(zip(entries, new_map.segments)):
+                    if entry[0] == "copy":
+                        with span("disk read", bytes=entry[1].size):
+                            old.seek(entry[1].offset)
+                            data = old.read(entry[1].size)
+                        if len(data) != entry[1].size:
+                            raise StaleSegmentMap(self.path)
+                    else:
+                        _, char_start, char_len = entry
+                        plain = text[char_start:char_start + char_len].encode('utf-8')
+                        data = seal(index, index == len(entries) - 1, plain)
+                    new_seg.offset = offset
+                    new_seg.size = len(data)
+                    offset += len(data)
+                    progress(index + 1, len(entries))
+                    yield data
+
+        atomic_write(self.path, pieces())
+        new_map.disk_stamp = _disk_stamp(self.path)
+        return sealed_count
+
+
+def save_full(crypto, path, text, password, salt, progress):
+    """
+    Encrypts text into path atomically. Returns (salt, segment_map) where the map
+    describes the new file for later incremental saves (None for text outside the BMP).
+    In the folder of an unlocked vault, a file saved with the vault password is
+    sealed under a vault data key (see vault.py).
+    """
+    if salt is None or crypto.joins_vault(path, password, salt):
+        salt = os.urandom(crypto.salt_size)
+    records = []
+    chunk_chars = 64 * 1024
+
+    def chunks():
+        done = 0
+        for chunk in iter_utf8(text, chunk_chars):
+            yield chunk
+            done = min(done + chunk_chars, len(text))
+            progress(done, len(text))
+
+    pieces = crypto.encrypt_stream(chunks(), password, salt=salt, segments=records,
+                                   vault=crypto.vault_for(path, password))
+    header = next(pieces)
+
+    def all_pieces():
+        yield header
+        yield from pieces
+
+    progress(0, len(text))
+    atomic_write(path, all_pieces())
+
+    if _ASTRAL.search(text):
+        return salt, None
+    offset = len(header)
+    layout = []
+    for char_count, size in records:
+        layout.append((char_count, offset, size))
+        offset += size
+    return salt, SegmentMap.from_records(crypto, path, header, layout)
+
+
+def load_segments(crypto, path, password, progress):
+    """
+    Decrypts path. Returns (text, salt, segment_map); the map is None for v1
+    files (they get one on their next save) and for text outside the BMP.
+
+    The file is memory-mapped and each segment is decrypted from the mapping
+    straight into one plaintext buffer, so besides the page cache only the
+    plaintext and the decoded text are held at the same time.
+    """
+    total = os.path.getsize(path)
+    # Pages are read on first touch, so the disk time of a mapped file shows up
+    # in the "aes-gcm open" spans; "disk read" only covers the header
+    with span("disk read"), open(path, 'rb') as f:
+        salt = crypto.peek_salt(f)
+        peeked = crypto.peek_header(f)
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        progress(0, total)
+        plaintext, records = _decrypt_mapped(crypto, mapped, password, progress)
+    finally:
+        try:
+            mapped.close()
+        except BufferError:
+            # Segment views are still referenced by a traceback; the mapping goes with it
+            pass
+
+    with span("decode", bytes=len(plaintext)):
+        text = plaintext.decode('utf-8')
+    del plaintext
+    segment_map = None
+    if peeked and not _ASTRAL.search(text):
+        segment_map = SegmentMap.from_records(crypto, path, peeked[0], records)
+    return text, salt, segment_map
+
+
+def _decrypt_mapped(crypto, mapped, password, progress):
+    # Returns (plaintext, records) with (char_count, offset, sealed_size) per segment
+    segments = list(crypto.iter_sealed(mapped, password))
+    open_segment = crypto.segment_opener(mapped)
+    if open_segment is not None:
+        return _decompress_mapped(mapped, segments, open_segment, progress)
+    checked = crypto.key_checked(mapped)
+    plaintext = bytearray(sum(len(segment[2]) - crypto.tag_size for segment in segments))
+    target = memoryview(plaintext)
+    records = []
+    pos = 0
+    released = 0
+    for aesgcm, nonce, sealed, aad, offset, size in segments:
+        length = crypto.decrypt_into(aesgcm, nonce, sealed, aad, target[pos:], checked)
+        records.append((utf8_char_count(plaintext[pos:pos + length]), offset, size))
+        pos += length
+        if offset + size - released >= _RELEASE_STEP:
+            # Decrypted pages of the mapping are not needed again; drop them from our RSS
+            released = _release_pages(mapped, released, offset + size)
+        progress(offset + size, len(mapped))
+    del segments, target
+    return plaintext, records
+
+
+def _decompress_mapped(mapped, segments, open_segment, progress):
+    # Compressed segments: the plaintext grows as they are opened, its size is not known up front
+    plaintext = bytearray()
+    records = []
+    released = 0
+    for aesgcm, nonce, sealed, aad, offset, size in segments:
+        piece = open_segment(aesgcm, nonce, sealed, aad)
+        records.append((utf8_char_count(piece), offset, size))
+        plaintext += piece
+        if offset + size - released >= _RELEASE_STEP:
+            released = _release_pages(mapped, released, offset + size)
+        progress(offset + size, len(mapped))
+    del segments
+    return plaintext, records
+
+
+def _release_pages(mapped, start, end):
+    end -= end % mmap.PAGESIZE
+    if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_DONTNEED") and end > start:
+        mapped.madvise(mmap.MADV_DONTNEED, start, end - start)
+    return end
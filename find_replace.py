@@ -0,0 +1,84 @@
+import re
+import time
+import bisect
+
+# Find/replace over the real text of a document (never the obfuscated view).
+# Results are positions in the editor's document: UTF-16 units for the plain view
+# (utf16=True) or characters in stealth mode, where every real character is shown
+# as one ASCII letter.
+
+_ASTRAL = re.compile("[\U00010000-\U0010FFFF]")
+
+# Matches are handed back in batches, at least this often, so highlighting can start early
+BATCH_SIZE = 500
+BATCH_SECONDS = 0.05
+
+
+def compile_pattern(query, regex=False, case_sensitive=False, whole_word=False):
+    """Builds the search pattern. Invalid regular expressions raise re.error."""
+    pattern = query if regex else re.escape(query)
+    if whole_word:
+        pattern = rf"\b(?:{pattern})\b"
+    return re.compile(pattern, 0 if case_sensitive else re.IGNORECASE)
+
+
+class Utf16Offsets:
+    """Maps character offsets of text to the UTF-16 positions QTextDocument uses."""
+
+    def __init__(self, text):
+        # Only characters outside the BMP take two UTF-16 units
+        self._astral = [m.start() for m in _ASTRAL.finditer(text)]
+
+    def __call__(self, pos):
+        if not self._astral:
+            return pos
+        return pos + bisect.bisect_left(self._astral, pos)
+
+
+def find_matches(text, pattern, utf16, progress):
+    """
+    Finds every non-empty match of pattern in text. Batches of (start, end)
+    pairs are streamed through progress as they are found. Returns the count.
+    """
+    position = Utf16Offsets(text) if utf16 else int
+    batch = []
+    count = 0
+    flushed = time.monotonic()
+    for match in pattern.finditer(text):
+        start, end = match.span()
+        if start == end:
+            continue
+        batch.append((position(start), position(end)))
+        count += 1
+        if len(batch) >= BATCH_SIZE or time.monotonic() - flushed > BATCH_SECONDS:
+            progress(end, len(text), batch)
+            batch = []
+            flushed = time.monotonic()
+    progress(len(text), len(text), batch)
+    return count
+
+
+def replace_all(text, pattern, replacement, regex, utf16, progress):
+    """
+    Replaces every match in one pass. Returns (start, end, new_segment, count):
+    [start, end) is the span from the first to the last match, and replacing
+    it with new_segment gives the whole result, so the editor applies one edit.
+    """
+    spans = []
+
+    def substitute(match):
+        if len(spans) % 1000 == 0:
+            progress(match.start(), len(text))
+        spans.append(match.span())
+        return match.expand(replacement) if regex else replacement
+
+    result, count = pattern.subn(substitute, text)
+    if not count:
+        return 0, 0, "", 0
+    start, end = spans[0][0], spans[-1][1]
+    segment = result[start:len(result) - (len(text) - end)]
+    progress(len(text), len(text))
+    if utf16:
+        position = Utf16Offsets(text)
+        start, end = position(start), position(end)
+    return start, end, segment, count
@@ -0,0 +1,226 @@
+import os
+import io
+import re
+import struct
+from tracing import span
+from piece_table import PieceTable
+
+# Autosave journal kept next to an .aetxt file (notes.aetxt -> notes.aetxt.journal).
+#
+#   header: MAGIC | version | salt(16) | base file size(>Q) | base mtime_ns(>Q) | kdf_len(B) | kdf
+#   record: len(>I) | nonce(12) | AES-GCM(op), AAD = header | record index(>Q)
+#   op:     unit(B) | pos(>Q) | removed(>Q) | inserted text (UTF-8)
+#
+# Records are edits on top of the base file, which is identified by its size and
+# mtime: once the file is saved again the journal no longer applies and a new one
+# is started. The key is the file's own key (same password, salt and KDF), so
+# appending never runs the KDF. A torn last record (crash mid-append) is dropped.
+
+JOURNAL_MAGIC = b"AEJL"
+JOURNAL_VERSION = 1
+JOURNAL_SUFFIX = ".journal"
+
+# Units of an op's positions: Python characters, or UTF-16 code units as Qt reports them
+UNIT_CHARS = 0
+UNIT_UTF16 = 1
+
+_HEADER = struct.Struct(">4sB16sQQB")
+_OP = struct.Struct(">BQQ")
+_NONCE_SIZE = 12
+_MAX_RECORD = 64 * 1024 * 1024
+_ASTRAL = re.compile("[\U00010000-\U0010FFFF]")
+_LINE_BREAK = re.compile("\r\n?|[\u2028\u2029]")
+
+
+def journal_path(path):
+    return path + JOURNAL_SUFFIX
+
+
+def _disk_stamp(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def editor_text(text):
+    """
+    text with every line break a "\n", as the editor holds it (Qt makes one of CRLF).
+    Journal positions are positions in this text.
+    """
+    return _LINE_BREAK.sub("\n", text)
+
+
+def apply_ops(text, ops, segment_map=None):
+    """
+    Applies (unit, pos, removed, inserted) ops to text (see editor_text) and returns the result.
+    segment_map, if given, is told about every change like it is by the editor.
+    """
+    table = PieceTable(text)
+    astral = None
+    for unit, pos, removed, inserted in ops:
+        if unit == UNIT_UTF16:
+            if astral is None:
+                astral = bool(_ASTRAL.search(text))
+            if astral:
+                # Rare: only documents with characters outside the BMP need converting
+                pos, removed = _utf16_span(table.text(), pos, removed)
+        pos = min(pos, len(table))
+        removed = min(removed, len(table) - pos)
+        table.delete(pos, pos + removed)
+        table.insert(pos, inserted)
+        if segment_map:
+            segment_map.on_contents_change(pos, removed, len(inserted))
+        if astral is False and _ASTRAL.search(inserted):
+            astral = True
+    return table.text()
+
+
+def _utf16_span(text, pos, count):
+    # Converts a UTF-16 [pos, pos+count) span into character offsets
+    encoded = text.encode('utf-16-le')
+    start = len(encoded[:2 * pos].decode('utf-16-le', 'ignore'))
+    end = len(encoded[:2 * (pos + count)].decode('utf-16-le', 'ignore'))
+    return start, end - start
+
+
+class Journal:
+    """
+    Append-only, encrypted log of edits made since path was last saved.
+    Only used from CryptoService tasks of one document, so calls never overlap.
+    """
+
+    # Journal size that triggers folding it back into the main file
+    compact_size = 1024 * 1024
+
+    def __init__(self, path, salt=None, kdf=None, stamp=None, base_seq=0):
+        self.path = path
+        self.salt = salt
+        self.kdf = kdf
+        self.stamp = stamp
+        self.base_seq = base_seq # Edits up to this sequence number are in the main file
+        self.header = None
+        self.records = 0
+        self.size = 0
+
+    def _build_header(self):
+        kdf = self.kdf.encode()
+        return _HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, self.salt, *self.stamp, len(kdf)) + kdf
+
+    def _aesgcm(self, crypto, password):
+        from crypto_handler import AESGCM # Not at import time: the editor imports this module at startup
+        key, _ = crypto.derive_key(password, self.salt, self.kdf)
+        return AESGCM(key)
+
+    def append(self, crypto, password, ops, progress=None):
+        """
+        Seals (seq, unit, pos, removed, inserted) ops and appends them durably.
+        Ops already covered by the last save are skipped. Returns the journal size.
+        """
+        ops = [op for op in ops if op[0] > self.base_seq]
+        if not ops or self.salt is None:
+            return self.size
+        aesgcm = self._aesgcm(crypto, password)
+        target = journal_path(self.path)
+        if self.header is None:
+            self.header = self._build_header()
+            self.records = 0
+            with open(target, 'wb') as f:
+                f.write(self.header)
+            self.size = len(self.header)
+
+        out = io.BytesIO()
+        for _, unit, pos, removed, inserted in ops:
+            nonce = os.urandom(_NONCE_SIZE)
+            aad = self.header + struct.pack(">Q", self.records)
+            sealed = aesgcm.encrypt(nonce, _OP.pack(unit, pos, removed) + inserted.encode('utf-8'), aad)
+            out.write(struct.pack(">I", len(sealed)) + nonce + sealed)
+            self.records += 1
+        with span("journal write", ops=len(ops)), open(target, 'ab') as f:
+            f.write(out.getvalue())
+            f.flush()
+            os.fsync(f.fileno())
+        self.size += out.tell()
+        if progress:
+            progress(len(ops), len(ops))
+        return self.size
+
+    def rebase(self, crypto, path, password, salt, seq):
+        """
+        Starts over after path was saved with everything up to edit seq.
+        The old journal (possibly of another path, after Save As) is removed.
+        """
+        self.discard()
+        _, self.kdf = crypto.derive_key(password, salt)
+        self.path = path
+        self.salt = salt
+        self.stamp = _disk_stamp(path)
+        self.base_seq = seq
+
+    def discard(self):
+        try:
+            os.remove(journal_path(self.path))
+        except FileNotFoundError:
+            pass
+        self.header = None
+        self.records = 0
+        self.size = 0
+
+    @classmethod
+    def recover(cls, crypto, path, password, salt):
+        """
+        Opens the journal of path right after the file itself was decrypted
+        (so its key is cached and its size and mtime are those that were read).
+        Returns (journal, ops); ops are (unit, pos, removed, inserted) edits to replay.
+        A journal left over from an older version of the file is discarded.
+        """
+        _, kdf = crypto.derive_key(password, salt)
+        stamp = _disk_stamp(path)
+        journal = cls(path, salt, kdf, stamp)
+        target = journal_path(path)
+        if not os.path.exists(target):
+            return journal, []
+        with open(target, 'rb') as f:
+            data = f.read()
+
+        fixed = data[:_HEADER.size]
+        if len(fixed) < _HEADER.size:
+            journal.discard()
+            return journal, []
+        magic, version, j_salt, size, mtime_ns, kdf_len = _HEADER.unpack(fixed)
+        header = data[:_HEADER.size + kdf_len]
+        from crypto_handler import KdfParams
+        try:
+            j_kdf = KdfParams.decode(header[_HEADER.size:])
+        except ValueError:
+            j_kdf = None
+        if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION or j_salt != salt \
+                or (size, mtime_ns) != stamp or j_kdf != kdf:
+            journal.discard()
+            return journal, []
+
+        aesgcm = journal._aesgcm(crypto, password)
+        ops = []
+        offset = len(header)
+        while offset + 4 + _NONCE_SIZE <= len(data):
+            length = struct.unpack(">I", data[offset:offset + 4])[0]
+            end = offset + 4 + _NONCE_SIZE + length
+            if length > _MAX_RECORD or end > len(data):
+                break
+            nonce = data[offset + 4:offset + 4 + _NONCE_SIZE]
+            try:
+                plain = aesgcm.decrypt(nonce, data[offset + 4 + _NONCE_SIZE:end],
+                                       header + struct.pack(">Q", len(ops)))
+            except Exception:
+                break
+            unit, pos, removed = _OP.unpack(plain[:_OP.size])
+            ops.append((unit, pos, removed, plain[_OP.size:].decode('utf-8')))
+            offset = end
+
+        if offset != len(data):
+            # Drop the torn or damaged tail so new records follow the valid ones
+            with open(target, 'r+b') as f:
+                f.truncate(offset)
+        journal.header = header
+        journal.records = len(ops)
+        journal.size = offset
+        return journal, ops
+
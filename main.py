@@ -1,15 +1,36 @@
+import time
+_STARTED = time.perf_counter()
 import sys
 import os
-import base64
-import random
-import string
-import time
-from PyQt6.QtWidgets import (QApplication, QMainWindow, QTextEdit, QFileDialog, 
+if __name__ == "__main__" and not {"--new-instance", "--profile-startup", "--trace"} & {arg.split("=")[0] for arg in sys.argv[1:]}:
+    # A second launch hands its files to the running window and exits, before loading the rest of Qt
+    from single_instance import hand_off
+    if hand_off(sys.argv[1:]):
+        sys.exit(0)
+import re
+import bisect
+from PyQt6.QtWidgets import (QApplication, QMainWindow, QTextEdit, QPlainTextEdit, QFileDialog, 
                              QMessageBox, QInputDialog, QDialog, QVBoxLayout, 
-                             QLabel, QLineEdit, QPushButton, QHBoxLayout, QWidget, QToolBar, QFontDialog)
-from PyQt6.QtGui import QIcon, QFont, QColor, QPalette, QAction, QKeySequence, QWheelEvent, QPixmap
-from PyQt6.QtCore import Qt, QSize
-from crypto_handler import CryptoHandler, AESGCM
+                             QLabel, QLineEdit, QPushButton, QHBoxLayout, QWidget, QToolBar,
+                             QProgressBar, QCheckBox, QSplitter, QTextBrowser, QTabWidget)
+from PyQt6.QtGui import (QIcon, QFont, QColor, QAction, QKeySequence, QWheelEvent, QTextCursor,
+                         QTextBlockFormat, QTextCharFormat, QPainter)
+from PyQt6.QtCore import Qt, QSize, QSettings, QTimer, QEvent, QObject, pyqtSignal
+_QT_IMPORTED = time.perf_counter()
+# crypto_handler (and the cryptography backend behind it), search_index and vault are
+# imported on first use, see ModernNotepad.crypto and crypto_worker.preload
+from piece_table import PieceTable
+from obfuscator import obfuscate
+from crypto_worker import (CryptoService, preload, decrypt_file, encrypt_to_file, save_segments, append_journal,
+                           seal_text, unseal_text, write_sealed, calibrate, index_document, build_search_index, search_folder,
+                           unlock_vault, change_vault_password)
+from find_replace import compile_pattern, find_matches, replace_all
+from markdown_preview import preview_blocks, render_block
+from journal import Journal, UNIT_CHARS, UNIT_UTF16
+from undo_log import UndoLog, to_utf16_units, from_utf16_units
+import tracing
+from tracing import span, traced
+_IMPORTED = time.perf_counter()
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -21,6 +42,62 @@ def resource_path(relative_path):
 
     return os.path.join(base_path, relative_path)
 
+def trace_path_from_args(args):
+    """
+    Returns (path, args taken) for args starting with --trace=PATH or --trace [PATH].
+    A following flag, a file that exists or an .aetxt note is never taken as the
+    path, and an existing file is never overwritten: a free aetxt-trace*.json is used.
+    """
+    if args[0].startswith("--trace="):
+        path, taken = args[0][len("--trace="):], 1
+    elif len(args) > 1 and not args[1].startswith("-") and not args[1].endswith(".aetxt"):
+        path, taken = args[1], 2
+    else:
+        path, taken = None, 1
+    if path and not os.path.exists(path) and not path.endswith(".aetxt"):
+        return path, taken
+    if path and taken == 2:
+        # An existing file is one to open, not the trace
+        taken = 1
+    elif path:
+        print(f"AeTxt: not overwriting {path} with the trace", file=sys.stderr)
+    path = "aetxt-trace.json"
+    number = 1
+    while os.path.exists(path):
+        path = f"aetxt-trace-{number}.json"
+        number += 1
+    return path, taken
+
+def decrypt_error_message(error, unknown):
+    """
+    Message for a failed decrypt. v2 files have a key check (crypto_handler.TAG_KEY_CHECK)
+    that tells a wrong password from damage; v1 files only fail with a bad tag (unknown).
+    """
+    from crypto_handler import WrongPasswordError
+    if isinstance(error, WrongPasswordError):
+        return "Incorrect password."
+    if isinstance(error, ValueError):
+        return f"Decryption failed: {error}."
+    return unknown
+
+# Documents from this many characters open in LargeTextEdit instead of StealthTextEdit.
+# QTextEdit already stalls for ~170 ms when scrolling into unlaid-out text at 1M (benchmarks/editor_bench.py).
+LARGE_DOCUMENT_CHARS = 1024 * 1024
+
+# Units of text kept on each side of an edit in the plain view, for undo (see StealthEditing._expect_edit)
+EDIT_CONTEXT = 4096
+
+# Matches highlighted at most, so huge result sets don't slow down painting
+MAX_HIGHLIGHTS = 10000
+
+# Plaintext kept in memory across tabs before the least recently used ones are parked
+DEFAULT_MEMORY_BUDGET_MB = 512
+# Undo history kept per tab; the oldest steps go first
+DEFAULT_UNDO_LIMIT_MB = 64
+HIDDEN_TEXT = ("Hidden: the text is encrypted in memory ({size:,} bytes, fingerprint {fingerprint}).\n"
+               "Decrypt to show it again.")
+PARKED_TEXT = "This tab is sealed in memory to stay within the memory budget.\nIt is unsealed when you switch to it."
+
 # Theme Definitions
 THEMES = {
     "Dark": {
@@ -30,6 +107,8 @@ THEMES = {
         "editor_fg": "#d4d4d4",
         "accent": "#007acc",
         "accent_hover": "#0062a3",
+        "find_bg": "#6b5a10",
+        "line_number": "#858585",
         "input_bg": "#3c3c3c",
         "border": "#333",
         "toolbar_bg": "#2d2d2d",
@@ -42,6 +121,8 @@ THEMES = {
         "editor_fg": "#000000",
         "accent": "#0078d7",
         "accent_hover": "#005a9e",
+        "find_bg": "#ffe27a",
+        "line_number": "#999999",
         "input_bg": "#ffffff",
         "border": "#cccccc",
         "toolbar_bg": "#e0e0e0",
@@ -49,12 +130,29 @@ THEMES = {
     }
 }
 
-class StealthTextEdit(QTextEdit):
+class StealthEditing:
+    """
+    Stealth mode, undo log and real-text tracking shared by the editors below;
+    mixed into QTextEdit or QPlainTextEdit.
+    """
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.default_font_size = 14
         self.stealth_mode = False
-        self.real_content = ""
+        # The real text in stealth mode, in characters (empty in the plain view, where the
+        # document holds it). O(log n) edits.
+        self.real_content = PieceTable()
+        # (start, text in UTF-16 units) of the document around an edit about to happen, so
+        # the plain view knows what an edit removed without a second copy of the whole text
+        self.removal = None
+        self.replacing_view = False # Set while the visible text is swapped without changing the real text
+        self.resetting = False # Set while the whole text is replaced; the undo history starts over
+        # Replaces Qt's undo stack, which grows without limit and can't see stealth edits
+        self.undo_log = UndoLog()
+        self.applying_undo = False
+        self.setUndoRedoEnabled(False)
+        self.document().contentsChange.connect(self._on_contents_change)
 
     def wheelEvent(self, event: QWheelEvent):
         if event.modifiers() == Qt.KeyboardModifier.ControlModifier:
@@ -71,110 +169,363 @@ class StealthTextEdit(QTextEdit):
         if self.stealth_mode == enabled:
             return
             
-        cursor = self.textCursor()
-        pos = cursor.position()
-        
         self.stealth_mode = enabled
         if enabled:
             # Entering stealth mode: Backup real text, obfuscate visual text
-            self.real_content = self.toPlainText()
+            text = self.toPlainText()
+            self.real_content = PieceTable(text)
             self.update_visual_text()
         else:
             # Exiting stealth mode: Restore real text
-            self.setPlainText(self.real_content)
-            
-        # Restore cursor
-        new_cursor = self.textCursor()
-        new_cursor.setPosition(pos)
-        self.setTextCursor(new_cursor)
+            text = self.real_content.text()
+            self.real_content = PieceTable()
+            self._set_text_keep_view(text)
+        if len(to_utf16_units(text)) != len(text):
+            # Characters outside the BMP: undo positions are in the other mode's units
+            self.undo_log.clear()
+
+    def _set_text_keep_view(self, text):
+        """Replaces the whole document without moving the cursor or the scroll position."""
+        pos = self.textCursor().position()
+        h_scroll = self.horizontalScrollBar().value()
+        v_scroll = self.verticalScrollBar().value()
 
+        blocked_signals = self.blockSignals(True)
+        self.replacing_view = True
+        try:
+            with span("set text", chars=len(text)):
+                self.setPlainText(text)
+        finally:
+            self.replacing_view = False
+            self.blockSignals(blocked_signals)
+
+        cursor = self.textCursor()
+        cursor.setPosition(min(pos, len(text)))
+        self.setTextCursor(cursor)
+        self.horizontalScrollBar().setValue(h_scroll)
+        self.verticalScrollBar().setValue(v_scroll)
+
+    @traced("update_visual_text")
     def update_visual_text(self):
         # Re-generates visual text based on real_content for stealth mode
         if not self.stealth_mode:
             return
-            
-        visual_chars = []
-        for char in self.real_content:
-            if char == '\n':
-                visual_chars.append('\n')
-            elif char.isspace():
-                visual_chars.append(char) # Keep tabs/spaces
-            elif char.isupper():
-                visual_chars.append(random.choice(string.ascii_uppercase))
-            elif char.islower():
-                visual_chars.append(random.choice(string.ascii_lowercase))
-            else:
-                visual_chars.append(random.choice(string.ascii_letters))
-        
-        blocked_signals = self.blockSignals(True)
-        self.setPlainText("".join(visual_chars))
-        self.blockSignals(blocked_signals)
+        with span("obfuscate", chars=len(self.real_content)):
+            visual = obfuscate(self.real_content.text())
+        self._set_text_keep_view(visual)
+
+    def replace_real_range(self, start, end, text):
+        """
+        Replaces real text [start, end) with text while in stealth mode.
+        Only that range of the visual document is re-obfuscated.
+        """
+        removed = self.real_content.slice(start, end)
+        self.real_content.delete(start, end)
+        self.real_content.insert(start, text)
+        if not self.applying_undo:
+            self.undo_log.record(start, removed, text)
+
+        cursor = self.textCursor()
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+        cursor.insertText(obfuscate(text))
+        self.setTextCursor(cursor)
+
+    def _expect_edit(self, start, end):
+        """
+        Keeps the text around [start, end) for _on_contents_change, before an edit
+        there: the whole selection, and the lines next to it up to EDIT_CONTEXT
+        units on each side (Backspace, Delete and word deletion reach that far).
+        """
+        document = self.document()
+        first = document.findBlock(start)
+        last = document.findBlock(end)
+        if first.previous().isValid():
+            first = first.previous()
+        if last.next().isValid():
+            last = last.next()
+        lo = max(first.position(), start - EDIT_CONTEXT)
+        hi = min(last.position() + last.length() - 1, end + EDIT_CONTEXT, document.characterCount() - 1)
+        cursor = QTextCursor(document)
+        cursor.setPosition(lo)
+        cursor.setPosition(hi, QTextCursor.MoveMode.KeepAnchor)
+        self.removal = (lo, to_utf16_units(cursor.selectedText().replace("\u2029", "\n")))
+
+    def _expect_selection_edit(self):
+        cursor = self.textCursor()
+        self._expect_edit(cursor.selectionStart(), cursor.selectionEnd())
+
+    def replace_range(self, start, end, text):
+        """Replaces [start, end) of the plain view with text, as one undo step."""
+        self._expect_edit(start, end)
+        try:
+            cursor = self.textCursor()
+            cursor.beginEditBlock()
+            cursor.setPosition(start)
+            cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+            cursor.insertText(text)
+            cursor.endEditBlock()
+            self.setTextCursor(cursor)
+        finally:
+            self.removal = None
+
+    def insertFromMimeData(self, source):
+        if not self.stealth_mode:
+            self._expect_selection_edit()
+            try:
+                super().insertFromMimeData(source)
+            finally:
+                self.removal = None
+            return
+        # Pasting must go into real_content too, and only obfuscated text may appear
+        cursor = self.textCursor()
+        self.replace_real_range(cursor.selectionStart(), cursor.selectionEnd(), source.text())
 
     def keyPressEvent(self, event):
+        if event.matches(QKeySequence.StandardKey.Undo):
+            self.undo_edit()
+            return
+        if event.matches(QKeySequence.StandardKey.Redo):
+            self.redo_edit()
+            return
         if not self.stealth_mode:
-            super().keyPressEvent(event)
+            self._expect_selection_edit()
+            try:
+                super().keyPressEvent(event)
+            finally:
+                self.removal = None
             return
+        with span("stealth keystroke"):
+            self._stealth_key_press(event)
 
+    def _stealth_key_press(self, event):
         # Handle simple typing in stealth mode
         key = event.text()
         
+        deleting = event.key() in (Qt.Key.Key_Backspace, Qt.Key.Key_Delete)
+        
         # Allow navigation and control keys to pass through normally
-        if not key or event.modifiers() & (Qt.KeyboardModifier.ControlModifier | Qt.KeyboardModifier.AltModifier):
+        if (not key and not deleting) or event.modifiers() & (Qt.KeyboardModifier.ControlModifier | Qt.KeyboardModifier.AltModifier):
             super().keyPressEvent(event)
             return
             
         cursor = self.textCursor()
-        
-        # Handle selection deletion/replacement
-        if cursor.hasSelection():
-            # If user types something while text is selected, we must remove that range from real_content
-            start = cursor.selectionStart()
-            end = cursor.selectionEnd()
-            self.real_content = self.real_content[:start] + self.real_content[end:]
-            # Let default handler delete the selection visually
-            cursor.removeSelectedText()
-
-        pos = cursor.position()
+        # A selection is replaced (or just deleted) as one edit, like in the plain view
+        start = cursor.selectionStart()
+        end = cursor.selectionEnd()
         
         if event.key() == Qt.Key.Key_Backspace:
-            if pos > 0:
-                self.real_content = self.real_content[:pos-1] + self.real_content[pos:]
-                super().keyPressEvent(event)
+            key = ""
+            if start == end:
+                start = max(start - 1, 0)
         elif event.key() == Qt.Key.Key_Delete:
-            if pos < len(self.real_content):
-                self.real_content = self.real_content[:pos] + self.real_content[pos+1:]
-                super().keyPressEvent(event)
-        elif key: # Printable char
-             # Insert into real content
-             self.real_content = self.real_content[:pos] + key + self.real_content[pos:]
-             
-             # Insert random char visually
-             if key == '\n':
-                 visual_char = '\n'
-             elif key.isspace():
-                 visual_char = key
-             elif key.isupper():
-                 visual_char = random.choice(string.ascii_uppercase)
-             elif key.islower():
-                 visual_char = random.choice(string.ascii_lowercase)
-             else:
-                 visual_char = random.choice(string.ascii_letters)
-            
-             cursor.insertText(visual_char)
-        else:
-            super().keyPressEvent(event)
+            key = ""
+            if start == end:
+                end = min(end + 1, len(self.real_content))
+        if start == end and not key:
+            return
+        # Real text goes into real_content, random letters of the same kind into the view
+        self.replace_real_range(start, end, key)
+
+    def undo_edit(self):
+        if self.isReadOnly():
+            return
+        step = self.undo_log.undo()
+        if step is not None:
+            self._apply_step(step.pos, step.pos + len(step.inserted), step.removed)
+
+    def redo_edit(self):
+        if self.isReadOnly():
+            return
+        step = self.undo_log.redo()
+        if step is not None:
+            self._apply_step(step.pos, step.pos + len(step.removed), step.inserted)
+
+    def _apply_step(self, start, end, text):
+        self.applying_undo = True
+        try:
+            if self.stealth_mode:
+                self.replace_real_range(start, end, text)
+            else:
+                self.replace_range(start, end, from_utf16_units(text))
+        finally:
+            self.applying_undo = False
+        self.ensureCursorVisible()
+
+    def inputMethodEvent(self, event):
+        if self.stealth_mode:
+            super().inputMethodEvent(event)
+            return
+        self._expect_selection_edit()
+        try:
+            super().inputMethodEvent(event)
+        finally:
+            self.removal = None
+
+    def contextMenuEvent(self, event):
+        # Cut and Delete of the menu edit the selection while it is open
+        self._expect_selection_edit()
+        try:
+            super().contextMenuEvent(event)
+        finally:
+            self.removal = None
+
+    def dropEvent(self, event):
+        # Moving text removes the dragged selection
+        self._expect_selection_edit()
+        try:
+            super().dropEvent(event)
+        finally:
+            self.removal = None
+
+    def _on_contents_change(self, pos, removed, added):
+        # Records plain view edits for undo. Stealth edits go through replace_real_range instead.
+        if self.stealth_mode or self.replacing_view or self.resetting:
+            return
+        end = min(pos + added, self.document().characterCount() - 1)
+        cursor = QTextCursor(self.document())
+        cursor.setPosition(min(pos, end))
+        cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+        inserted = to_utf16_units(cursor.selectedText().replace("\u2029", "\n"))
+        removed_text = self._removed_text(pos, removed, inserted)
+        if removed_text is None:
+            # An edit from somewhere _expect_edit doesn't see; what it removed is gone
+            self.undo_log.clear()
+        elif not self.applying_undo:
+            self.undo_log.record(pos, removed_text, inserted)
+
+    def _removed_text(self, pos, removed, inserted):
+        """The removed text of an edit, from self.removal (kept in step with the edit), or None."""
+        text = "" if not removed else None
+        if self.removal is not None:
+            start, kept = self.removal
+            offset = pos - start
+            if 0 <= offset and offset + removed <= len(kept):
+                text = kept[offset:offset + removed]
+                self.removal = (start, kept[:offset] + inserted + kept[offset + removed:])
+            elif offset + removed <= 0:
+                self.removal = (start + len(inserted) - removed, kept)
+            elif offset < len(kept):
+                self.removal = None
+        return text
 
     def get_actual_text(self):
         if self.stealth_mode:
-            return self.real_content
+            return self.real_content.text()
         return self.toPlainText()
 
+    def actual_range(self, start, end):
+        """
+        Returns (unit, text) for the real text between two positions of a contentsChange.
+        Qt counts UTF-16 code units; in stealth mode every character is one unit.
+        """
+        if self.stealth_mode:
+            return UNIT_CHARS, self.real_content.slice(start, end)
+        end = min(end, self.document().characterCount() - 1)
+        cursor = QTextCursor(self.document())
+        cursor.setPosition(min(start, end))
+        cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+        return UNIT_UTF16, cursor.selectedText().replace("\u2029", "\n")
+
     def set_actual_text(self, text):
-        self.real_content = text
+        self.undo_log.clear()
         if self.stealth_mode:
+             self.real_content = PieceTable(text)
              self.update_visual_text()
         else:
-             self.setPlainText(text)
+             self.resetting = True
+             try:
+                 with span("set text", chars=len(text)):
+                     self.setPlainText(text)
+             finally:
+                 self.resetting = False
+             self.real_content = PieceTable()
+
+
+class StealthTextEdit(StealthEditing, QTextEdit):
+    """Editor for documents below LARGE_DOCUMENT_CHARS."""
+
+
+class LineNumberArea(QWidget):
+    """Gutter of a LargeTextEdit; it does the painting."""
+
+    def __init__(self, editor):
+        super().__init__(editor)
+        self.editor = editor
+
+    def sizeHint(self):
+        return QSize(self.editor.gutter_width(), 0)
+
+    def paintEvent(self, event):
+        self.editor.paint_gutter(event)
+
+
+class LargeTextEdit(StealthEditing, QPlainTextEdit):
+    """
+    Editor for documents of LARGE_DOCUMENT_CHARS and more. QPlainTextEdit lays out
+    one block (line) at a time and only the ones on screen, so loading, scrolling
+    and typing don't slow down with the size of the text. Shows line numbers.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.gutter = LineNumberArea(self)
+        self.gutter_colors = (QColor("#252526"), QColor("#858585"))
+        self.blockCountChanged.connect(self._update_gutter_width)
+        self.updateRequest.connect(self._update_gutter)
+        self._update_gutter_width()
+
+    def set_gutter_colors(self, background, foreground):
+        self.gutter_colors = (QColor(background), QColor(foreground))
+        self.gutter.update()
+
+    def gutter_width(self):
+        digits = len(str(max(1, self.blockCount())))
+        return 16 + self.fontMetrics().horizontalAdvance("9") * digits
+
+    def _update_gutter_width(self, _count=0):
+        self.setViewportMargins(self.gutter_width(), 0, 0, 0)
+
+    def _update_gutter(self, rect, dy):
+        if dy:
+            self.gutter.scroll(0, dy)
+        else:
+            self.gutter.update(0, rect.y(), self.gutter.width(), rect.height())
+        if rect.contains(self.viewport().rect()):
+            self._update_gutter_width()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        rect = self.contentsRect()
+        self.gutter.setGeometry(rect.left(), rect.top(), self.gutter_width(), rect.height())
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.Type.FontChange:
+            # Zoomed: the numbers take more or less room
+            self._update_gutter_width()
+            self.gutter.setGeometry(self.gutter.x(), self.gutter.y(), self.gutter_width(), self.gutter.height())
+
+    def paint_gutter(self, event):
+        background, foreground = self.gutter_colors
+        painter = QPainter(self.gutter)
+        painter.fillRect(event.rect(), background)
+        painter.setPen(foreground)
+        painter.setFont(self.font())
+        width = self.gutter.width() - 8
+        height = self.fontMetrics().height()
+        # Only the blocks on screen, so painting costs the same for any size of text
+        block = self.firstVisibleBlock()
+        number = block.blockNumber()
+        top = round(self.blockBoundingGeometry(block).translated(self.contentOffset()).top())
+        while block.isValid() and top <= event.rect().bottom():
+            bottom = top + round(self.blockBoundingRect(block).height())
+            if block.isVisible() and bottom >= event.rect().top():
+                painter.drawText(0, top, width, height, Qt.AlignmentFlag.AlignRight, str(number + 1))
+            block = block.next()
+            top = bottom
+            number += 1
+        painter.end()
 
 
 STYLESHEET_TEMPLATE = """
@@ -186,7 +537,7 @@ QInternalMdiSubWindow {{
     background-color: {bg}; 
 }}
 
-QTextEdit {{
+QTextEdit, QPlainTextEdit {{
     background-color: {editor_bg};
     color: {editor_fg};
     border: none;
@@ -195,6 +546,23 @@ QTextEdit {{
     selection-background-color: {accent};
 }}
 
+QTabWidget::pane {{
+    border: none;
+}}
+
+QTabBar::tab {{
+    background-color: {toolbar_bg};
+    color: {fg};
+    border: none;
+    border-right: 1px solid {border};
+    padding: 6px 14px;
+}}
+
+QTabBar::tab:selected {{
+    background-color: {editor_bg};
+    border-bottom: 2px solid {accent};
+}}
+
 QMenuBar {{
     background-color: {bg};
     color: {fg};
@@ -340,67 +708,627 @@ class PasswordDialog(QDialog):
         else:
             self.input.setFocus()
 
-class ModernNotepad(QMainWindow):
-    def __init__(self):
-        super().__init__()
-        self.crypto = CryptoHandler()
+class FindBar(QWidget):
+    """Find/replace strip shown under the editor (Ctrl+F / Ctrl+H)."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(8, 4, 8, 4)
+
+        self.find_input = QLineEdit()
+        self.find_input.setPlaceholderText("Find")
+        self.replace_input = QLineEdit()
+        self.replace_input.setPlaceholderText("Replace with")
+        self.regex_box = QCheckBox("Regex")
+        self.case_box = QCheckBox("Match case")
+        self.word_box = QCheckBox("Whole word")
+        self.count_label = QLabel("")
+        self.prev_btn = QPushButton("Previous")
+        self.next_btn = QPushButton("Next")
+        self.replace_btn = QPushButton("Replace")
+        self.replace_all_btn = QPushButton("Replace All")
+        self.close_btn = QPushButton("Close")
+        self.close_btn.setObjectName("cancel_btn")
+        self.close_btn.clicked.connect(self.hide)
+
+        for widget in (self.find_input, self.replace_input, self.regex_box, self.case_box, self.word_box,
+                       self.count_label, self.prev_btn, self.next_btn, self.replace_btn, self.replace_all_btn,
+                       self.close_btn):
+            layout.addWidget(widget)
+
+    def options(self):
+        return {"regex": self.regex_box.isChecked(),
+                "case_sensitive": self.case_box.isChecked(),
+                "whole_word": self.word_box.isChecked()}
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key.Key_Escape:
+            self.hide()
+        else:
+            super().keyPressEvent(event)
+
+class MarkdownPreview(QTextBrowser):
+    """Read-only Markdown rendering shown next to the editor, updated block by block."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setOpenExternalLinks(True)
+        self.blocks = [] # Source of each block shown, in order
+        self.lengths = [] # Characters each shown block takes in the preview document
+        self.cache = {} # Block source -> QTextDocumentFragment
+
+    def clear_blocks(self):
+        self.clear()
+        self.blocks = []
+        self.lengths = []
+        self.cache = {}
+
+    @traced("preview update")
+    def show_blocks(self, blocks, batch=200):
+        """
+        Swaps in the blocks that differ from the ones shown; the rest of the preview
+        is left alone. Parses and inserts at most batch blocks per call (to keep the
+        UI responsive on huge notes) and returns False while some are left.
+        """
+        old = self.blocks
+        limit = min(len(old), len(blocks))
+        prefix = 0
+        while prefix < limit and old[prefix] == blocks[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and old[-1 - suffix] == blocks[-1 - suffix]:
+            suffix += 1
+        if prefix == len(old) == len(blocks):
+            return True
+        new = blocks[prefix:len(blocks) - suffix]
+        done = len(new) <= batch
+        new = new[:batch]
+
+        start = sum(self.lengths[:prefix])
+        end = start + sum(self.lengths[prefix:len(old) - suffix])
+        scroll = self.verticalScrollBar().value()
+        document = self.document()
+        cursor = QTextCursor(document)
+        cursor.beginEditBlock()
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+        cursor.removeSelectedText()
+        lengths = []
+        for block in new:
+            before = document.characterCount()
+            # A fresh block each, so lists and headings don't run into the next one
+            cursor.insertBlock(QTextBlockFormat(), QTextCharFormat())
+            if block not in self.cache:
+                self.cache[block] = render_block(block)
+            cursor.insertFragment(self.cache[block])
+            lengths.append(document.characterCount() - before)
+        cursor.endEditBlock()
+        self.lengths[prefix:len(old) - suffix] = lengths
+        self.blocks = old[:prefix] + new + old[len(old) - suffix:]
+        if len(self.cache) > 2 * len(blocks) + 100:
+            # Forget blocks that were edited away
+            self.cache = {block: self.cache[block] for block in blocks if block in self.cache}
+        self.verticalScrollBar().setValue(scroll)
+        return done
+
+class DocumentTab(QWidget):
+    """One open document: its editor and preview, and what is known about its file."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.editor = StealthTextEdit()
+        self.preview = MarkdownPreview()
+        self.preview.hide()
+        self.splitter = QSplitter(Qt.Orientation.Horizontal)
+        self.splitter.addWidget(self.editor)
+        self.splitter.addWidget(self.preview)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.splitter)
+
+        self.visibility_busy = False # A hide/decrypt is running in the background
         self.current_file = None
         self.current_password = None
+        self.current_salt = None # Salt of the last opened/saved blob, reused so saves skip PBKDF2
+        self.segment_map = None # Layout of current_file on disk, so saves only re-seal edited segments
+        self.edit_count = 0
+        self.tracking_paused = False # Set while the hidden blob replaces the text in the editor
+        self.journal = None # Autosave journal of current_file
+        self.pending_ops = [] # Edits not yet appended to the journal
+        self.compaction_pending = False
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.setSingleShot(True)
+        self.autosave_timer.setInterval(2000)
+        self.find_key = None # Query and options the matches below belong to
+        self.find_matches = [] # (start, end) document positions, sorted
+        self.find_done = False
+        self.find_pending = None # "next"/"previous" to go to once matches arrive
         self.is_hidden = False
+        self.sealed = None # Ciphertext of the text while hidden; the editor only shows a placeholder
+        self.preview_busy = False
+        self.preview_stale = False # Text changed while a render was running
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(300)
+        self.closed = False # Tab closed; callbacks of its tasks are dropped
+        self.parked = None # ParkedText while the plaintext is freed (see ModernNotepad.park_document)
+        # Covers the editor from the panic button until the text is hidden (see ModernNotepad.panic_all)
+        self.cover = QLabel("Hidden", self)
+        self.cover.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.cover.setAutoFillBackground(True)
+        self.cover.hide()
+        self.parking = False
+        self.last_active = time.monotonic() # Tabs not shown for longest are parked first
+
+    def set_covered(self, covered):
+        if covered:
+            # A child on top of the splitter, not in the layout, so it covers the tab without a relayout
+            self.cover.setGeometry(self.rect())
+            self.cover.raise_()
+        self.cover.setVisible(covered)
+
+    def is_covered(self):
+        return not self.cover.isHidden()
+
+    def replace_editor(self, editor):
+        """Puts editor in place of the current one, keeping its mode, zoom and read-only state."""
+        old = self.editor
+        editor.undo_log.set_limit(old.undo_log.limit)
+        editor.set_stealth_mode(old.stealth_mode)
+        editor.setReadOnly(old.isReadOnly())
+        had_focus = old.hasFocus()
+        self.splitter.replaceWidget(self.splitter.indexOf(old), editor)
+        self.editor = editor
+        old.deleteLater()
+        if had_focus:
+            editor.setFocus()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.cover.setGeometry(self.rect())
+
+    def is_blank(self):
+        """Untitled and never edited, so opening a file can reuse the tab."""
+        return not self.current_file and not self.edit_count and not self.visibility_busy
+
+    def resident_size(self):
+        """Rough bytes of plaintext held for this tab: the document's UTF-16 text plus real_content (stealth mode)."""
+        if self.parked is not None or self.is_hidden:
+            return 0
+        return self.editor.document().characterCount() * 2 + len(self.editor.real_content)
+
+class ParkedText:
+    """Sealed text of a parked tab, and where its view was."""
+    __slots__ = ("sealed", "password", "cursor", "scroll")
+
+    def __init__(self, sealed, password, cursor, scroll):
+        self.sealed = sealed
+        self.password = password # The tab's password when it was sealed
+        self.cursor = cursor
+        self.scroll = scroll
+
+class DocumentState:
+    """ModernNotepad attribute kept per document, on ModernNotepad.doc."""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, window, owner=None):
+        if window is None:
+            return self
+        return getattr(window.doc, self.name)
+
+    def __set__(self, window, value):
+        setattr(window.doc, self.name, value)
+
+class StartupProfile(QObject):
+    """Time-to-first-paint breakdown printed by --profile-startup."""
+
+    def __init__(self):
+        super().__init__()
+        self.marks = [("python imports (PyQt6)", _STARTED, _QT_IMPORTED),
+                      ("python imports (AeTxt)", _QT_IMPORTED, _IMPORTED)]
+        self.last = _IMPORTED
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.marks.append((name, self.last, now))
+        self.last = now
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint:
+            obj.removeEventFilter(self)
+            self.mark("show -> first paint")
+            # Report once the paint is done
+            QTimer.singleShot(0, self.report)
+        return False
+
+    def report(self):
+        print("AeTxt startup (ms)", file=sys.stderr)
+        for name, start, end in self.marks:
+            print(f"  {name:<28} {(end - start) * 1000:8.1f}", file=sys.stderr)
+        print(f"  {'total to first paint':<28} {(self.last - _STARTED) * 1000:8.1f}", file=sys.stderr)
+        QApplication.instance().quit()
+
+class TimingLabel(QLabel):
+    """Status bar readout of the last traced operation (View > Operation Timings)."""
+    # Spans end on worker threads too; the signal brings them to the UI thread
+    timed = pyqtSignal(str, float)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.timed.connect(self.show_timing)
+
+    def record(self, name, seconds):
+        # tracing listener, called from any thread
+        self.timed.emit(name, seconds)
+
+    def show_timing(self, name, seconds):
+        self.setText(f"{name}: {seconds * 1000:.1f} ms")
+
+# Set by --profile-startup
+startup_profile = None
+
+def profile_mark(name):
+    if startup_profile:
+        startup_profile.mark(name)
+
+class ModernNotepad(QMainWindow):
+    # Per-document state (see DocumentTab)
+    editor = DocumentState()
+    preview = DocumentState()
+    splitter = DocumentState()
+    visibility_busy = DocumentState()
+    current_file = DocumentState()
+    current_password = DocumentState()
+    current_salt = DocumentState()
+    segment_map = DocumentState()
+    edit_count = DocumentState()
+    tracking_paused = DocumentState()
+    journal = DocumentState()
+    pending_ops = DocumentState()
+    compaction_pending = DocumentState()
+    autosave_timer = DocumentState()
+    find_key = DocumentState()
+    find_matches = DocumentState()
+    find_done = DocumentState()
+    find_pending = DocumentState()
+    is_hidden = DocumentState()
+    sealed = DocumentState()
+    preview_busy = DocumentState()
+    preview_stale = DocumentState()
+    preview_timer = DocumentState()
+    parked = DocumentState()
+    parking = DocumentState()
+
+    def __init__(self, files=()):
+        super().__init__()
+        self._crypto = None
+        self._pinned = None # Document a task callback is running for
+        self.crypto_service = CryptoService(self)
+        self.settings = QSettings("AeTxt", "AeTxt")
+        self.search_indexes = {} # folder -> SearchIndex, kept loaded between searches
+        self.vaults = {} # folder -> Vault; unlocked ones are also registered with self.crypto
         self.current_theme = "Dark"
-        self.markdown_mode = False
+        self.markdown_mode = False # Preview pane shown
+        self.memory_budget = int(self.settings.value("memory_budget_mb", DEFAULT_MEMORY_BUDGET_MB)) # 0 = no limit
+        self.undo_limit = int(self.settings.value("undo_limit_mb", DEFAULT_UNDO_LIMIT_MB)) # Per tab
         self.last_alt_time = 0
         
         self.init_ui()
 
-        # Handle file open from command line (e.g. "Open with...")
-        if len(sys.argv) > 1:
-            file_to_open = sys.argv[1]
-            if os.path.isfile(file_to_open):
-                self.open_file(file_to_open)
-        
+        # Handle files from the command line (e.g. "Open with..."), after the window has painted
+        files = [path for path in files if os.path.isfile(path)]
+        if files:
+            QTimer.singleShot(0, lambda: self.open_files(files))
+        # Warm up the crypto imports off the UI thread once the event loop runs
+        QTimer.singleShot(0, lambda: self.crypto_service.submit(self, preload, label=""))
+
+    @property
+    def crypto(self):
+        # Created on first use, so startup doesn't wait for the cryptography backend
+        if self._crypto is None:
+            from crypto_handler import CryptoHandler
+            self._crypto = CryptoHandler()
+            self.load_kdf_setting()
+            self.load_compression_setting()
+        return self._crypto
+
+    @property
+    def doc(self):
+        """The document being worked on: the active tab, or the tab a task callback belongs to."""
+        if self._pinned is not None:
+            return self._pinned
+        return self.tabs.currentWidget()
+
+    def documents(self):
+        return [self.tabs.widget(i) for i in range(self.tabs.count())]
+
+    def _on_document(self, doc, fn):
+        """Wraps a callback so that it acts on doc, whichever tab is active when it runs."""
+        def call(*args):
+            if doc.closed:
+                return None
+            pinned, self._pinned = self._pinned, doc
+            try:
+                return fn(*args)
+            finally:
+                self._pinned = pinned
+        return call
+
+    def _submit(self, fn, *args, key=None, **kwargs):
+        """Submits a task for the current document (queued per document unless key is given)."""
+        doc = self.doc
+        for name in ("on_finished", "on_failed", "on_cancelled", "on_partial"):
+            if kwargs.get(name):
+                kwargs[name] = self._on_document(doc, kwargs[name])
+        return self.crypto_service.submit(doc if key is None else key, fn, *args, **kwargs)
+
     def init_ui(self):
         self.setWindowTitle("AeTxt - Aes Encrypted Text Editor")
         self.resize(1000, 700)
         
-        # Set Icon
-        # Set Icon
-        icon_path = resource_path("logo.ico")
-        if os.path.exists(icon_path):
-            self.setWindowIcon(QIcon(icon_path))
-            
-        self.update_title()
-        
-        # Central Widget
-        self.resize(1000, 700)
+        # Set Icon (decoding the .ico is left until after the first paint)
+        QTimer.singleShot(0, self._load_icon)
         
         # Central Widget
-        self.editor = StealthTextEdit()
-        self.setCentralWidget(self.editor)
-        
-        # Toolbar
-        self.setCentralWidget(self.editor)
-        
+        self.tabs = QTabWidget()
+        self.tabs.setDocumentMode(True)
+        self.tabs.setTabsClosable(True)
+        self.tabs.setMovable(True)
+        self.tabs.tabCloseRequested.connect(self.close_tab)
+        self.find_bar = FindBar()
+        self.find_bar.hide()
+        central = QWidget()
+        central_layout = QVBoxLayout(central)
+        central_layout.setContentsMargins(0, 0, 0, 0)
+        central_layout.setSpacing(0)
+        central_layout.addWidget(self.tabs)
+        central_layout.addWidget(self.find_bar)
+        self.setCentralWidget(central)
+
+        self.find_bar.find_input.returnPressed.connect(self.find_next)
+        self.find_bar.next_btn.clicked.connect(self.find_next)
+        self.find_bar.prev_btn.clicked.connect(self.find_previous)
+        self.find_bar.replace_btn.clicked.connect(self.replace_one)
+        self.find_bar.replace_all_btn.clicked.connect(self.replace_all)
+
         # Toolbar
+        profile_mark("editor widgets")
         self.create_toolbar()
 
         # Menu Bar
         self.create_menus()
+        profile_mark("toolbar and menus")
+
+        self.new_tab()
+        self.tabs.currentChanged.connect(self._on_tab_changed)
         
         # Status Bar
         self.status = self.statusBar()
         self.status.showMessage("Ready")
+
+        # Progress of background crypto work
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setMaximumWidth(200)
+        self.progress_bar.setTextVisible(False)
+        self.progress_bar.hide()
+        self.status.addPermanentWidget(self.progress_bar)
+
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setObjectName("cancel_btn")
+        self.cancel_button.clicked.connect(self.cancel_tasks)
+        self.cancel_button.hide()
+        self.status.addPermanentWidget(self.cancel_button)
+
+        self.timing_label = TimingLabel()
+        self.timing_label.hide()
+        self.status.addPermanentWidget(self.timing_label)
+        if tracing.writing():
+            # Started with --trace
+            self.timings_action.setChecked(True)
+            self.toggle_timings()
+
+        self.crypto_service.task_started.connect(self._on_task_started)
+        self.crypto_service.task_progress.connect(self._on_task_progress)
+        self.crypto_service.idle.connect(self._on_tasks_idle)
         
         # Apply Styles
         self.apply_theme("Dark")
+        profile_mark("stylesheet")
         
+    def _load_icon(self):
+        icon_path = resource_path("logo.ico")
+        if os.path.exists(icon_path):
+            self.setWindowIcon(QIcon(icon_path))
+
     def apply_theme(self, theme_name):
         self.current_theme = theme_name
         theme = THEMES[theme_name]
         self.setStyleSheet(STYLESHEET_TEMPLATE.format(**theme))
-        self.editor.setStyleSheet(f"background-color: {theme['editor_bg']}; color: {theme['editor_fg']}; border: none; padding: 10px; selection-background-color: {theme['accent']};")
-        self.editor.setFont(QFont("Segoe UI", 14))
-        
+        for doc in self.documents():
+            self._style_document(doc)
+
+    def _style_document(self, doc):
+        theme = THEMES[self.current_theme]
+        doc.editor.setStyleSheet(f"background-color: {theme['editor_bg']}; color: {theme['editor_fg']}; border: none; padding: 10px; selection-background-color: {theme['accent']};")
+        doc.editor.setFont(QFont("Segoe UI", 14))
+        if isinstance(doc.editor, LargeTextEdit):
+            doc.editor.set_gutter_colors(theme['editor_bg'], theme['line_number'])
+        doc.preview.setStyleSheet(f"background-color: {theme['editor_bg']}; color: {theme['editor_fg']}; border: none; border-left: 1px solid {theme['border']}; padding: 10px;")
+        doc.cover.setStyleSheet(f"background-color: {theme['editor_bg']}; color: {theme['editor_fg']}; font-size: 14px;")
+
+    def new_tab(self):
+        doc = DocumentTab()
+        doc.editor.undo_log.set_limit(self.undo_limit * 1024 * 1024)
+        doc.editor.document().contentsChange.connect(self._on_document(doc, self._on_contents_change))
+        doc.autosave_timer.timeout.connect(self._on_document(doc, self.autosave))
+        doc.preview_timer.timeout.connect(self._on_document(doc, self.update_preview))
+        doc.preview.setVisible(self.markdown_mode)
+        self._style_document(doc)
+        self.tabs.addTab(doc, "Untitled")
+        self.tabs.setCurrentWidget(doc)
+        doc.editor.setFocus()
+        return doc
+
+    def close_tab(self, index):
+        doc = self.tabs.widget(index)
+        # Unsaved edits stay in the journal and are recovered on the next open
+        self._on_document(doc, self.autosave)()
+        if self._crypto is not None:
+            self._on_document(doc, self._release_key)()
+        self.crypto_service.cancel(doc.preview)
+        doc.closed = True
+        self.tabs.removeTab(index)
+        doc.deleteLater()
+        if not self.tabs.count():
+            self.new_tab()
+
+    def close_current_tab(self):
+        self.close_tab(self.tabs.currentIndex())
+
+    def _on_tab_changed(self, index):
+        if index < 0:
+            return
+        doc = self.tabs.currentWidget()
+        doc.last_active = time.monotonic()
+        self._on_document(doc, self.unpark_document)()
+        # Matches belong to the tab they were found in
+        for doc in self.documents():
+            self._on_document(doc, self._clear_matches)()
+        self._sync_actions()
+        self.update_title()
+        if self.markdown_mode:
+            self.update_preview()
+        self._enforce_memory_budget()
+
+    def set_memory_budget(self):
+        budget, ok = QInputDialog.getInt(
+            self, "Memory Budget",
+            "Plaintext kept in memory for all open tabs (MB).\n"
+            "Beyond it, the tabs you have not looked at for longest are sealed\n"
+            "until you switch back to them (their undo history is dropped). 0 = no limit.",
+            self.memory_budget, 0, 1024 * 1024, 64)
+        if not ok:
+            return
+        self.memory_budget = budget
+        self.settings.setValue("memory_budget_mb", budget)
+        self._enforce_memory_budget()
+
+    def set_undo_limit(self):
+        limit, ok = QInputDialog.getInt(
+            self, "Undo History Limit",
+            "Memory for the undo history of each tab (MB).\nThe oldest steps are dropped beyond it.",
+            self.undo_limit, 1, 1024 * 1024, 16)
+        if not ok:
+            return
+        self.undo_limit = limit
+        self.settings.setValue("undo_limit_mb", limit)
+        for doc in self.documents():
+            doc.editor.undo_log.set_limit(limit * 1024 * 1024)
+
+    def _enforce_memory_budget(self):
+        if not self.memory_budget:
+            return
+        docs = self.documents()
+        total = sum(doc.resident_size() for doc in docs)
+        for doc in sorted(docs, key=lambda doc: doc.last_active):
+            if total <= self.memory_budget * 1024 * 1024:
+                break
+            size = doc.resident_size()
+            if doc is not self.tabs.currentWidget() and self._on_document(doc, self.park_document)():
+                total -= size
+
+    def park_document(self):
+        """
+        Seals the text of an inactive tab with its cached key and frees the plaintext
+        (document, stealth copy, undo history, preview). Returns False if the tab
+        can't be parked: it has no key yet, is hidden or busy.
+        """
+        if (self.parked is not None or self.parking or self.is_hidden or self.visibility_busy
+                or not self.current_password or self.current_salt is None):
+            return False
+        self.parking = True
+        password = self.current_password
+        edit_count = self.edit_count
+        cursor = self.editor.textCursor().position()
+        scroll = self.editor.verticalScrollBar().value()
+        self._submit(
+            seal_text, self.crypto, self.editor.get_actual_text(), password, self.current_salt, label="",
+            on_finished=lambda result: self._on_parked(ParkedText(result[0], password, cursor, scroll), edit_count),
+            on_failed=lambda error: setattr(self.doc, "parking", False),
+            on_cancelled=lambda: setattr(self.doc, "parking", False))
+        return True
+
+    def _on_parked(self, parked, edit_count):
+        self.parking = False
+        # Dropped if the tab was switched to, edited or hidden while sealing
+        if (self.doc is self.tabs.currentWidget() or edit_count != self.edit_count or self.is_hidden
+                or self.visibility_busy or parked.password != self.current_password):
+            return
+        self.parked = parked
+        self.preview_timer.stop()
+        self.preview.clear_blocks()
+        self._replace_view(PARKED_TEXT)
+        self.editor.setReadOnly(True)
+
+    def unpark_document(self):
+        if self.parked is None or self.visibility_busy:
+            return
+        parked = self.parked
+        self.visibility_busy = True
+        self._submit(
+            unseal_text, self.crypto, parked.sealed, parked.password, label="Unsealing",
+            on_finished=lambda result: self._on_unparked(parked, result[0]),
+            on_failed=lambda error: self._on_unpark_failed(parked, error),
+            on_cancelled=lambda: self._on_unpark_failed(parked))
+
+    def _on_unparked(self, parked, text):
+        if self.parked is not parked:
+            # Hidden by the panic button meanwhile
+            return
+        self.parked = None
+        self.visibility_busy = False
+        self._replace_view(text)
+        self.editor.setReadOnly(False)
+        cursor = self.editor.textCursor()
+        cursor.setPosition(min(parked.cursor, len(text)))
+        self.editor.setTextCursor(cursor)
+        self.editor.verticalScrollBar().setValue(parked.scroll)
+        self.update_preview()
+        self._enforce_memory_budget()
+
+    def _on_unpark_failed(self, parked, error=None):
+        if self.parked is not parked:
+            return
+        # Still parked; switching back to the tab tries again
+        self.visibility_busy = False
+        if error is not None:
+            self.status.showMessage(f"Could not unseal the tab: {error}")
+
+    def _sync_actions(self):
+        # The toolbar shows the state of the active tab
+        doc = self.tabs.currentWidget()
+        self.hide_action.setText("Decrypt" if doc.is_hidden else "Hide")
+        self.stealth_action.setChecked(doc.editor.stealth_mode)
+
+    def cancel_tasks(self):
+        self.crypto_service.cancel(self.doc)
+        self.crypto_service.cancel(self)
+
+    def open_files(self, paths):
+        for path in paths:
+            self.open_file(path)
+
+    def activate(self, paths=()):
+        """Brings the window to the front and opens paths, e.g. handed over by a second launch."""
+        if self.isMinimized():
+            self.showNormal()
+        self.raise_()
+        self.activateWindow()
+        self.open_files(paths)
+
     def create_menus(self):
         menubar = self.menuBar()
         
@@ -426,13 +1354,70 @@ class ModernNotepad(QMainWindow):
         save_as_action.setShortcut("Ctrl+Shift+S")
         save_as_action.triggered.connect(self.save_as_file)
         file_menu.addAction(save_as_action)
+
+        close_tab_action = QAction("Close Tab", self)
+        close_tab_action.setShortcut("Ctrl+W")
+        close_tab_action.triggered.connect(self.close_current_tab)
+        file_menu.addAction(close_tab_action)
         
+        file_menu.addSeparator()
+
+        find_files_action = QAction("Find in Files...", self)
+        find_files_action.setShortcut("Ctrl+Shift+F")
+        find_files_action.triggered.connect(self.find_in_files)
+        file_menu.addAction(find_files_action)
+
+        index_folder_action = QAction("Index Folder for Search...", self)
+        index_folder_action.triggered.connect(self.index_folder)
+        file_menu.addAction(index_folder_action)
+
         file_menu.addSeparator()
         
         exit_action = QAction("Exit", self)
         exit_action.triggered.connect(self.close)
         file_menu.addAction(exit_action)
         
+        # Edit Menu
+        edit_menu = menubar.addMenu("Edit")
+
+        undo_action = QAction("Undo", self)
+        undo_action.setShortcut(QKeySequence.StandardKey.Undo)
+        undo_action.triggered.connect(lambda: self.editor.undo_edit())
+        edit_menu.addAction(undo_action)
+
+        redo_action = QAction("Redo", self)
+        redo_action.setShortcut(QKeySequence.StandardKey.Redo)
+        redo_action.triggered.connect(lambda: self.editor.redo_edit())
+        edit_menu.addAction(redo_action)
+
+        edit_menu.addSeparator()
+
+        find_action = QAction("Find...", self)
+        find_action.setShortcut("Ctrl+F")
+        find_action.triggered.connect(lambda: self.show_find_bar(replace=False))
+        edit_menu.addAction(find_action)
+
+        replace_action = QAction("Replace...", self)
+        replace_action.setShortcut("Ctrl+H")
+        replace_action.triggered.connect(lambda: self.show_find_bar(replace=True))
+        edit_menu.addAction(replace_action)
+
+        find_next_action = QAction("Find Next", self)
+        find_next_action.setShortcut("F3")
+        find_next_action.triggered.connect(self.find_next)
+        edit_menu.addAction(find_next_action)
+
+        find_prev_action = QAction("Find Previous", self)
+        find_prev_action.setShortcut("Shift+F3")
+        find_prev_action.triggered.connect(self.find_previous)
+        edit_menu.addAction(find_prev_action)
+
+        edit_menu.addSeparator()
+
+        undo_limit_action = QAction("Undo History Limit...", self)
+        undo_limit_action.triggered.connect(self.set_undo_limit)
+        edit_menu.addAction(undo_limit_action)
+
         # View Menu
         view_menu = menubar.addMenu("View")
         
@@ -448,11 +1433,20 @@ class ModernNotepad(QMainWindow):
 
         view_menu.addSeparator()
         
-        self.markdown_action = QAction("Toggle Markdown View", self)
+        self.markdown_action = QAction("Markdown Preview", self)
         self.markdown_action.setCheckable(True)
         self.markdown_action.setShortcut("Ctrl+M")
         self.markdown_action.triggered.connect(self.toggle_markdown)
         view_menu.addAction(self.markdown_action)
+
+        self.timings_action = QAction("Operation Timings", self)
+        self.timings_action.setCheckable(True)
+        self.timings_action.triggered.connect(self.toggle_timings)
+        view_menu.addAction(self.timings_action)
+
+        memory_budget_action = QAction("Memory Budget...", self)
+        memory_budget_action.triggered.connect(self.set_memory_budget)
+        view_menu.addAction(memory_budget_action)
         
         # Security Menu
         security_menu = menubar.addMenu("Security")
@@ -460,18 +1454,96 @@ class ModernNotepad(QMainWindow):
         change_pass_action.triggered.connect(self.change_session_password)
         security_menu.addAction(change_pass_action)
 
+        calibrate_action = QAction("Calibrate Unlock Time...", self)
+        calibrate_action.triggered.connect(self.calibrate_kdf)
+        security_menu.addAction(calibrate_action)
+
+        compression_menu = security_menu.addMenu("Compression")
+        for label, spec in (("Off", "none"), ("zlib (fast)", "zlib"), ("lzma (smallest)", "lzma")):
+            compression_action = QAction(label, self)
+            compression_action.triggered.connect(lambda checked, spec=spec: self.set_compression(spec))
+            compression_menu.addAction(compression_action)
+
+        security_menu.addSeparator()
+
+        open_vault_action = QAction("Open Vault...", self)
+        open_vault_action.triggered.connect(lambda: self.open_vault())
+        security_menu.addAction(open_vault_action)
+
+        vault_password_action = QAction("Change Vault Password...", self)
+        vault_password_action.triggered.connect(self.change_vault_password)
+        security_menu.addAction(vault_password_action)
+
     def toggle_markdown(self):
-        self.markdown_mode = not self.markdown_mode
-        if self.markdown_mode:
-            text = self.editor.toPlainText()
-            self.editor.setMarkdown(text)
-            self.editor.setReadOnly(True)
-            self.status.showMessage("Markdown view enabled (Ready-Only)")
+        with span("toggle_markdown"):
+            self.markdown_mode = self.markdown_action.isChecked()
+            for doc in self.documents():
+                doc.preview.setVisible(self.markdown_mode)
+                if self.markdown_mode:
+                    doc.splitter.setSizes([1, 1])
+                else:
+                    doc.preview_timer.stop()
+                    doc.preview.clear_blocks()
+            if self.markdown_mode:
+                # Other tabs render when they are switched to
+                self.update_preview()
+                self.status.showMessage("Markdown preview on")
+            else:
+                self.status.showMessage("Markdown preview off")
+
+    def toggle_timings(self):
+        if self.timings_action.isChecked():
+            if not tracing.enabled():
+                # Timings only, no trace file
+                tracing.start()
+            tracing.add_listener(self.timing_label.record)
+            self.timing_label.setText("")
+            self.timing_label.show()
         else:
-            text = self.editor.toMarkdown()
-            self.editor.setPlainText(text)
-            self.editor.setReadOnly(False)
-            self.status.showMessage("Editor mode")
+            tracing.remove_listener(self.timing_label.record)
+            if not tracing.writing():
+                tracing.stop()
+            self.timing_label.hide()
+
+    def _schedule_preview(self):
+        # Not restarted on every keystroke, so long typing runs still refresh the preview
+        if self.markdown_mode and not self.preview_timer.isActive():
+            self.preview_timer.start()
+
+    def update_preview(self):
+        if not self.markdown_mode:
+            return
+        if self.parked is not None:
+            return
+        if self.is_hidden or self.editor.stealth_mode:
+            # The preview would show the real text
+            self.preview.clear_blocks()
+            self.preview.setPlaceholderText("Preview is off while the text is hidden or in Stealth Mode")
+            return
+        if self.preview_busy:
+            self.preview_stale = True
+            return
+        self.preview_busy = True
+        self.preview_stale = False
+        self._submit(
+            preview_blocks, self.editor.get_actual_text(), key=self.preview, label="",
+            on_finished=self._on_preview_rendered,
+            on_failed=self._on_preview_done,
+            on_cancelled=self._on_preview_done)
+
+    def _on_preview_rendered(self, result):
+        # Dropped if the preview was closed, or the text hidden, while rendering
+        if self.markdown_mode and not self.is_hidden and not self.editor.stealth_mode:
+            self.preview.setPlaceholderText("")
+            if not self.preview.show_blocks(result):
+                QTimer.singleShot(0, self._on_document(self.doc, lambda: self._on_preview_rendered(result)))
+                return
+        self._on_preview_done()
+
+    def _on_preview_done(self, error=None):
+        self.preview_busy = False
+        if self.preview_stale:
+            self._schedule_preview()
 
     def create_toolbar(self):
         toolbar = QToolBar("Toolbar")
@@ -491,30 +1563,27 @@ class ModernNotepad(QMainWindow):
     def toggle_stealth_mode(self):
         is_stealth = self.stealth_action.isChecked()
         self.editor.set_stealth_mode(is_stealth)
+        self.update_preview()
         if is_stealth:
             self.status.showMessage("Stealth Mode ON - Typing is obfuscated")
         else:
             self.status.showMessage("Stealth Mode OFF")
 
     def toggle_visibility(self):
+        if self.visibility_busy:
+            return
+
         if self.is_hidden:
             # Şifre Çözme İşlemi
             dialog = PasswordDialog(self, "Enter Password Again", is_save=False)
             if dialog.exec() == QDialog.DialogCode.Accepted:
                 password = dialog.password
-                try:
-                    b64_content = self.editor.toPlainText().strip() # Encrypted blob is always visible as is
-                    encrypted_data = base64.b64decode(b64_content)
-                    
-                    decrypted_text = self.crypto.decrypt(encrypted_data, password)
-                    self.editor.set_actual_text(decrypted_text)
-                    self.editor.setReadOnly(False)
-                    self.is_hidden = False
-                    self.hide_action.setText("Hide")
-                    self.current_password = password
-                    self.status.showMessage("Content decrypted.")
-                except Exception as e:
-                    QMessageBox.critical(self, "Error", "Incorrect password or corrupted content!")
+                self.visibility_busy = True
+                self._submit(
+                    unseal_text, self.crypto, self.sealed, password, label="Decrypting",
+                    on_finished=lambda result: self._on_revealed(result, password),
+                    on_failed=self._on_reveal_failed,
+                    on_cancelled=self._on_visibility_cancelled)
         else:
             # Gizleme İşlemi
             password = self.current_password
@@ -526,78 +1595,426 @@ class ModernNotepad(QMainWindow):
                 else:
                     return
 
-                    return
+            content = self.editor.get_actual_text()
+            # No edits while the snapshot is being encrypted, they would be lost
+            self.editor.setReadOnly(True)
+            self.visibility_busy = True
+            self._submit(
+                seal_text, self.crypto, content, password, self.current_salt, label="Encrypting",
+                on_finished=self._on_hidden,
+                on_failed=self._on_hide_failed,
+                on_cancelled=self._on_visibility_cancelled)
 
-            try:
-                content = self.editor.get_actual_text()
-                encrypted_bytes = self.crypto.encrypt(content, password)
-                b64_str = base64.b64encode(encrypted_bytes).decode('utf-8')
-                
-                # When hiding, we force stealth mode OFF internally for the view because we are showing the cipher blob
-                if self.editor.stealth_mode:
-                    self.stealth_action.setChecked(False)
-                    self.editor.set_stealth_mode(False) # Reset stealth so we see the blob
-
-                self.editor.setPlainText(b64_str)
-                self.editor.setReadOnly(True)
-                self.is_hidden = True
-                self.hide_action.setText("Decrypt")
-                self.status.showMessage("Content encrypted and hidden.")
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Encryption error: {e}")
+    def _on_hidden(self, result):
+        self.sealed, self.current_salt = result
+        self.visibility_busy = False
 
-    def new_file(self):
-        self.current_file = None
-        self.current_password = None
-        self.editor.clear()
+        # When hiding, we force stealth mode OFF internally for the view because we are showing the placeholder.
+        # Not through set_stealth_mode: putting the real text back first would only lay it out for nothing.
+        self.editor.stealth_mode = False
+
+        # The ciphertext stays in self.sealed; laying out a base64 copy of it would cost more than the crypto
+        self._replace_view(HIDDEN_TEXT.format(size=len(self.sealed), fingerprint=self.sealed[-8:].hex()))
+        self.editor.setReadOnly(True)
+        self.is_hidden = True
+        self.doc.set_covered(False)
+        self._pin_key()
+        self._sync_actions()
+        self.update_preview()
+        self.status.showMessage("Content encrypted and hidden.")
+
+    def _on_hide_failed(self, error):
+        self.visibility_busy = False
+        self.editor.setReadOnly(False)
+        self.doc.set_covered(False)
+        QMessageBox.critical(self, "Error", f"Encryption error: {error}")
+
+    def _on_revealed(self, result, password):
+        self.visibility_busy = False
+        if self.doc.is_covered():
+            # The panic button was pressed while decrypting: stay hidden
+            self.doc.set_covered(False)
+            return
+        decrypted_text, self.current_salt = result
+        self.sealed = None
+        self._replace_view(decrypted_text)
         self.editor.setReadOnly(False)
         self.is_hidden = False
-        self.hide_action.setText("Hide")
+        self._sync_actions()
+        self.current_password = password
+        self._pin_key()
+        self.update_preview()
+        self.status.showMessage("Content decrypted.")
+
+    def _on_reveal_failed(self, error):
+        self.visibility_busy = False
+        self.doc.set_covered(False)
+        QMessageBox.critical(self, "Error", decrypt_error_message(error, "Incorrect password or corrupted content!"))
+
+    def _on_visibility_cancelled(self):
+        self.visibility_busy = False
+        self.doc.set_covered(False)
+        self.editor.setReadOnly(self.is_hidden)
+        self.status.showMessage("Cancelled.")
+
+    def _replace_view(self, text):
+        # Hide/Decrypt swap the whole view but leave the document as saved
+        self.tracking_paused = True
+        try:
+            self.editor.set_actual_text(text)
+        finally:
+            self.tracking_paused = False
+
+    def _on_contents_change(self, pos, removed, added):
+        if self.tracking_paused:
+            return
+        self._schedule_preview()
+        if self.editor.replacing_view:
+            return
+        self.edit_count += 1
+        if self.find_key:
+            # Match positions are stale after any edit
+            self._clear_matches()
+        if self.segment_map:
+            self.segment_map.on_contents_change(pos, removed, added)
+        if self.journal:
+            unit, inserted = self.editor.actual_range(pos, pos + added)
+            self.pending_ops.append((self.edit_count, unit, pos, removed, inserted))
+            if not self.autosave_timer.isActive():
+                self.autosave_timer.start()
+
+    def show_find_bar(self, replace=False):
+        cursor = self.editor.textCursor()
+        if cursor.hasSelection() and not self.is_hidden:
+            self.find_bar.find_input.setText(self.editor.actual_range(cursor.selectionStart(), cursor.selectionEnd())[1])
+        self.find_bar.show()
+        target = self.find_bar.replace_input if replace and self.find_bar.find_input.text() else self.find_bar.find_input
+        target.setFocus()
+        target.selectAll()
+
+    def _clear_matches(self):
+        self.crypto_service.cancel(self.find_bar)
+        self.find_key = None
+        self.find_matches = []
+        self.find_done = False
+        self.find_pending = None
+        self.editor.setExtraSelections([])
+
+    def _find_pattern(self):
+        query = self.find_bar.find_input.text()
+        if not query or self.is_hidden or self.parked is not None:
+            return None
+        try:
+            return compile_pattern(query, **self.find_bar.options())
+        except re.error as e:
+            self.find_bar.count_label.setText(f"Invalid pattern: {e}")
+            return None
+
+    def _start_search(self, key, pattern):
+        self._clear_matches()
+        self.find_key = key
+        self.find_bar.count_label.setText("Searching...")
+        # Searches the real text (never the obfuscated view), on its own queue so saves are not held up
+        self._submit(
+            find_matches, self.editor.get_actual_text(), pattern, not self.editor.stealth_mode,
+            key=self.find_bar, label="Searching",
+            on_partial=self._on_matches_found,
+            on_finished=self._on_search_finished,
+            on_failed=lambda e: self.find_bar.count_label.setText(f"Search failed: {e}"))
+
+    def _on_matches_found(self, batch):
+        if not batch:
+            return
+        self.find_matches.extend(batch)
+        self.find_bar.count_label.setText(f"{len(self.find_matches)} matches...")
+        self._highlight_matches()
+        if self.find_pending:
+            self._go_to_match(self.find_pending == "previous")
+
+    def _on_search_finished(self, count):
+        self.find_done = True
+        self.find_bar.count_label.setText(f"{count} matches" if count else "No matches")
+        if self.find_pending:
+            self._go_to_match(self.find_pending == "previous")
+
+    def _highlight_matches(self):
+        # Highlighting every match of a huge result would slow down painting
+        color = QColor(THEMES[self.current_theme]["find_bg"])
+        selections = []
+        for start, end in self.find_matches[:MAX_HIGHLIGHTS]:
+            selection = QTextEdit.ExtraSelection()
+            selection.format.setBackground(color)
+            selection.cursor = QTextCursor(self.editor.document())
+            selection.cursor.setPosition(start)
+            selection.cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+            selections.append(selection)
+        self.editor.setExtraSelections(selections)
+
+    def find_next(self):
+        self._find(backward=False)
+
+    def find_previous(self):
+        self._find(backward=True)
+
+    def _find(self, backward):
+        if not self.find_bar.isVisible():
+            self.show_find_bar()
+            if not self.find_bar.find_input.text():
+                return
+        pattern = self._find_pattern()
+        if pattern is None:
+            return
+        key = (pattern.pattern, pattern.flags)
+        if key != self.find_key:
+            self._start_search(key, pattern)
+            self.find_pending = "previous" if backward else "next"
+            return
+        self.find_pending = "previous" if backward else "next"
+        self._go_to_match(backward)
+
+    def _go_to_match(self, backward):
+        cursor = self.editor.textCursor()
+        if backward:
+            index = bisect.bisect_left(self.find_matches, (cursor.selectionStart(), -1)) - 1
+            if index < 0:
+                if not self.find_done:
+                    return
+                index = len(self.find_matches) - 1 # wrap around
+        else:
+            index = bisect.bisect_left(self.find_matches, (cursor.selectionEnd(), -1))
+            if index >= len(self.find_matches):
+                if not self.find_done:
+                    return # More matches may still arrive
+                index = 0
+        self.find_pending = None
+        if not self.find_matches:
+            return
+        start, end = self.find_matches[index]
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+        self.editor.setTextCursor(cursor)
+        self.editor.ensureCursorVisible()
+        self.find_bar.count_label.setText(f"{index + 1} of {len(self.find_matches)}" + ("" if self.find_done else "+"))
+
+    def replace_one(self):
+        pattern = self._find_pattern()
+        if pattern is None or self.editor.isReadOnly():
+            return
+        cursor = self.editor.textCursor()
+        selected = (cursor.selectionStart(), cursor.selectionEnd())
+        if (pattern.pattern, pattern.flags) == self.find_key and selected in self.find_matches:
+            _, real = self.editor.actual_range(*selected)
+            match = pattern.fullmatch(real)
+            if match:
+                options = self.find_bar.options()
+                replacement = self.find_bar.replace_input.text()
+                self._replace_range(*selected, match.expand(replacement) if options["regex"] else replacement)
+        self.find_next()
+
+    def _replace_range(self, start, end, text):
+        if self.editor.stealth_mode:
+            self.editor.replace_real_range(start, end, text)
+        else:
+            self.editor.replace_range(start, end, text)
+
+    def replace_all(self):
+        pattern = self._find_pattern()
+        if pattern is None or self.editor.isReadOnly():
+            return
+        self._clear_matches()
+        edit_count = self.edit_count
+        self._submit(
+            replace_all, self.editor.get_actual_text(), pattern, self.find_bar.replace_input.text(),
+            self.find_bar.options()["regex"], not self.editor.stealth_mode, key=self.find_bar, label="Replacing",
+            on_finished=lambda result: self._on_replaced_all(result, edit_count),
+            on_failed=lambda e: self.find_bar.count_label.setText(f"Replace failed: {e}"))
+
+    def _on_replaced_all(self, result, edit_count):
+        start, end, segment, count = result
+        if edit_count != self.edit_count:
+            self.find_bar.count_label.setText("Text changed while replacing; nothing replaced")
+            return
+        if count:
+            # One edit (and one undo step) for all matches
+            self._replace_range(start, end, segment)
+        self.find_bar.count_label.setText(f"Replaced {count} matches" if count else "No matches")
+
+    def _stop_journal(self):
+        self.journal = None
+        self.pending_ops = []
+        self.autosave_timer.stop()
+
+    def autosave(self):
+        """Appends the edits made since the last autosave to the encrypted journal."""
+        if not self.journal or not self.pending_ops or not self.current_password:
+            return
+        ops, self.pending_ops = self.pending_ops, []
+        # No label: autosaves run every few seconds and should not flash the progress bar
+        self._submit(
+            append_journal, self.crypto, self.journal, self.current_password, ops, label="",
+            on_finished=self._on_journal_appended,
+            on_failed=self._on_journal_failed,
+            on_cancelled=self._stop_journal)
+
+    def _on_journal_appended(self, size):
+        if (size > Journal.compact_size and not self.compaction_pending and not self.is_hidden
+                and self.parked is None and self.journal and self.journal.path == self.current_file):
+            # Fold the journal back into the file (incremental when possible)
+            self.compaction_pending = True
+            self._write_file(self.current_file, self.current_password)
+
+    def _on_journal_failed(self, error):
+        # What was appended so far is still a consistent prefix of the edits
+        self._stop_journal()
+        self.status.showMessage(f"Autosave stopped: {error}")
+
+    def _on_task_started(self, label):
+        if not label:
+            return
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.show()
+        self.cancel_button.show()
+        self.status.showMessage(f"{label}...")
+
+    def _on_task_progress(self, label, done, total):
+        if label and total > 0:
+            # Scaled so sizes beyond the 32-bit range of QProgressBar still work
+            self.progress_bar.setRange(0, 1000)
+            self.progress_bar.setValue(done * 1000 // total)
+
+    def _on_tasks_idle(self):
+        self.progress_bar.hide()
+        self.cancel_button.hide()
+
+    def new_file(self):
+        doc = self.tabs.currentWidget()
+        if doc is not None and doc.is_blank():
+            # Starts over in the blank tab, without the session password set on it
+            self._release_key()
+            self.current_password = None
+            self.current_salt = None
+        else:
+            self.new_tab()
         self.status.showMessage("New file")
-        self.update_title()
 
     def update_title(self):
+        if self.tabs.indexOf(self.doc) >= 0:
+            name = os.path.basename(self.current_file) if self.current_file else "Untitled"
+            self.tabs.setTabText(self.tabs.indexOf(self.doc), name)
+            self.tabs.setTabToolTip(self.tabs.indexOf(self.doc), self.current_file or "")
+        # The window title follows the active tab
+        current_file = self.tabs.currentWidget().current_file
         title = "AeTxt - Aes Encrypted Text Editor"
-        if self.current_file:
-            filename = os.path.basename(self.current_file)
+        if current_file:
+            filename = os.path.basename(current_file)
             title = f"{filename} - AeTxt"
         self.setWindowTitle(title)
+
+    def _tab_of(self, file_name):
+        for doc in self.documents():
+            if doc.current_file and os.path.normcase(os.path.abspath(doc.current_file)) == \
+                    os.path.normcase(os.path.abspath(file_name)):
+                return doc
+        return None
+
+    def _open_in_tab(self, fn):
+        """Runs fn on the blank active tab, or on a new one."""
+        doc = self.tabs.currentWidget() if self.tabs.currentWidget().is_blank() else self.new_tab()
+        self.tabs.setCurrentWidget(doc)
+        self._on_document(doc, fn)()
         
     def open_file(self, file_name=None):
         if not file_name:
             file_name, _ = QFileDialog.getOpenFileName(self, "Open File", "", "AeTxt Files (*.aetxt);;All Files (*)")
         
         if file_name:
+            open_tab = self._tab_of(file_name)
+            if open_tab:
+                self.tabs.setCurrentWidget(open_tab)
+                return
             try:
-                with open(file_name, 'rb') as f:
-                    data = f.read()
-                
-                if not data:
-                    self.editor.setPlainText("")
-                    self.current_file = file_name
-                    self._reset_state_after_load()
+                if os.path.getsize(file_name) == 0:
+                    self._open_in_tab(lambda: self._on_empty_file_opened(file_name))
+                    return
+
+                vault = self._vault_of_file(file_name)
+                if vault is not None and not vault.is_unlocked():
+                    # Unlocking the vault once opens all of its files
+                    self.open_vault(vault.folder, then=lambda: self.open_file(file_name))
+                    return
+                if vault is not None:
+                    self._decrypt_to_tab(file_name, vault.password)
                     return
 
-                dialog = PasswordDialog(self, "File Password", is_save=False)
+                dialog = PasswordDialog(self, f"Password for {os.path.basename(file_name)}", is_save=False)
                 if dialog.exec() == QDialog.DialogCode.Accepted:
-                    password = dialog.password
-                    try:
-                        decrypted_text = self.crypto.decrypt(data, password)
-                        self.editor.set_actual_text(decrypted_text)
-                        self.current_file = file_name
-                        self.current_password = password
-                        self._reset_state_after_load()
-                        self.status.showMessage(f"Opened: {file_name}")
-                        self.update_title()
-                    except Exception as e:
-                        QMessageBox.critical(self, "Error", "Decryption failed! Incorrect password or corrupted file.")
+                    self._decrypt_to_tab(file_name, dialog.password)
             except Exception as e:
                 QMessageBox.critical(self, "Error", f"File could not be read: {str(e)}")
 
+    def _decrypt_to_tab(self, file_name, password):
+        # The tab is picked when the text is ready, so a failed open leaves no empty tab behind
+        self.crypto_service.submit(
+            self, decrypt_file, self.crypto, file_name, password, label="Opening",
+            on_finished=lambda result: self._open_in_tab(
+                lambda: self._on_file_opened(result, file_name, password)),
+            on_failed=self._on_open_failed,
+            on_cancelled=lambda: self.status.showMessage("Open cancelled."))
+
+    def _fit_editor(self, chars):
+        """Switches the tab to LargeTextEdit for a text of LARGE_DOCUMENT_CHARS or more, and back below."""
+        editor_class = LargeTextEdit if chars >= LARGE_DOCUMENT_CHARS else StealthTextEdit
+        if type(self.editor) is editor_class:
+            return
+        doc = self.doc
+        font = self.editor.font() # Keeps the zoom
+        doc.replace_editor(editor_class())
+        self._style_document(doc)
+        self.editor.setFont(font)
+        self.editor.document().contentsChange.connect(self._on_document(doc, self._on_contents_change))
+
+    def _on_empty_file_opened(self, file_name):
+        self._stop_journal()
+        self._fit_editor(0)
+        self.editor.set_actual_text("")
+        self.current_file = file_name
+        self.segment_map = None
+        self._reset_state_after_load()
+        self.update_title()
+
+    def _on_file_opened(self, result, file_name, password):
+        decrypted_text, salt, segment_map, journal, recovered = result
+        self._stop_journal()
+        self._fit_editor(len(decrypted_text))
+        self.editor.set_actual_text(decrypted_text)
+        # Qt normalizes some line endings; positions must match the text exactly
+        same_length = self.editor.document().characterCount() - 1 == len(decrypted_text)
+        self.segment_map = segment_map if same_length else None
+        self.edit_count += 1
+        self.journal = journal
+        self.current_file = file_name
+        self.current_password = password
+        self.current_salt = salt
+        self._pin_key()
+        self._reset_state_after_load()
+        self._enforce_memory_budget()
+        if recovered:
+            self.status.showMessage(f"Opened: {file_name} (recovered {recovered} unsaved edits from autosave)")
+        else:
+            self.status.showMessage(f"Opened: {file_name}")
+        self.update_title()
+
+    def _on_open_failed(self, error):
+        if isinstance(error, OSError):
+            QMessageBox.critical(self, "Error", f"File could not be read: {str(error)}")
+        else:
+            QMessageBox.critical(self, "Error", decrypt_error_message(
+                error, "Decryption failed! Incorrect password or corrupted file."))
+
     def _reset_state_after_load(self):
         self.editor.setReadOnly(False)
         self.is_hidden = False
-        self.hide_action.setText("Hide")
+        self._sync_actions()
 
     def save_file(self):
         if self.current_file:
@@ -622,27 +2039,358 @@ class ModernNotepad(QMainWindow):
             dialog = PasswordDialog(self, "Set Password", is_save=True)
             if dialog.exec() == QDialog.DialogCode.Accepted:
                 password = dialog.password
-                self._write_file(file_name, password)
-                self.current_file = file_name
+                if self.is_hidden and password != self.current_password:
+                    # Only the ciphertext is in memory, sealed with the current password
+                    QMessageBox.warning(self, "Save As", "Decrypt the text first to save it with a different password.")
+                    return
+                if password != self.current_password:
+                    # Pending edits still go to the current journal under the old password
+                    self.autosave()
+                    self._release_key()
+                    self.current_salt = None
                 self.current_password = password
+                self._write_file(file_name, password)
     
     def _write_file(self, filename, password):
+        if self.parked is not None:
+            # Only happens while the tab is being unsealed
+            self.status.showMessage("The tab is still being unsealed, try again.")
+            return
+        if self.is_hidden:
+            # The sealed text already is an encrypted file, written as it is.
+            # It replaces what the journal and the segment map describe.
+            self._stop_journal()
+            self.segment_map = None
+            self._submit(
+                write_sealed, self.crypto, filename, self.sealed, label="Saving",
+                on_finished=lambda salt: self._on_file_written(filename, salt),
+                on_failed=self._on_save_failed,
+                on_cancelled=self._on_save_cancelled)
+            return
         content = self.editor.get_actual_text()
-        try:
-            encrypted_data = self.crypto.encrypt(content, password)
-            with open(filename, 'wb') as f:
-                f.write(encrypted_data)
-            self.status.showMessage(f"Saved: {filename}")
-            self.update_title()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Save error: {str(e)}")
+        segment_map = self.segment_map
+        edit_count = self.edit_count
+        if not self.journal:
+            self.journal = Journal(filename)
+        journal = self.journal
+        plan = None
+        if segment_map and segment_map.path == filename and segment_map.salt == self.current_salt \
+                and not self.crypto.joins_vault(filename, password, self.current_salt):
+            plan = segment_map.plan(content)
+
+        def saved(salt, new_map=None, edits=None):
+            self._on_file_written(filename, salt, new_map, edits)
+            self._index_document(filename, content, password)
+
+        if plan:
+            entries, new_map = plan
+            # Edits made while saving are tracked against the new layout
+            self.segment_map = new_map
+            self._submit(
+                save_segments, self.crypto, segment_map, content, password, entries, new_map,
+                journal, edit_count, label="Saving",
+                on_finished=lambda sealed: saved(self.current_salt),
+                on_failed=self._on_save_failed,
+                on_cancelled=self._on_save_cancelled)
+            return
+
+        self._submit(
+            encrypt_to_file, self.crypto, filename, content, password, self.current_salt,
+            journal, edit_count, label="Saving",
+            on_finished=lambda result: saved(result[0], result[1], edit_count),
+            on_failed=self._on_save_failed,
+            on_cancelled=self._on_save_cancelled)
+
+    def _on_file_written(self, filename, salt, segment_map=None, edit_count=None):
+        self.current_salt = salt
+        self._pin_key()
+        self.compaction_pending = False
+        if edit_count is not None:
+            # The map only describes the saved snapshot; drop it if the text changed since
+            self.segment_map = segment_map if edit_count == self.edit_count else None
+        self.current_file = filename
+        self.status.showMessage(f"Saved: {filename}")
+        self.update_title()
+
+    def _search_index(self, folder):
+        folder = os.path.abspath(folder)
+        if folder not in self.search_indexes:
+            from search_index import SearchIndex
+            self.search_indexes[folder] = SearchIndex(folder)
+        return self.search_indexes[folder]
+
+    def _vault(self, folder):
+        folder = os.path.abspath(folder)
+        if folder not in self.vaults:
+            from vault import Vault
+            self.vaults[folder] = Vault(folder)
+        return self.vaults[folder]
+
+    def _vault_of_file(self, file_name):
+        """The vault file_name is sealed under (locked or not), or None for a file with its own password."""
+        with open(file_name, 'rb') as f:
+            vault_id = self.crypto.vault_id_of(f)
+        if vault_id is None:
+            return None
+        vault = self.crypto.vaults.get(vault_id) or self._vault(os.path.dirname(file_name))
+        return vault if vault.exists() else None
+
+    def open_vault(self, folder=None, then=None):
+        if not folder:
+            start_dir = os.path.dirname(self.current_file) if self.current_file else ""
+            folder = QFileDialog.getExistingDirectory(self, "Open Vault", start_dir)
+            if not folder:
+                return
+        vault = self._vault(folder)
+        if vault.is_unlocked():
+            self.status.showMessage(f"Vault already unlocked: {vault.folder}")
+            return
+        create = not vault.exists()
+        if create:
+            answer = QMessageBox.question(
+                self, "Open Vault",
+                f"{vault.folder} has no vault yet. Create one?\n\n"
+                "Notes saved in this folder with the vault password are then encrypted under the vault, "
+                "and open without asking for a password while it is unlocked.")
+            if answer != QMessageBox.StandardButton.Yes:
+                return
+            dialog = PasswordDialog(self, "Set Vault Password", is_save=True)
+        else:
+            dialog = PasswordDialog(self, f"Vault Password for {os.path.basename(vault.folder)}", is_save=False)
+        if dialog.exec() != QDialog.DialogCode.Accepted:
+            return
+        self.crypto_service.submit(
+            self, unlock_vault, self.crypto, vault, dialog.password, create, label="Unlocking vault",
+            on_finished=lambda _: self._on_vault_unlocked(vault, create, then),
+            on_failed=lambda e: QMessageBox.critical(self, "Error", f"Vault could not be unlocked: {e}"))
+
+    def _on_vault_unlocked(self, vault, created, then):
+        if created:
+            self.status.showMessage(f"Vault created: notes saved in {vault.folder} with its password join it.")
+        else:
+            self.status.showMessage(f"Vault unlocked: {vault.folder}")
+        if then:
+            then()
+
+    def change_vault_password(self):
+        vault = self._vault(os.path.dirname(self.current_file)) if self.current_file else None
+        if vault is None or not vault.is_unlocked():
+            unlocked = [vault for vault in self.vaults.values() if vault.is_unlocked()]
+            if len(unlocked) != 1:
+                QMessageBox.information(self, "Change Vault Password",
+                                        "Open the vault first (Security -> Open Vault...), then open one of its notes.")
+                return
+            vault = unlocked[0]
+        dialog = PasswordDialog(self, f"New Vault Password for {os.path.basename(vault.folder)}", is_save=True)
+        if dialog.exec() != QDialog.DialogCode.Accepted:
+            return
+        old_password = vault.password
+        self.crypto_service.submit(
+            self, change_vault_password, self.crypto, vault, dialog.password, label="Changing vault password",
+            on_finished=lambda _: self._on_vault_password_changed(vault, old_password),
+            on_failed=lambda e: QMessageBox.critical(self, "Error", f"Vault password not changed: {e}"))
+
+    def _on_vault_password_changed(self, vault, old_password):
+        # Open notes of the vault keep their data keys; only the password they are saved with changes
+        for doc in self.documents():
+            if doc.current_password == old_password and self.crypto.vault_of_salt(doc.current_salt) is vault:
+                doc.current_password = vault.password
+                if doc.parked is not None:
+                    doc.parked.password = vault.password
+        self.status.showMessage(f"Vault password changed for {vault.folder}. No note had to be re-encrypted.")
+
+    def _index_document(self, filename, content, password):
+        # Only folders where search was switched on have an index
+        index = self._search_index(os.path.dirname(filename))
+        if not index.exists():
+            return
+        self._submit(
+            index_document, self.crypto, index, password, filename, content, label="Indexing",
+            on_finished=lambda _: self.status.showMessage(f"Saved and indexed: {filename}"),
+            on_failed=lambda e: self.status.showMessage(f"Saved, but the search index was not updated: {e}"))
+
+    def _folder_password(self, title):
+        if self.current_password:
+            return self.current_password
+        dialog = PasswordDialog(self, title, is_save=False)
+        if dialog.exec() == QDialog.DialogCode.Accepted:
+            return dialog.password
+        return None
+
+    def index_folder(self):
+        start_dir = os.path.dirname(self.current_file) if self.current_file else ""
+        folder = QFileDialog.getExistingDirectory(self, "Index Folder for Search", start_dir)
+        if not folder:
+            return
+        password = self._folder_password("Index Password")
+        if not password:
+            return
+        self.crypto_service.submit(
+            self, build_search_index, self.crypto, self._search_index(folder), password, label="Indexing folder",
+            on_finished=lambda result: self.status.showMessage(
+                f"Search index created: {result[0]} files indexed, {result[1]} skipped (other password or unreadable)."),
+            on_failed=lambda e: QMessageBox.critical(self, "Error", f"Indexing failed: {e}"))
+
+    def find_in_files(self):
+        folder = os.path.dirname(self.current_file) if self.current_file else ""
+        index = self._search_index(folder) if folder else None
+        if not index or not index.exists():
+            folder = QFileDialog.getExistingDirectory(self, "Find in Files: Choose Folder", folder)
+            if not folder:
+                return
+            index = self._search_index(folder)
+            if not index.exists():
+                QMessageBox.information(self, "Find in Files",
+                                        "This folder has no search index yet. Use File -> Index Folder for Search... first.")
+                return
+        query, ok = QInputDialog.getText(self, "Find in Files", "Words to find (all must appear):")
+        if not ok or not query.strip():
+            return
+        password = self._folder_password("Index Password")
+        if not password:
+            return
+        self.crypto_service.submit(
+            self, search_folder, self.crypto, index, password, query, label="Searching",
+            on_finished=lambda result: self._on_search_done(query, *result),
+            on_failed=lambda e: QMessageBox.critical(self, "Error", str(e)))
+
+    def _on_search_done(self, query, paths, seconds):
+        if not paths:
+            self.status.showMessage(f"No files contain '{query}' ({seconds * 1000:.0f} ms).")
+            return
+        self.status.showMessage(f"{len(paths)} files contain '{query}' ({seconds * 1000:.0f} ms).")
+        names = [os.path.basename(path) for path in paths]
+        name, ok = QInputDialog.getItem(self, "Find in Files", f"Files containing '{query}':", names, 0, False)
+        if ok:
+            self.open_file(paths[names.index(name)])
+
+    def _on_save_failed(self, error):
+        self.segment_map = None
+        self.compaction_pending = False
+        QMessageBox.critical(self, "Error", f"Save error: {str(error)}")
+
+    def _on_save_cancelled(self):
+        # The old file is untouched, but an incremental save already moved the map on
+        self.segment_map = None
+        self.compaction_pending = False
+        self.status.showMessage("Save cancelled.")
 
     def change_session_password(self):
          dialog = PasswordDialog(self, "New Session Password", is_save=True)
          if dialog.exec() == QDialog.DialogCode.Accepted:
+             # The journal is sealed for the old password; a new one starts at the next save
+             self.autosave()
+             self._stop_journal()
+             self._release_key()
              self.current_password = dialog.password
+             self.current_salt = None
+             self.segment_map = None
              self.status.showMessage("Session password updated. (You must Save to apply changes to the file)")
 
+    def closeEvent(self, event):
+        # Unsaved edits stay in the journal and are recovered on the next open
+        for doc in self.documents():
+            self._on_document(doc, self.autosave)()
+        # Let a running save finish instead of killing it halfway
+        self.crypto_service.wait()
+        super().closeEvent(event)
+
+    def load_kdf_setting(self):
+        from crypto_handler import KdfParams
+        spec = self.settings.value("kdf")
+        if spec:
+            try:
+                self.crypto.kdf = KdfParams.parse(spec)
+            except ValueError:
+                pass
+
+    def load_compression_setting(self):
+        from compression import parse_codec
+        spec = self.settings.value("compression")
+        if spec:
+            try:
+                self.crypto.codec = parse_codec(spec)
+            except ValueError:
+                pass
+
+    def set_compression(self, spec):
+        from compression import parse_codec
+        self.crypto.codec = parse_codec(spec)
+        self.settings.setValue("compression", spec)
+        if self.crypto.codec is None:
+            self.status.showMessage("Compression off. Applies to the next full save of each file.")
+        else:
+            self.status.showMessage(f"Compression: {spec} (skipped for text that does not compress). "
+                                    "Applies to the next full save of each file.")
+
+    def calibrate_kdf(self):
+        target_ms, ok = QInputDialog.getInt(
+            self, "Calibrate Unlock Time",
+            "Target time to unlock a file on this machine (ms).\nHigher is slower to brute-force.",
+            500, 100, 10000, 100)
+        if not ok:
+            return
+        self.crypto_service.submit(
+            self, calibrate, self.crypto, target_ms / 1000, "pbkdf2", label="Calibrating",
+            on_finished=lambda kdf: self._on_kdf_calibrated(kdf, target_ms),
+            on_failed=lambda e: QMessageBox.critical(self, "Error", f"Calibration failed: {e}"))
+
+    def _on_kdf_calibrated(self, kdf, target_ms):
+        self.crypto.kdf = kdf
+        self.settings.setValue("kdf", str(kdf))
+        self.status.showMessage(f"Key derivation set to {kdf} (~{target_ms} ms to unlock). Applies to new files and password changes.")
+
+    def _pin_key(self):
+        # The key is already derived (this runs after an open, save, hide or decrypt);
+        # keep it so the panic button can seal the text at once, whenever it comes
+        if self.current_password and self.current_salt is not None:
+            self.crypto.pin_key(self.current_password, self.current_salt)
+
+    def _release_key(self):
+        # The document is closed or gets a new password: its key goes, unless another tab
+        # is sealed with the same password and salt
+        if not self.current_password or self.current_salt is None:
+            return
+        for doc in self.documents():
+            if doc is not self.doc and (doc.current_password, doc.current_salt) == \
+                    (self.current_password, self.current_salt):
+                return
+        self.crypto.forget_key(self.current_password, self.current_salt)
+
+    def panic_all(self):
+        """
+        The double-Alt panic, in two phases. Every tab is covered and painted
+        before this returns, with no work that grows with the text. Sealing
+        (with the key pinned at unlock) or obfuscating follows per tab; each
+        cover comes off once its tab shows nothing readable.
+        """
+        with span("panic blank"):
+            for doc in self.documents():
+                doc.set_covered(True)
+            # Paint now instead of at the next pass of the event loop
+            self.repaint()
+        for doc in self.documents():
+            self._on_document(doc, self.panic)()
+
+    def panic(self):
+        # PANIC LOGIC: Ensure content is hidden/obfuscated.
+        # 0. A parked tab is already sealed: show it as hidden, so unsealing needs the password
+        if self.parked is not None:
+            parked, self.parked = self.parked, None
+            self._on_hidden((parked.sealed, self.crypto.salt_of(parked.sealed)))
+        # 1. If we have a password and are NOT hidden, hide it.
+        elif self.current_password and not self.is_hidden:
+            self.toggle_visibility() # Will encrypt and hide
+        # 2. If we do NOT have a password, force Stealth Mode (if not already on)
+        elif not self.current_password and not self.editor.stealth_mode:
+            self.editor.set_stealth_mode(True)
+            self._sync_actions()
+            self.status.showMessage("Panic Mode: Stealth Activated")
+        # 3. If already hidden or in stealth, DO NOTHING (Safety: don't reveal)
+        if not self.visibility_busy:
+            # Nothing readable is left on this tab (a running hide takes the cover off when done)
+            self.doc.set_covered(False)
+
     def keyReleaseEvent(self, event):
         if event.key() == Qt.Key.Key_Alt:
             # Ignore auto-repeats (holding down key)
@@ -652,28 +2400,48 @@ class ModernNotepad(QMainWindow):
             
             current_time = time.time()
             if current_time - self.last_alt_time < 0.4:  # 400ms threshold
-                # PANIC LOGIC: Ensure content is hidden/obfuscated.
-                # 1. If we have a password and are NOT hidden, hide it.
-                if self.current_password and not self.is_hidden:
-                    self.toggle_visibility() # Will encrypt and hide
-                # 2. If we do NOT have a password, force Stealth Mode (if not already on)
-                elif not self.current_password and not self.editor.stealth_mode:
-                    self.stealth_action.setChecked(True)
-                    self.editor.set_stealth_mode(True)
-                    self.status.showMessage("Panic Mode: Stealth Activated")
-                # 3. If already hidden or in stealth, DO NOTHING (Safety: don't reveal)
+                # Every tab, not only the one on screen
+                self.panic_all()
             
             self.last_alt_time = current_time
         
         super().keyReleaseEvent(event)
 
 if __name__ == "__main__":
+    if "--profile-startup" in sys.argv:
+        # Prints where the time to the first paint goes, then exits
+        sys.argv.remove("--profile-startup")
+        startup_profile = StartupProfile()
+
+    trace_args = [arg for arg in sys.argv[1:] if arg == "--trace" or arg.startswith("--trace=")]
+    if trace_args:
+        # Times key derivation, AES-GCM, file I/O and editor work (see tracing.py)
+        index = sys.argv.index(trace_args[0])
+        trace_path, taken = trace_path_from_args(sys.argv[index:])
+        del sys.argv[index:index + taken]
+        tracing.start(trace_path)
+
+    single_instance = "--new-instance" not in sys.argv and not startup_profile and not tracing.enabled()
+    if "--new-instance" in sys.argv:
+        sys.argv.remove("--new-instance")
+
     app = QApplication(sys.argv)
+    profile_mark("QApplication")
     
     font = QFont("Segoe UI", 10)
     app.setFont(font)
     
-    window = ModernNotepad()
+    window = ModernNotepad(sys.argv[1:])
+    if single_instance:
+        from single_instance import InstanceServer
+        server = InstanceServer(window)
+        # If another instance won the race to listen, this one just runs on its own
+        if server.listen():
+            server.files_received.connect(window.activate)
+    profile_mark("rest of the window")
+    if startup_profile:
+        window.editor.viewport().installEventFilter(startup_profile)
     window.show()
+    profile_mark("show")
     
     sys.exit(app.exec())
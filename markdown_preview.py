@@ -0,0 +1,58 @@
+import re
+
+# Live Markdown preview, rendered block by block.
+#
+# The source is cut into top-level blocks that render the same on their own
+# (paragraphs, headings, lists, fenced code...). The text is split on a worker
+# thread; only plain strings cross back. Each block is then parsed once into a
+# QTextDocumentFragment on the GUI thread (fragments are Qt objects and belong to
+# the thread that made them) and cached by its source, so after an edit only the
+# blocks that changed are parsed and swapped in the preview.
+
+_FENCE = re.compile(r" {0,3}(`{3,}|~{3,})")
+_HEADING = re.compile(r" {0,3}#{1,6}(\s|$)")
+
+
+def split_blocks(text):
+    """
+    Returns the Markdown blocks of text, without trailing blank lines. A block
+    starts at a heading or at an unindented line after a blank line; fenced code
+    stays in one block however many blank lines it holds.
+    """
+    blocks = []
+    lines = []
+    fence = None
+    blank = False
+    for line in text.split("\n"):
+        if fence:
+            lines.append(line)
+            if line.strip().startswith(fence):
+                fence = None
+            continue
+        if not line.strip():
+            blank = True
+            lines.append(line)
+            continue
+        starts_block = _HEADING.match(line) or (blank and not line[:1].isspace())
+        if starts_block and lines:
+            blocks.append("\n".join(lines).rstrip())
+            lines = []
+        blank = False
+        lines.append(line)
+        match = _FENCE.match(line)
+        if match:
+            fence = match.group(1)[0] * 3
+    if lines:
+        blocks.append("\n".join(lines).rstrip())
+    return [block for block in blocks if block]
+
+
+def preview_blocks(text, progress):
+    """Worker task: the blocks of text, as split_blocks."""
+    return split_blocks(text)
+
+
+def render_block(block):
+    """Parses one block. GUI thread only."""
+    from PyQt6.QtGui import QTextDocumentFragment
+    return QTextDocumentFragment.fromMarkdown(block)
@@ -0,0 +1,93 @@
+import os
+import string
+
+# Stealth mode obfuscation without a Python loop per character.
+#
+# Every character is first mapped to a "class byte": ASCII whitespace keeps its
+# own code (all below 0x40), upper case becomes 0x40, lower case 0x80 and
+# anything else 0xC0. os.urandom supplies one random byte per character, drawn
+# from 0..207 only (the rest are thrown away) and reduced modulo 52, so it is
+# uniform over 0..51 and, modulo 26, over 0..25. It is dropped for whitespace
+# and OR-ed into the class byte. A single bytes.translate then turns each byte
+# into a letter of the right kind, or back into the whitespace character it
+# came from; codes 52..63 of a class never occur.
+
+_UPPER = 0x40
+_LOWER = 0x80
+_OTHER = 0xC0
+_RANDOM_BITS = 0x3F
+# Largest multiple of 52 (and so of 26) that fits in a byte
+_RANDOM_LIMIT = 208
+_REJECTED = bytes(range(_RANDOM_LIMIT, 256))
+_MOD_52 = bytes(i % 52 for i in range(256))
+
+
+def _class_of(char):
+    if char.isspace():
+        # Non-ASCII spaces are shown as a plain space so every class fits in one byte
+        return ord(char) if ord(char) < _UPPER else ord(" ")
+    if char.isupper():
+        return _UPPER
+    if char.islower():
+        return _LOWER
+    return _OTHER
+
+
+class _ClassMap(dict):
+    """str.translate table that classifies characters on first sight and caches them."""
+
+    def __missing__(self, code):
+        value = self[code] = chr(_class_of(chr(code)))
+        return value
+
+
+_CLASS_MAP = _ClassMap()
+_LATIN1_CLASSES = bytes(_class_of(chr(i)) for i in range(256))
+_MASKS = bytes(_RANDOM_BITS if i >= _UPPER else 0 for i in range(256))
+
+
+def _cycle(letters, count):
+    return (letters * (count // len(letters) + 1))[:count]
+
+
+_OUTPUT = (
+    bytes(range(_UPPER))
+    + _cycle(string.ascii_uppercase, 64).encode("ascii")
+    + _cycle(string.ascii_lowercase, 64).encode("ascii")
+    + _cycle(string.ascii_letters, 64).encode("ascii")
+)
+
+
+def _random_indexes(count):
+    """count random bytes, each uniform in 0..51."""
+    noise = b""
+    while len(noise) < count:
+        # About 19% of bytes are rejected; draw a little extra so one round usually does
+        draw = os.urandom((count - len(noise)) * 5 // 4 + 16)
+        noise += draw.translate(None, _REJECTED)
+    return noise[:count].translate(_MOD_52)
+
+
+def classify(text: str) -> bytes:
+    """Returns one class byte per character of text."""
+    try:
+        # Fast path for ASCII/Latin-1 text: one bytes.translate
+        return text.encode("latin-1").translate(_LATIN1_CLASSES)
+    except UnicodeEncodeError:
+        return text.translate(_CLASS_MAP).encode("latin-1")
+
+
+def obfuscate(text: str) -> str:
+    """
+    Returns a random look-alike of text: letters keep their case, other symbols
+    become random letters and whitespace (including newlines) is kept, so the
+    result has the same length and line structure.
+    """
+    if not text:
+        return ""
+    classes = classify(text)
+    noise = _random_indexes(len(classes))
+    mask = classes.translate(_MASKS)
+    # Byte-wise AND/OR over the whole buffer at once through big integers
+    combined = int.from_bytes(classes, "big") | (int.from_bytes(noise, "big") & int.from_bytes(mask, "big"))
+    return combined.to_bytes(len(classes), "big").translate(_OUTPUT).decode("ascii")
@@ -0,0 +1,168 @@
+import random
+
+
+class _Piece:
+    """A node of the piece tree: a slice of a source string plus treap bookkeeping."""
+    __slots__ = ("source", "start", "length", "priority", "left", "right", "size")
+
+    def __init__(self, source, start, length, priority=None):
+        self.source = source
+        self.start = start
+        self.length = length
+        self.priority = random.random() if priority is None else priority
+        self.left = None
+        self.right = None
+        self.size = length
+
+    def update(self):
+        self.size = self.length
+        if self.left:
+            self.size += self.left.size
+        if self.right:
+            self.size += self.right.size
+
+
+def _size(node):
+    return node.size if node else 0
+
+
+class PieceTable:
+    """
+    Text buffer with O(log n) insert and delete.
+
+    The text is a sequence of pieces (slices of the original text or of inserted
+    strings) kept in a treap ordered by position, so edits never copy the
+    whole document. Consecutive typing is appended to the same small piece.
+    """
+
+    # Pieces shorter than this may grow in place when typing continues right after them
+    run_limit = 4096
+
+    def __init__(self, text=""):
+        self._root = _Piece(text, 0, len(text)) if text else None
+
+    def __len__(self):
+        return _size(self._root)
+
+    def __str__(self):
+        return self.text()
+
+    def text(self):
+        """Materializes the whole buffer as a str."""
+        parts = []
+        stack = []
+        node = self._root
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            parts.append(node.source[node.start:node.start + node.length])
+            node = node.right
+        return "".join(parts)
+
+    def slice(self, start, end):
+        """Returns text[start:end] without materializing the rest of the buffer."""
+        start = max(0, start)
+        end = min(len(self), end)
+        parts = []
+        self._collect(self._root, start, end, parts)
+        return "".join(parts)
+
+    def _collect(self, node, start, end, parts):
+        if node is None or start >= end:
+            return
+        left_size = _size(node.left)
+        if start < left_size:
+            self._collect(node.left, start, min(end, left_size), parts)
+        piece_end = left_size + node.length
+        lo = max(start, left_size)
+        hi = min(end, piece_end)
+        if lo < hi:
+            offset = node.start + lo - left_size
+            parts.append(node.source[offset:offset + hi - lo])
+        if end > piece_end:
+            self._collect(node.right, max(start, piece_end) - piece_end, end - piece_end, parts)
+
+    def insert(self, pos, text):
+        if not text:
+            return
+        if not 0 <= pos <= len(self):
+            raise IndexError("insert position out of range")
+        if self._extend(pos, text):
+            return
+        left, right = self._split(self._root, pos)
+        self._root = self._merge(self._merge(left, _Piece(text, 0, len(text))), right)
+
+    def delete(self, start, end):
+        """Removes text[start:end]."""
+        start = max(0, start)
+        end = min(len(self), end)
+        if start >= end:
+            return
+        left, rest = self._split(self._root, start)
+        _, right = self._split(rest, end - start)
+        self._root = self._merge(left, right)
+
+    def _extend(self, pos, text):
+        """Appends text to the piece ending at pos if that piece is a short typing run."""
+        path = []
+        node = self._root
+        while node:
+            path.append(node)
+            left_size = _size(node.left)
+            if pos <= left_size:
+                node = node.left
+            elif pos > left_size + node.length:
+                pos -= left_size + node.length
+                node = node.right
+            else:
+                break
+        if node is None or pos != _size(node.left) + node.length:
+            return False
+        if node.start + node.length != len(node.source) or len(node.source) >= self.run_limit:
+            return False
+        node.source += text
+        node.length += len(text)
+        for ancestor in path:
+            ancestor.size += len(text)
+        return True
+
+    def _split(self, node, pos):
+        """Splits node into trees holding the first pos characters and the rest."""
+        if node is None:
+            return None, None
+        left_size = _size(node.left)
+        if pos <= left_size:
+            left, right = self._split(node.left, pos)
+            node.left = right
+            node.update()
+            return left, node
+        if pos >= left_size + node.length:
+            left, right = self._split(node.right, pos - left_size - node.length)
+            node.right = left
+            node.update()
+            return node, right
+        # pos falls inside this piece: cut it in two. The right half inherits the
+        # priority so it can take over the right subtree without breaking heap order.
+        offset = pos - left_size
+        tail = _Piece(node.source, node.start + offset, node.length - offset, node.priority)
+        tail.right = node.right
+        tail.update()
+        node.length = offset
+        node.right = None
+        node.update()
+        return node, tail
+
+    def _merge(self, left, right):
+        if left is None:
+            return right
+        if right is None:
+            return left
+        if left.priority > right.priority:
+            left.right = self._merge(left.right, right)
+            left.update()
+            return left
+        right.left = self._merge(left, right.left)
+        right.update()
+        return right
@@ -0,0 +1,237 @@
+import os
+import re
+import hmac
+import json
+import base64
+import struct
+from crypto_handler import AESGCM, KdfParams
+from file_io import atomic_write
+
+# Opt-in encrypted search index of the .aetxt files in one folder (<folder>/.aetxt-index).
+#
+#   header: MAGIC | version | salt(16) | kdf_len(B) | kdf
+#   record: len(>I) | nonce(12) | AES-GCM(JSON {"docs": {file name: base64(tokens) or null}}),
+#           AAD = header | record index(>Q)
+#
+# Records apply in order (null drops a file): a save appends one record with the
+# entry of its file instead of sealing the whole index again, and the index is
+# rewritten as a single record once superseded records pile up.
+#
+# Words are never stored, not even inside the sealed body: each distinct word of a
+# document becomes a token, the first 8 bytes of HMAC-SHA256(term key, word).
+# Queries hash their words the same way and intersect the posting sets, so a
+# search touches no document body. Both keys come from the index password
+# through the configured KDF (cached like file keys) and two HMAC labels.
+
+INDEX_NAME = ".aetxt-index"
+INDEX_MAGIC = b"AEIX"
+INDEX_VERSION = 1
+TOKEN_SIZE = 8
+
+_HEADER = struct.Struct(">4sB16sB")
+_NONCE_SIZE = 12
+_MAX_RECORD = 64 * 1024 * 1024
+_WORD = re.compile(r"\w{2,64}")
+
+
+def index_path(folder):
+    return os.path.join(folder, INDEX_NAME)
+
+
+def words_of(text):
+    """Distinct searchable words of text (case-insensitive, 2 to 64 word characters)."""
+    return set(_WORD.findall(text.casefold()))
+
+
+def _token(term_key, word):
+    return hmac.digest(term_key, word.encode('utf-8'), "sha256")[:TOKEN_SIZE]
+
+
+def _disk_stamp(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+class SearchIndex:
+    """
+    Search index of one folder. Loaded once and kept in memory; reloaded only
+    when another process changed the file. Not thread-safe: use it from the
+    CryptoService tasks of one window.
+    """
+
+    def __init__(self, folder):
+        self.folder = os.path.abspath(folder)
+        self.path = index_path(self.folder)
+        self.salt = None
+        self.kdf = None
+        self.header = None
+        self.docs = {} # file name -> concatenated tokens
+        self.records = 0 # Records in the file; None when the next change must rewrite it
+        self._postings = None # token -> set of file names, built on first search
+        self._stamp = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _keys(self, crypto, password):
+        key, _ = crypto.derive_key(password, self.salt, self.kdf)
+        return (hmac.digest(key, b"aetxt index body", "sha256"),
+                hmac.digest(key, b"aetxt index terms", "sha256"))
+
+    def _tokens(self, term_key, words):
+        return b"".join(sorted(_token(term_key, word) for word in words))
+
+    def create(self, crypto, password, write=True):
+        """Starts an empty index for the folder (replacing any existing one)."""
+        self.salt = os.urandom(crypto.salt_size)
+        _, self.kdf = crypto.derive_key(password, self.salt)
+        kdf = self.kdf.encode()
+        self.header = _HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self.salt, len(kdf)) + kdf
+        self.docs = {}
+        self.records = None
+        self._postings = None
+        if write:
+            self._write(crypto, password)
+
+    def rebuild(self, crypto, password, documents):
+        """Creates a new index from (file_path, text) pairs, writing it once at the end."""
+        self.create(crypto, password, write=False)
+        _, term_key = self._keys(crypto, password)
+        for file_path, text in documents:
+            self.docs[os.path.basename(file_path)] = self._tokens(term_key, words_of(text))
+        self._write(crypto, password)
+
+    def load(self, crypto, password):
+        """Reads the index unless the copy in memory is current. Wrong passwords raise ValueError."""
+        stamp = _disk_stamp(self.path)
+        if stamp == self._stamp:
+            return
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        if len(data) < _HEADER.size:
+            raise ValueError("Search index corrupted")
+        magic, version, salt, kdf_len = _HEADER.unpack(data[:_HEADER.size])
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError("Not an AeTxt search index")
+        header = data[:_HEADER.size + kdf_len]
+        self.salt = salt
+        self.kdf = KdfParams.decode(header[_HEADER.size:])
+        docs = {}
+        records = self._read_records(AESGCM(self._keys(crypto, password)[0]), header, data, docs)
+        self.header = header
+        self.docs = docs
+        self.records = records
+        self._postings = None
+        self._stamp = stamp
+
+    def _read_records(self, aesgcm, header, data, docs):
+        """Applies the records of data to docs; returns their count, or None after a torn last record."""
+        records = 0
+        offset = len(header)
+        while offset < len(data):
+            length = struct.unpack(">I", data[offset:offset + 4])[0] if offset + 4 <= len(data) else None
+            end = offset + 4 + _NONCE_SIZE + (length or 0)
+            if length is None or length > _MAX_RECORD or end > len(data):
+                # Crash while appending: the entry is written again with the next save
+                return None
+            nonce = data[offset + 4:offset + 4 + _NONCE_SIZE]
+            try:
+                body = aesgcm.decrypt(nonce, data[offset + 4 + _NONCE_SIZE:end], header + struct.pack(">Q", records))
+            except Exception:
+                if records == 0:
+                    raise ValueError("Incorrect password for the search index, or the index is corrupted")
+                raise ValueError("Search index corrupted")
+            self._apply(docs, body)
+            records += 1
+            offset = end
+        return records
+
+    @staticmethod
+    def _apply(docs, body):
+        for name, tokens in json.loads(body)["docs"].items():
+            if tokens is None:
+                docs.pop(name, None)
+            else:
+                docs[name] = base64.b64decode(tokens)
+
+    def _seal_record(self, crypto, password, docs, index):
+        body_key, _ = self._keys(crypto, password)
+        body = json.dumps({"docs": {name: None if tokens is None else base64.b64encode(tokens).decode('ascii')
+                                    for name, tokens in docs.items()}}).encode('utf-8')
+        nonce = os.urandom(_NONCE_SIZE)
+        sealed = AESGCM(body_key).encrypt(nonce, body, self.header + struct.pack(">Q", index))
+        return struct.pack(">I", len(sealed)) + nonce + sealed
+
+    def _write(self, crypto, password):
+        """Rewrites the whole index as one record."""
+        atomic_write(self.path, [self.header, self._seal_record(crypto, password, self.docs, 0)])
+        self.records = 1
+        self._stamp = _disk_stamp(self.path)
+
+    def _write_entry(self, crypto, password, name, tokens):
+        """Appends the new entry of one file (None once removed), or rewrites the index when due."""
+        if self.records is None or self.records > max(64, len(self.docs)):
+            self._write(crypto, password)
+            return
+        record = self._seal_record(crypto, password, {name: tokens}, self.records)
+        with open(self.path, 'ab') as f:
+            f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+        self.records += 1
+        self._stamp = _disk_stamp(self.path)
+
+    def update(self, crypto, password, file_path, text):
+        """Replaces the entry of file_path (which must be in this folder) with the words of text."""
+        self.load(crypto, password)
+        name = os.path.basename(file_path)
+        _, term_key = self._keys(crypto, password)
+        tokens = self._tokens(term_key, words_of(text))
+        old = self.docs.get(name)
+        if old == tokens:
+            return
+        self.docs[name] = tokens
+        if self._postings is not None:
+            self._unpost(name, old)
+            self._post(name, tokens)
+        self._write_entry(crypto, password, name, tokens)
+
+    def remove(self, crypto, password, file_path):
+        self.load(crypto, password)
+        name = os.path.basename(file_path)
+        if name in self.docs:
+            tokens = self.docs.pop(name)
+            if self._postings is not None:
+                self._unpost(name, tokens)
+            self._write_entry(crypto, password, name, None)
+
+    def _post(self, name, tokens):
+        for i in range(0, len(tokens), TOKEN_SIZE):
+            self._postings.setdefault(tokens[i:i + TOKEN_SIZE], set()).add(name)
+
+    def _unpost(self, name, tokens):
+        for i in range(0, len(tokens or b""), TOKEN_SIZE):
+            names = self._postings.get(tokens[i:i + TOKEN_SIZE])
+            if names:
+                names.discard(name)
+
+    def search(self, crypto, password, query):
+        """Returns the paths of indexed files containing every word of query, sorted by name."""
+        self.load(crypto, password)
+        words = words_of(query)
+        if not words:
+            return []
+        if self._postings is None:
+            self._postings = {}
+            for name, tokens in self.docs.items():
+                self._post(name, tokens)
+        _, term_key = self._keys(crypto, password)
+        matches = None
+        for word in words:
+            names = self._postings.get(_token(term_key, word), set())
+            matches = set(names) if matches is None else matches & names
+            if not matches:
+                return []
+        paths = (os.path.join(self.folder, name) for name in sorted(matches))
+        # Files deleted or renamed outside the editor may still be listed
+        return [path for path in paths if os.path.exists(path)]
@@ -2,10 +2,13 @@ import sys
 from cx_Freeze import setup, Executable
 
 # Dependencies
+# Modules are found by following imports (also the lazy ones inside functions), so only
+# cryptography, which loads its backend dynamically, is listed. Listing all of PyQt6 would
+# ship every Qt module; the hooks add just the ones imported (QtCore, QtGui, QtWidgets, QtNetwork).
 build_exe_options = {
-    "packages": ["os", "sys", "base64", "random", "string", "cryptography", "PyQt6"],
-    "excludes": [],
-    "include_files": ["logo.ico", "logo.png"]
+    "packages": ["cryptography"],
+    "excludes": ["tkinter", "unittest", "test", "pydoc_data", "lib2to3", "idlelib", "turtledemo"],
+    "include_files": ["logo.ico"]
 }
 
 # GUI base
@@ -87,6 +90,13 @@ setup(
             icon="logo.ico",
             shortcut_name="AeTxt",
             shortcut_dir="DesktopFolder",
-        )
+        ),
+        # Headless command line tool (aetxt encrypt|decrypt|cat|verify)
+        Executable(
+            "cli.py",
+            base=None,
+            target_name="aetxt.exe",
+            icon="logo.ico",
+        ),
     ],
 )
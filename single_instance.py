@@ -0,0 +1,85 @@
+import os
+import getpass
+import hashlib
+from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtNetwork import QLocalServer, QLocalSocket
+
+# Single-instance mode. The first AeTxt process listens on a per-user local socket
+# (a named pipe on Windows); later launches connect to it, hand over the files
+# they were given and exit, so a double-click opens a tab in the running window
+# instead of starting Qt again.
+#
+# Message: absolute paths, each followed by a NUL byte, then a newline. A message
+# without paths just brings the running window to the front; a connection closed
+# before the newline (like the liveness check in InstanceServer.listen) is ignored.
+
+CONNECT_TIMEOUT_MS = 200
+WRITE_TIMEOUT_MS = 1000
+
+
+def server_name():
+    # Per user, so two accounts on one machine don't share a window
+    user = getpass.getuser().encode('utf-8', 'replace')
+    return "aetxt-" + hashlib.sha256(user).hexdigest()[:16]
+
+
+def _is_running(name):
+    socket = QLocalSocket()
+    socket.connectToServer(name)
+    running = socket.waitForConnected(CONNECT_TIMEOUT_MS)
+    socket.abort()
+    return running
+
+
+def hand_off(paths):
+    """Sends paths to a running instance. Returns False if there is none (or it did not answer)."""
+    socket = QLocalSocket()
+    socket.connectToServer(server_name())
+    if not socket.waitForConnected(CONNECT_TIMEOUT_MS):
+        return False
+    socket.write(b"".join(os.path.abspath(path).encode('utf-8') + b"\0" for path in paths) + b"\n")
+    if not socket.waitForBytesWritten(WRITE_TIMEOUT_MS) and socket.bytesToWrite():
+        return False
+    socket.disconnectFromServer()
+    if socket.state() != QLocalSocket.LocalSocketState.UnconnectedState:
+        socket.waitForDisconnected(WRITE_TIMEOUT_MS)
+    return True
+
+
+class InstanceServer(QObject):
+    """Receives the paths later launches hand off (see hand_off)."""
+    files_received = pyqtSignal(list)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.server = QLocalServer(self)
+        self.server.setSocketOptions(QLocalServer.SocketOption.UserAccessOption)
+        self.server.newConnection.connect(self._on_new_connection)
+
+    def listen(self):
+        """Starts listening. Returns False if another instance already is."""
+        name = server_name()
+        if self.server.listen(name):
+            return True
+        if self.server.serverError() != QLocalSocket.LocalSocketError.AddressInUseError:
+            return False
+        if _is_running(name):
+            return False
+        # Left behind by an instance that crashed (Unix socket files outlive their process)
+        QLocalServer.removeServer(name)
+        return self.server.listen(name)
+
+    def _on_new_connection(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            data = bytearray()
+            socket.readyRead.connect(lambda socket=socket, data=data: data.extend(socket.readAll().data()))
+            socket.disconnected.connect(lambda socket=socket, data=data: self._on_message(socket, data))
+
+    def _on_message(self, socket, data):
+        data.extend(socket.readAll().data())
+        socket.deleteLater()
+        if not data.endswith(b"\n"):
+            return
+        paths = [path.decode('utf-8', 'replace') for path in bytes(data[:-1]).split(b"\0") if path]
+        self.files_received.emit(paths)
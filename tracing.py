@@ -0,0 +1,147 @@
+import os
+import time
+import atexit
+import functools
+import threading
+from contextlib import contextmanager, nullcontext
+
+# Opt-in timing of the hot paths: key derivation, AES-GCM, file I/O and the
+# editor's stealth rendering (main.py --trace). Spans nest per thread.
+#
+# A path ending in .jsonl gets one JSON object per span:
+#     {"name": ..., "ts": ..., "dur": ..., "tid": ..., "args": {...}}
+# with times in microseconds since tracing started. Any other path gets the
+# Chrome trace event format, which chrome://tracing and ui.perfetto.dev open.
+#
+# While tracing is off, span() hands back one shared no-op context manager, so
+# the instrumented code pays for one function call and nothing else.
+
+_OFF = nullcontext()
+_tracer = None
+
+
+class Tracer:
+    def __init__(self, path=None):
+        import json # Not at import time: the editor imports this module at startup
+        self._dumps = json.dumps
+        self.path = path
+        self.chrome = path is not None and not path.endswith(".jsonl")
+        self.listeners = []
+        # 'x': a trace never replaces an existing file (a note passed by mistake, say)
+        self._file = open(path, 'x', encoding='utf-8') if path else None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+        self._count = 0
+        if self.chrome:
+            self._file.write("[\n")
+
+    @contextmanager
+    def span(self, name, args):
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self._local.depth = depth
+            self._record(name, start, end, args, depth)
+
+    def _record(self, name, start, end, args, depth):
+        if self._file is not None:
+            event = {
+                "name": name,
+                "ts": round((start - self._origin) * 1e6, 1),
+                "dur": round((end - start) * 1e6, 1),
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+            if self.chrome:
+                event.update(ph="X", pid=self._pid)
+            line = self._dumps(event, default=str)
+            with self._lock:
+                if self._file is not None:
+                    if self.chrome and self._count:
+                        self._file.write(",\n")
+                    self._file.write(line if self.chrome else line + "\n")
+                    self._count += 1
+        # Listeners only see whole operations, not the spans nested in them
+        if depth == 0:
+            for listener in list(self.listeners):
+                listener(name, end - start)
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            if self.chrome:
+                self._file.write("\n]\n")
+            self._file.close()
+            self._file = None
+
+
+def span(name, **args):
+    """Context manager timing the enclosed block as name (args go into the trace)."""
+    if _tracer is None:
+        return _OFF
+    return _tracer.span(name, args)
+
+
+def traced(name):
+    """Decorator form of span() for whole functions and methods."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return fn(*args, **kwargs)
+            with _tracer.span(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def enabled():
+    return _tracer is not None
+
+
+def start(path=None):
+    """
+    Starts tracing into path (see the top of this module). Without a path spans
+    are only passed to the listeners. Restarting closes the previous trace.
+    """
+    global _tracer
+    tracer = Tracer(path)
+    if _tracer is not None:
+        tracer.listeners = _tracer.listeners
+        _tracer.close()
+    _tracer = tracer
+    return tracer
+
+
+def stop():
+    """Stops tracing and finishes the trace file."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.close()
+
+
+def writing():
+    """True if spans are going to a file (not just to the listeners)."""
+    return _tracer is not None and _tracer.path is not None
+
+
+def add_listener(fn):
+    """Calls fn(name, seconds) from whatever thread ends a top-level span."""
+    if _tracer is not None:
+        _tracer.listeners.append(fn)
+
+
+def remove_listener(fn):
+    if _tracer is not None and fn in _tracer.listeners:
+        _tracer.listeners.remove(fn)
+
+
+atexit.register(stop)
@@ -0,0 +1,150 @@
+import re
+import time
+from collections import deque
+
+# Operation-based undo/redo for the editor, in plain and in stealth mode.
+#
+# Every step is a delta: the position, the text removed there and the text
+# inserted instead, so undoing a keystroke in a 100 MB note costs a few dozen
+# bytes instead of a snapshot. Typing runs (and Backspace/Delete runs) are
+# merged into one step. Once the history outgrows its memory limit, the oldest
+# steps are dropped first.
+#
+# Positions and lengths are in the editor's own units: UTF-16 code units for the
+# plain view (see to_utf16_units), characters in stealth mode.
+
+DEFAULT_LIMIT = 64 * 1024 * 1024
+
+# Rough size of a step besides its text
+STEP_OVERHEAD = 120
+
+# Keystrokes further apart than this start a new step
+COALESCE_SECONDS = 2.0
+# Longest typing run merged into one step
+MAX_RUN = 4096
+
+_ASTRAL = re.compile("[\U00010000-\U0010FFFF]")
+_SURROGATE = re.compile("[\ud800-\udfff]")
+
+
+def to_utf16_units(text):
+    """Splits characters outside the BMP into surrogate pairs, so len() counts UTF-16 units like Qt."""
+    if not _ASTRAL.search(text):
+        return text
+    return _ASTRAL.sub(lambda m: _surrogates(ord(m.group()) - 0x10000), text)
+
+
+def _surrogates(code):
+    return chr(0xD800 + (code >> 10)) + chr(0xDC00 + (code & 0x3FF))
+
+
+def from_utf16_units(text):
+    """Reverses to_utf16_units."""
+    if not _SURROGATE.search(text):
+        return text
+    return text.encode('utf-16-le', 'surrogatepass').decode('utf-16-le')
+
+
+class UndoStep:
+    __slots__ = ("pos", "removed", "inserted", "time")
+
+    def __init__(self, pos, removed, inserted):
+        self.pos = pos
+        self.removed = removed
+        self.inserted = inserted
+        self.time = time.monotonic()
+
+    def size(self):
+        return STEP_OVERHEAD + len(self.removed) + len(self.inserted)
+
+
+class UndoLog:
+    """Bounded undo and redo stacks of UndoSteps for one editor."""
+
+    def __init__(self, limit=DEFAULT_LIMIT):
+        self.limit = limit
+        self.undo_steps = deque()
+        self.redo_steps = []
+        self.size = 0 # Rough bytes held by both stacks
+        self._can_merge = False
+
+    def __len__(self):
+        return len(self.undo_steps)
+
+    def set_limit(self, limit):
+        self.limit = limit
+        self._evict()
+
+    def clear(self):
+        self.undo_steps.clear()
+        self.redo_steps.clear()
+        self.size = 0
+        self._can_merge = False
+
+    def record(self, pos, removed, inserted):
+        """Adds an edit: removed was replaced by inserted at pos. Clears the redo stack."""
+        if not removed and not inserted:
+            return
+        for step in self.redo_steps:
+            self.size -= step.size()
+        self.redo_steps.clear()
+
+        last = self.undo_steps[-1] if self.undo_steps and self._can_merge else None
+        if last is not None and time.monotonic() - last.time < COALESCE_SECONDS:
+            before = last.size()
+            if self._merge(last, pos, removed, inserted):
+                last.time = time.monotonic()
+                self.size += last.size() - before
+                self._evict()
+                return
+        step = UndoStep(pos, removed, inserted)
+        self.undo_steps.append(step)
+        self.size += step.size()
+        self._can_merge = True
+        self._evict()
+
+    def _merge(self, last, pos, removed, inserted):
+        if not removed and not last.removed:
+            # Typing run: continues right after the last insertion
+            if "\n" in inserted or len(last.inserted) >= MAX_RUN or pos != last.pos + len(last.inserted):
+                return False
+            last.inserted += inserted
+            return True
+        if not inserted and not last.inserted:
+            if "\n" in removed or len(last.removed) >= MAX_RUN:
+                return False
+            if pos + len(removed) == last.pos:
+                # Backspace run
+                last.pos = pos
+                last.removed = removed + last.removed
+                return True
+            if pos == last.pos:
+                # Delete run
+                last.removed += removed
+                return True
+        return False
+
+    def undo(self):
+        """Takes the last step off the undo stack, or returns None. The caller reverts it."""
+        if not self.undo_steps:
+            return None
+        step = self.undo_steps.pop()
+        self.redo_steps.append(step)
+        self._can_merge = False
+        return step
+
+    def redo(self):
+        """Takes the last undone step back, or returns None. The caller applies it again."""
+        if not self.redo_steps:
+            return None
+        step = self.redo_steps.pop()
+        self.undo_steps.append(step)
+        self._can_merge = False
+        return step
+
+    def _evict(self):
+        while self.size > self.limit and self.undo_steps:
+            self.size -= self.undo_steps.popleft().size()
+        if self.size > self.limit:
+            self.redo_steps.clear()
+            self.size = 0
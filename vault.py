@@ -0,0 +1,113 @@
+import os
+import hmac
+import struct
+from crypto_handler import AESGCM, KdfParams
+from file_io import atomic_write
+
+# Vault mode: envelope encryption for the .aetxt files of one folder (<folder>/.aetxt-vault).
+#
+#   header: MAGIC | version | vault id(16) | salt(16) | kdf_len(B) | kdf
+#   body:   nonce(12) | AES-GCM(master key), AAD = header
+#
+# The password only unlocks the vault's random 32-byte master key, through the
+# configured KDF, once per session. Every file saved into the vault gets its own
+# random data key, stored in the file's header wrapped by the master key
+# (crypto_handler.TAG_VAULT_KEY), so opening a file costs one AES-GCM over 32
+# bytes instead of a KDF run. Changing the password rewraps the master key in
+# this file alone; no note is rewritten.
+
+VAULT_NAME = ".aetxt-vault"
+VAULT_MAGIC = b"AEVT"
+VAULT_VERSION = 1
+KEY_SIZE = 32
+ID_SIZE = 16
+
+_HEADER = struct.Struct(">4sB16s16sB")
+_NONCE_SIZE = 12
+
+
+def vault_path(folder):
+    return os.path.join(folder, VAULT_NAME)
+
+
+class Vault:
+    """
+    The vault of one folder. While unlocked it holds the master key and the
+    password it was unlocked with; hand it to CryptoHandler.add_vault.
+    """
+
+    def __init__(self, folder):
+        self.folder = os.path.abspath(folder)
+        self.path = vault_path(self.folder)
+        self.vault_id = None
+        self.password = None
+        self._master = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def is_unlocked(self):
+        return self._master is not None
+
+    def create(self, crypto, password):
+        """Starts a new vault for the folder (replacing any existing one)."""
+        self.vault_id = os.urandom(ID_SIZE)
+        self._master = os.urandom(KEY_SIZE)
+        self._write(crypto, password)
+
+    def unlock(self, crypto, password):
+        """Reads the master key. Wrong passwords raise ValueError."""
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        if len(data) < _HEADER.size:
+            raise ValueError("Vault file corrupted")
+        magic, version, vault_id, salt, kdf_len = _HEADER.unpack(data[:_HEADER.size])
+        if magic != VAULT_MAGIC or version != VAULT_VERSION:
+            raise ValueError("Not an AeTxt vault")
+        header = data[:_HEADER.size + kdf_len]
+        kdf = KdfParams.decode(header[_HEADER.size:])
+        # Not through the key cache: the vault is unlocked once and its password key is not needed again
+        password_key, _ = crypto.derive_key(password, salt, kdf, cache=False)
+        nonce = data[len(header):len(header) + _NONCE_SIZE]
+        try:
+            master = AESGCM(password_key).decrypt(nonce, data[len(header) + _NONCE_SIZE:], header)
+        except Exception:
+            raise ValueError("Incorrect vault password, or the vault file is corrupted")
+        self.vault_id = vault_id
+        self.password = password
+        self._master = master
+
+    def change_password(self, crypto, password):
+        """Rewraps the master key for password. The vault must be unlocked."""
+        if not self.is_unlocked():
+            raise ValueError("The vault is locked")
+        self._write(crypto, password)
+
+    def _write(self, crypto, password):
+        salt = os.urandom(crypto.salt_size)
+        kdf = crypto.default_kdf()
+        encoded = kdf.encode()
+        header = _HEADER.pack(VAULT_MAGIC, VAULT_VERSION, self.vault_id, salt, len(encoded)) + encoded
+        password_key, _ = crypto.derive_key(password, salt, kdf, cache=False)
+        nonce = os.urandom(_NONCE_SIZE)
+        atomic_write(self.path, [header, nonce, AESGCM(password_key).encrypt(nonce, self._master, header)])
+        self.password = password
+
+    def accepts(self, password):
+        return self.password is not None and hmac.compare_digest(password.encode('utf-8'),
+                                                                 self.password.encode('utf-8'))
+
+    def wrap(self, key, salt):
+        """Returns the TAG_VAULT_KEY value for a file's data key (bound to the file's salt)."""
+        nonce = os.urandom(_NONCE_SIZE)
+        return self.vault_id + nonce + AESGCM(self._master).encrypt(nonce, key, self.vault_id + bytes(salt))
+
+    def unwrap(self, wrapped, salt):
+        """Reverses wrap. Raises ValueError if the key was not wrapped by this vault for salt."""
+        if wrapped[:ID_SIZE] != self.vault_id or not self.is_unlocked():
+            raise ValueError("The file belongs to another vault")
+        nonce = wrapped[ID_SIZE:ID_SIZE + _NONCE_SIZE]
+        try:
+            return AESGCM(self._master).decrypt(nonce, wrapped[ID_SIZE + _NONCE_SIZE:], self.vault_id + bytes(salt))
+        except Exception:
+            raise ValueError("File corrupted: invalid vault key")